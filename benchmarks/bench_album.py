@@ -0,0 +1,94 @@
+# 相册定时消息基准：N 张图的定时消息，每次触发（删除上一组 + 发送 + 置顶）的 API 调用次数和耗时。
+# 对比 逐张发送、逐条删除 与 一次 sendMediaGroup + 一次 deleteMessages。
+# 用假 bot 模拟每次 API 调用的往返延迟，不需要数据库和网络。
+# 用法: python benchmarks/bench_album.py [图片数] [往返毫秒] [触发次数]
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from handlers import schedule
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+class FakeBot:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.calls = 0
+        self.next_id = 0
+
+    async def _call(self, count=1):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        self.next_id += count
+        return [FakeMessage(self.next_id - i) for i in reversed(range(count))]
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return (await self._call())[0]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return (await self._call())[0]
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        return tuple(await self._call(len(media)))
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        await self._call(0)
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call(0)
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        await self._call(0)
+
+def row(items):
+    return {
+        "id": 1, "chat_id": -100, "enabled": True, "text": "今日推荐", "button": None, "period": None,
+        "start_date": None, "end_date": None, "interval": 5, "del_prev": True, "pin": True,
+        "media": items[0][1], "media_type": items[0][0], "media_items": json.dumps(items),
+    }
+
+async def fire_separately(bot, plan, items, last_ids):
+    # 原来只能一张一条：每张单独发，上一组逐条删
+    for message_id in last_ids:
+        await bot.delete_message(plan.chat_id, message_id)
+    ids = []
+    for _, file_id in items:
+        ids.append((await bot.send_photo(plan.chat_id, file_id, caption=plan.text if not ids else None)).message_id)
+    await bot.pin_chat_message(plan.chat_id, ids[0])
+    return ids
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rtt = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.08
+    fires = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    items = [("photo", f"f{i}") for i in range(n)]
+    plan = schedule.compile_plan(row(items))
+
+    async def get_plan(chat_id, sid):
+        return plan
+    schedule.get_plan = get_plan
+
+    bot = FakeBot(rtt)
+    last_ids = []
+    started = time.perf_counter()
+    for _ in range(fires):
+        last_ids = await fire_separately(bot, plan, items, last_ids)
+    separate = (time.perf_counter() - started) / fires, bot.calls / fires
+
+    bot = FakeBot(rtt)
+    started = time.perf_counter()
+    for _ in range(fires):
+        await schedule.send_cron_message(plan.chat_id, plan.sid, bot)
+    album = (time.perf_counter() - started) / fires, bot.calls / fires
+
+    print(f"{n} 张图，往返 {rtt * 1000:.0f} ms，{fires} 次触发（删除上一组 + 发送 + 置顶）")
+    print(f"逐张发送/逐条删除   每次 {separate[1]:4.0f} 次调用 {separate[0] * 1000:7.0f} ms")
+    print(f"相册 + 批量删除     每次 {album[1]:4.0f} 次调用 {album[0] * 1000:7.0f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
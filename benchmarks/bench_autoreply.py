@@ -0,0 +1,74 @@
+# 自动回复匹配基准：10k 条规则下，关键词自动机 vs 逐条 `in` 扫描
+# 用法: python benchmarks/bench_autoreply.py [规则数] [消息数]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from matcher import KeywordMatcher
+
+CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严龙飞"
+
+def rand_word(rng, lo, hi):
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(lo, hi)))
+
+def main():
+    n_rules = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_msgs = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    rng = random.Random(42)
+    rules = {}
+    while len(rules) < n_rules:
+        rules[rand_word(rng, 3, 6)] = rand_word(rng, 5, 10)
+    keywords = list(rules)
+    msgs = []
+    for i in range(n_msgs):
+        text = rand_word(rng, 20, 60)
+        # 约 5% 的消息带一个关键词，其余是普通聊天
+        if i % 20 == 0:
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + rng.choice(keywords) + text[pos:]
+        msgs.append(text)
+
+    t0 = time.perf_counter()
+    m = KeywordMatcher()
+    for k, v in rules.items():
+        m.add(k, v)
+    m.search("")  # 触发构建
+    m.search("x")
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    hits = sum(1 for text in msgs if m.search(text))
+    t_ac = time.perf_counter() - t0
+
+    rows = list(rules.items())
+    t0 = time.perf_counter()
+    naive_hits = 0
+    for text in msgs:
+        for k, v in rows:
+            if k in text:
+                naive_hits += 1
+                break
+    t_naive = time.perf_counter() - t0
+
+    # 构建之后逐条增删规则（每次之后都匹配一条消息），看单次更新的代价
+    extras = [rand_word(rng, 3, 6) for _ in range(100)]
+    t0 = time.perf_counter()
+    for k in extras:
+        m.add(k, "x")
+        m.search(msgs[0])
+    t_add = (time.perf_counter() - t0) / len(extras)
+    t0 = time.perf_counter()
+    for k in extras:
+        m.remove(k)
+        m.search(msgs[0])
+    t_remove = (time.perf_counter() - t0) / len(extras)
+
+    print(f"规则数: {n_rules}  消息数: {n_msgs}")
+    print(f"自动机构建: {t_build * 1000:.1f} ms  新增一条: {t_add * 1000:.3f} ms  删除一条: {t_remove * 1000:.3f} ms")
+    print(f"自动机匹配: {t_ac * 1e6 / n_msgs:.1f} us/条  命中 {hits}")
+    print(f"逐条扫描:   {t_naive * 1e6 / n_msgs:.1f} us/条  命中 {naive_hits}")
+
+if __name__ == "__main__":
+    main()
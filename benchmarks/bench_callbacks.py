@@ -0,0 +1,97 @@
+# 按钮回调分发基准：原来的 CallbackQueryHandler 正则链 + split 解析 vs 单个处理器 + 前缀树路由
+# 只测"找到处理函数并解析出参数"的开销，不执行处理函数
+# 用法: python benchmarks/bench_callbacks.py [回调数]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+from callbacks import CallbackRouter
+
+def noop(update, context):
+    pass
+
+# 改造前各模块注册的回调处理器，顺序与 handlers.register 一致（含 7 个编辑会话的入口）
+OLD_PATTERNS = [
+    "^main_menu_[12]$", "^menu_checkin$", "^ck_", "^mem_[np]_", "^ar_[np]_",
+    "^menu_schedule$", "^schedule_detail_\\d+$", "^schedule_create$", "^schedule_delete_\\d+$",
+    "^schedule_(enable|disable|delprev_yes|delprev_no|pin_yes|pin_no)_\\d+$",
+    "^schedule_edit_text_\\d+$", "^schedule_edit_media_\\d+$", "^schedule_edit_button_\\d+$",
+    "^schedule_edit_interval_\\d+$", "^schedule_edit_period_\\d+$", "^schedule_edit_start_\\d+$",
+    "^schedule_edit_end_\\d+$",
+]
+
+def old_parse(data):
+    # 原处理函数里的解析方式
+    parts = data.split('_')
+    return '_'.join(parts[:-1]), int(parts[-1]) if parts[-1].isdigit() else parts[-1]
+
+def make_router():
+    router = CallbackRouter()
+    router.add("main_menu", noop)
+    router.add("menu_checkin", noop)
+    router.add("ck", noop, str, int)
+    router.add("mem_n", noop, str, int)
+    router.add("mem_p", noop, str, int)
+    router.add("ar_n", noop, str)
+    router.add("ar_p", noop, str)
+    router.add("menu_schedule", noop)
+    router.add("schedule_detail", noop, int)
+    router.add("schedule_create", noop)
+    router.add("schedule_delete", noop, int)
+    for action in ("enable", "disable", "delprev_yes", "delprev_no", "pin_yes", "pin_no"):
+        router.add(f"schedule_{action}", noop, int)
+    router.add("schedule_edit", noop, str, int)
+    return router
+
+def sample_data(rng, n):
+    # 偏向定时消息编辑页的按钮，与实际点击分布接近
+    choices = [
+        lambda: f"schedule_detail_{rng.randint(1, 999)}",
+        lambda: f"schedule_{rng.choice(['enable', 'disable', 'delprev_yes', 'pin_no'])}_{rng.randint(1, 999)}",
+        lambda: f"schedule_edit_{rng.choice(['text', 'media', 'period', 'end'])}_{rng.randint(1, 999)}",
+        lambda: "menu_schedule",
+        lambda: f"main_menu_{rng.randint(1, 2)}",
+        lambda: f"mem_n_2026-01-0{rng.randint(1, 9)}_{rng.randint(1, 10**9)}",
+        lambda: f"ar_p_关键词{rng.randint(1, 999)}",
+    ]
+    return [rng.choice(choices)() for _ in range(n)]
+
+def make_update(data, i):
+    query = CallbackQuery(str(i), User(1, "u", False), "ci", data=data)
+    return Update(i, callback_query=query)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(7)
+    updates = [make_update(d, i) for i, d in enumerate(sample_data(rng, n))]
+
+    old_chain = [CallbackQueryHandler(noop, pattern=p) for p in OLD_PATTERNS]
+    started = time.perf_counter()
+    hits = 0
+    for u in updates:
+        for h in old_chain:
+            if h.check_update(u):
+                old_parse(u.callback_query.data)
+                hits += 1
+                break
+    old_time = time.perf_counter() - started
+
+    router = make_router()
+    single = CallbackQueryHandler(noop)
+    started = time.perf_counter()
+    routed = 0
+    for u in updates:
+        if single.check_update(u) and router.match(u.callback_query.data) is not None:
+            routed += 1
+    new_time = time.perf_counter() - started
+
+    print(f"回调数 {n}，命中 {hits} / {routed}")
+    print(f"正则处理器链   {old_time * 1e6 / n:6.2f} µs/次")
+    print(f"单处理器+路由  {new_time * 1e6 / n:6.2f} µs/次  ({old_time / new_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
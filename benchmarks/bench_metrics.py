@@ -0,0 +1,84 @@
+# 指标埋点的开销：单次 observe、处理器包装，以及抓取 /metrics 时生成文本的耗时。
+# 另测 asyncpg 查询日志回调作为对照（需要 DATABASE_URL 指向可连接的库，连不上时跳过）。
+# 用法: python benchmarks/bench_metrics.py [次数]
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import asyncpg
+import metrics
+from utils import PG_URL
+
+BUDGET_US = 10.0  # 处理一条更新的埋点总开销预算
+
+async def noop(update, context):
+    return None
+
+async def per_call(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        await fn(None, None)
+    return (time.perf_counter() - started) / n * 1e6
+
+async def logger_overhead(n):
+    # 对照：asyncpg 的查询日志回调（tracing 打开时才挂）每条查询的额外开销
+    try:
+        conn = await asyncpg.connect(PG_URL)
+    except Exception as e:
+        print(f"连不上数据库，跳过查询日志对照：{e}")
+        return None
+    try:
+        async def run():
+            started = time.perf_counter()
+            for _ in range(n):
+                await conn.fetchval("SELECT 1")
+            return (time.perf_counter() - started) / n * 1e6
+        await run()
+        plain = min([await run() for _ in range(3)])
+        conn.add_query_logger(lambda record: None)
+        logged = min([await run() for _ in range(3)])
+    finally:
+        await conn.close()
+    return plain, logged
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    hist = metrics.Histogram("bench_seconds", "bench", ("name",))
+    started = time.perf_counter()
+    for i in range(n):
+        hist.observe(0.0123, "handler")
+    observe_us = (time.perf_counter() - started) / n * 1e6
+
+    wrapped = metrics.timed(noop, "bench.noop")
+    await per_call(noop, n)
+    raw = min([await per_call(noop, n) for _ in range(3)])
+    timed = min([await per_call(wrapped, n) for _ in range(3)])
+    wrap_us = timed - raw
+
+    q = await logger_overhead(n // 40)
+
+    # 每条更新：一个处理器 + 3 条热点查询（取连接等待 + 执行耗时）+ 一次 API 调用（耗时 + 排队）
+    per_update = wrap_us + 3 * 2 * observe_us + 2 * observe_us
+
+    # 抓取：约 40 个处理器、60 条语句、20 个 API 方法的直方图
+    for i in range(40):
+        metrics.HANDLER_SECONDS.observe(0.01, f"h{i}")
+    for i in range(60):
+        metrics.DB_QUERY_SECONDS.observe(0.001, f"q{i}")
+    for i in range(20):
+        metrics.TG_API_SECONDS.observe(0.1, f"m{i}")
+    started = time.perf_counter()
+    body = metrics.render()
+    render_ms = (time.perf_counter() - started) * 1000
+
+    print(f"Histogram.observe            {observe_us:6.2f} µs")
+    print(f"处理器包装（timed）           {wrap_us:6.2f} µs（裸调用 {raw:.2f} µs）")
+    print(f"每条更新合计                  {per_update:6.2f} µs，预算 {BUDGET_US} µs：{'OK' if per_update < BUDGET_US else '超出'}")
+    print(f"/metrics 生成 {len(body.splitlines())} 行      {render_ms:6.2f} ms")
+    if q:
+        print(f"对照：asyncpg 查询日志回调    {q[1] - q[0]:6.2f} µs/条（SELECT 1 {q[0]:.1f} -> {q[1]:.1f} µs），未用于常开指标")
+
+if __name__ == "__main__":
+    asyncio.run(main())
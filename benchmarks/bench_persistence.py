@@ -0,0 +1,90 @@
+# 持久化基准：库里 10 万个用户的 user_data，每轮只有少量用户的数据变了
+# 对比 PostgresPersistence 一轮批量写入 与 PicklePersistence 每轮整份重写文件 的耗时。
+# 需要 DATABASE_URL 指向已迁移的库；测试数据用负数 user_id，结束后删除。
+# 用法: python benchmarks/bench_persistence.py [用户数] [每轮变更数] [轮数]
+import asyncio
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from telegram.ext import PersistenceInput, PicklePersistence
+from persistence import PostgresPersistence
+from utils import close_db, get_db
+
+def user_data(rng):
+    # 与实际差不多大小：编辑状态 + 几个小字段
+    return {"schedule_edit": {-100123: ("text", rng.randint(1, 999))}, "lang": "zh", "seen": rng.randint(0, 10**6)}
+
+async def run_postgres(ids, rng, changed, rounds):
+    p = PostgresPersistence()
+    data = {}
+    for uid in ids:
+        data[uid] = {}
+        await p.refresh_user_data(uid, data[uid])
+    timings = []
+    for _ in range(rounds):
+        touched = rng.sample(ids, changed * 2)
+        for uid in touched[:changed]:
+            data[uid]["seen"] = rng.randint(0, 10**6)
+        started = time.perf_counter()
+        # 与 Application 一样：被访问过的 id 并发调用 update_user_data（其中一半没变）
+        await asyncio.gather(*(p.update_user_data(uid, data[uid]) for uid in touched))
+        timings.append(time.perf_counter() - started)
+    return timings, p.stats()
+
+async def run_absent(n):
+    # 首次访问库里没有数据的用户（绝大多数新用户只是发了条普通消息）：除第一次读 id 集合外不读库
+    p = PostgresPersistence()
+    await p.refresh_user_data(-(10**9), {})
+    started = time.perf_counter()
+    for uid in range(-(10**9) - n, -(10**9)):
+        await p.refresh_user_data(uid, {})
+    return time.perf_counter() - started, p.stats()
+
+async def run_pickle(ids, rng, changed, rounds, path):
+    p = PicklePersistence(path, store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+                          on_flush=True)
+    p.user_data = {uid: user_data(rng) for uid in ids}
+    p.conversations = {}
+    timings = []
+    for _ in range(rounds):
+        for uid in rng.sample(ids, changed):
+            await p.update_user_data(uid, {**p.user_data[uid], "seen": rng.randint(0, 10**6)})
+        started = time.perf_counter()
+        await p.flush()  # 单文件模式下无论改了多少都整份重写
+        timings.append(time.perf_counter() - started)
+    return timings, os.path.getsize(path)
+
+async def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    changed = int(sys.argv[2]) if len(sys.argv) > 2 else n_users // 100
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    rng = random.Random(11)
+    ids = [-(i + 1) for i in range(n_users)]
+    pool = await get_db()
+    await pool.executemany(
+        "INSERT INTO bot_user_data(user_id, data) VALUES($1, $2) ON CONFLICT (user_id) DO NOTHING",
+        [(uid, pickle.dumps(user_data(rng))) for uid in ids]
+    )
+    try:
+        started = time.perf_counter()
+        pg, stats = await run_postgres(ids, rng, changed, rounds)
+        print(f"懒加载 {n_users} 个用户（每个首次访问读一行）并写 {rounds} 轮: {time.perf_counter() - started:.1f}s")
+        absent, absent_stats = await run_absent(n_users)
+        with tempfile.TemporaryDirectory() as tmp:
+            pk, size = await run_pickle(ids, rng, changed, rounds, os.path.join(tmp, "bot.pickle"))
+    finally:
+        await pool.execute("DELETE FROM bot_user_data WHERE user_id < 0")
+        await close_db()
+    print(f"用户数 {n_users}，每轮变更 {changed}（另有同样多访问过但没变的），{rounds} 轮")
+    print(f"PostgresPersistence 每轮 {sum(pg) / rounds * 1000:7.1f} ms  {stats}")
+    print(f"PicklePersistence   每轮 {sum(pk) / rounds * 1000:7.1f} ms  文件 {size / 1e6:.1f} MB")
+    print(f"首次访问库里没有数据的用户 {n_users} 个：{absent * 1e6 / n_users:.2f} µs/个，"
+          f"读库 {absent_stats['user_loads']} 次，跳过 {absent_stats['user_absent']} 次")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# 定时消息调度基准：N 条定时消息时的启动加载耗时，以及修改一条后
+# 只调整这一条（reconcile）与原来清空后全部重新加载 的耗时对比。
+# 需要 DATABASE_URL 指向已迁移的库；测试数据用 chat_id=-777xxx，结束后删除。
+# 用法: python benchmarks/bench_schedule_reconcile.py [定时条数,...] [修改次数]
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from handlers import schedule
+from leader import leader
+from utils import close_db, get_db
+
+CHAT_BASE = -777000
+
+async def seed(db, n, rng):
+    now = datetime.now()
+    rows = []
+    for i in range(n):
+        nxt = now + timedelta(minutes=rng.randint(-30, 120))
+        period = rng.choice([None, "08:00-12:00", "09:00-11:00,14:00-18:00"])
+        rows.append((CHAT_BASE - i % 500, f"定时{i}", rng.choice([5, 10, 30, 60]), period, nxt))
+    await db.copy_records_to_table(
+        "scheduled_message", records=[(c, t, iv, p, True, nx) for c, t, iv, p, nx in rows],
+        columns=["chat_id", "text", "interval", "period", "enabled", "next_run_at"],
+    )
+    # 另有同样多已过有效期的，启动时不应加载
+    await db.copy_records_to_table(
+        "scheduled_message",
+        records=[(CHAT_BASE - i % 500, "过期", 60, True, now - timedelta(days=3)) for i in range(n)],
+        columns=["chat_id", "text", "interval", "enabled", "last_run_at"],
+    )
+    return [r["id"] for r in await db.fetch(
+        "SELECT id FROM scheduled_message WHERE chat_id <= $1 AND chat_id > $2 AND next_run_at IS NOT NULL",
+        CHAT_BASE, CHAT_BASE - 1000)]
+
+def reset():
+    schedule.dispatcher.clear()
+    schedule._scheduled.clear()
+    schedule._plans.clear()
+
+async def run(db, n, edits, rng):
+    await db.execute("DELETE FROM scheduled_message WHERE chat_id <= $1 AND chat_id > $2", CHAT_BASE, CHAT_BASE - 1000)
+    ids = await seed(db, n, rng)
+    reset()
+    started = time.perf_counter()
+    loaded = await schedule.load_schedules(leader.owned)
+    load_time = time.perf_counter() - started
+
+    sample = rng.sample(ids, edits)
+    started = time.perf_counter()
+    for sid in sample:
+        await db.execute("UPDATE scheduled_message SET text=text || '!' WHERE id=$1", sid)
+        await schedule.reconcile(sid)
+    diff_time = (time.perf_counter() - started) / edits
+
+    full_edits = min(edits, 5)
+    started = time.perf_counter()
+    for sid in sample[:full_edits]:
+        await db.execute("UPDATE scheduled_message SET text=text || '!' WHERE id=$1", sid)
+        reset()  # 原来的做法：清空后把所有开启的定时重新加载一遍
+        await schedule.load_schedules(leader.owned)
+    full_time = (time.perf_counter() - started) / full_edits
+    return loaded, load_time, diff_time, full_time
+
+async def main():
+    sizes = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 50000]
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    schedule.SCHEDULE_MISSED = "skip"  # 没有 bot，不补发
+    leader.owned = {0}                 # 单实例：持有唯一的分片
+    rng = random.Random(5)
+    db = await get_db()
+    results = []
+    try:
+        for n in sizes:
+            results.append((n, *await run(db, n, edits, rng)))
+    finally:
+        await db.execute("DELETE FROM scheduled_message WHERE chat_id <= $1 AND chat_id > $2", CHAT_BASE, CHAT_BASE - 1000)
+        await close_db()
+    print(f"{'开启的定时':>10} {'加载条数':>8} {'启动加载':>10} {'修改一条(reconcile)':>20} {'修改一条(全部重载)':>18}")
+    for n, loaded, load_time, diff_time, full_time in results:
+        print(f"{n:>10} {loaded:>8} {load_time * 1000:>8.0f}ms {diff_time * 1000:>18.2f}ms {full_time * 1000:>16.0f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
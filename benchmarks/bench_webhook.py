@@ -0,0 +1,165 @@
+# polling 与 webhook 两种模式的处理延迟压测，使用本地假 Telegram 服务，不连外网、不连数据库。
+# 延迟 = 更新交给 Telegram（假服务入队 / POST 到 webhook）到处理器开始执行的时间。
+# 用法: python benchmarks/bench_webhook.py [更新数] [群数] [处理耗时ms]
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from telegram.ext import Application, MessageHandler, filters
+from updates import ChatOrderedUpdateProcessor
+
+TOKEN = "123456:TEST"
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+SECRET = "bench_secret"
+
+class FakeTelegram:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.updates = []
+        self.next_id = 1
+
+    def push(self, update):
+        with self.cond:
+            update["update_id"] = self.next_id
+            self.next_id += 1
+            self.updates.append(update)
+            self.cond.notify_all()
+
+    def get_updates(self, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                pending = [u for u in self.updates if u["update_id"] >= offset]
+                self.updates = pending
+                if pending or time.monotonic() >= deadline:
+                    return pending[:100]
+                self.cond.wait(deadline - time.monotonic())
+
+fake = FakeTelegram()
+
+class ApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(raw) if raw else {}
+        else:
+            params = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+                      "can_join_groups": True, "can_read_all_group_messages": True,
+                      "supports_inline_queries": False}
+        elif method == "getUpdates":
+            result = fake.get_updates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        elif method in ("setWebhook", "deleteWebhook", "close", "logOut"):
+            result = True
+        else:
+            result = True
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_update(chat_id, seq):
+    return {
+        "message": {
+            "message_id": seq,
+            "date": int(time.time()),
+            "chat": {"id": -1000000000 - chat_id, "type": "supergroup", "title": f"g{chat_id}"},
+            "from": {"id": 1000 + seq, "is_bot": False, "first_name": "u"},
+            "text": repr(time.perf_counter()),
+        }
+    }
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+async def run_mode(mode, n_updates, n_chats, handler_ms):
+    latencies = []
+    done = asyncio.Event()
+    order_errors = 0
+    last_seen = {}
+
+    async def on_message(update, context):
+        nonlocal order_errors
+        latencies.append(time.perf_counter() - float(update.message.text))
+        chat_id = update.effective_chat.id
+        if last_seen.get(chat_id, 0) > update.message.message_id:
+            order_errors += 1
+        last_seen[chat_id] = update.message.message_id
+        await asyncio.sleep(handler_ms / 1000)
+        if len(latencies) >= n_updates:
+            done.set()
+
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{API_PORT}/bot")
+        .concurrent_updates(ChatOrderedUpdateProcessor(64))
+        .build()
+    )
+    app.add_handler(MessageHandler(filters.TEXT, on_message))
+    await app.initialize()
+    if mode == "polling":
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+    else:
+        await app.updater.start_webhook(listen="127.0.0.1", port=WEBHOOK_PORT,
+                                        url_path="telegram", secret_token=SECRET)
+    await app.start()
+
+    def inject():
+        for i in range(n_updates):
+            update = make_update(i % n_chats, i + 1)
+            if mode == "polling":
+                fake.push(update)
+            else:
+                update["update_id"] = i + 1
+                update["message"]["text"] = repr(time.perf_counter())
+                req = urllib.request.Request(
+                    f"http://127.0.0.1:{WEBHOOK_PORT}/telegram",
+                    data=json.dumps(update).encode(),
+                    headers={"Content-Type": "application/json",
+                             "X-Telegram-Bot-Api-Secret-Token": SECRET},
+                )
+                urllib.request.urlopen(req).read()
+            time.sleep(0.001)
+
+    started = time.perf_counter()
+    await asyncio.gather(asyncio.to_thread(inject), asyncio.wait_for(done.wait(), 120))
+    elapsed = time.perf_counter() - started
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    return latencies, elapsed, order_errors
+
+def main():
+    n_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_chats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    handler_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    server = ThreadingHTTPServer(("127.0.0.1", API_PORT), ApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"更新数 {n_updates}，群数 {n_chats}，处理耗时 {handler_ms}ms")
+    for mode in ("polling", "webhook"):
+        latencies, elapsed, order_errors = asyncio.run(run_mode(mode, n_updates, n_chats, handler_ms))
+        print(f"{mode:8s} p50 {percentile(latencies, 0.5) * 1000:.1f}ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms  "
+              f"总耗时 {elapsed:.2f}s  群内乱序 {order_errors}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
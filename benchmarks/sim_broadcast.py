@@ -0,0 +1,105 @@
+# 群发模拟：对着本地 PostgreSQL 向 N 个假群群发，假 bot 模拟往返延迟、Telegram 的全局限速
+# （超过每秒上限时抛 RetryAfter）和一部分已把机器人踢出的群。
+# 中途模拟进程崩溃（直接取消任务），再由"新进程"从检查点继续，统计重复发送和漏发。
+# 需要 DATABASE_URL 指向已迁移的库；测试数据用 chat_id=-888xxxxx，结束后删除。
+# 用法: python benchmarks/sim_broadcast.py [群数] [往返毫秒] [每秒上限]
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from telegram.error import Forbidden, RetryAfter
+import broadcast
+from broadcast import Broadcaster
+from leader import leader
+from utils import close_db, get_db
+
+CHAT_BASE = -88800000
+ADMIN = 1
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id):
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+class FakeBot:
+    def __init__(self, rtt, rate, kicked):
+        self.rtt = rtt
+        self.rate = rate
+        self.kicked = kicked
+        self.delivered = Counter()
+        self.calls = 0
+        self.retry_after = 0
+        self.edits = 0
+        self._window = deque()
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        now = time.monotonic()
+        while self._window and self._window[0] < now - 1:
+            self._window.popleft()
+        if len(self._window) >= self.rate:
+            self.retry_after += 1
+            raise RetryAfter(1)
+        self._window.append(now)
+        if chat_id in self.kicked:
+            raise Forbidden("Forbidden: bot was kicked from the group chat")
+        self.delivered[chat_id] += 1
+        return FakeMessage(chat_id, self.delivered.total())
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edits += 1
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    rtt = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    rate = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    broadcast.BROADCAST_RETRY_DELAY = 1
+    rng = random.Random(3)
+    chats = [CHAT_BASE - i for i in range(n)]
+    kicked = set(rng.sample(chats, n // 50))
+    bot = FakeBot(rtt, rate, kicked)
+    leader.owned = {0}  # 单实例：本进程负责群发
+    db = await get_db()
+    await db.executemany("INSERT INTO bot_groups(chat_id, title) VALUES($1, $2) ON CONFLICT DO NOTHING",
+                         [(c, f"模拟群{i}") for i, c in enumerate(chats)])
+    try:
+        first = Broadcaster()
+        first.start(bot)
+        started = time.perf_counter()
+        row = await first.create(ADMIN, ADMIN, 1, filter_text="模拟群", progress_chat_id=ADMIN, progress_msg_id=1)
+        bid = row["id"]
+        await asyncio.sleep(n / rate / 3)
+        run = first.runs[bid]
+        crash_at = (run.sent, run.failed, run.limit)
+        await first.stop()  # 相当于进程被杀：在途请求结束，已攒的结果写回后退出
+        print(f"崩溃前：成功 {crash_at[0]}，失败 {crash_at[1]}，并发 {crash_at[2]}")
+
+        second = Broadcaster()
+        second.start(bot)
+        await second.resume()
+        while second.runs:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        states = dict(await db.fetch(
+            "SELECT state, count(*) FROM broadcast_targets WHERE broadcast_id=$1 GROUP BY state", bid))
+        status = await db.fetchval("SELECT status FROM broadcasts WHERE id=$1", bid)
+        left = await db.fetchval("SELECT count(*) FROM bot_groups WHERE chat_id = ANY($1::bigint[])", list(kicked))
+    finally:
+        await db.execute("DELETE FROM broadcasts WHERE created_by=$1", ADMIN)
+        await db.execute("DELETE FROM bot_groups WHERE chat_id <= $1 AND chat_id > $2", CHAT_BASE, CHAT_BASE - n)
+        await close_db()
+    reachable = [c for c in chats if c not in kicked]
+    missing = sum(1 for c in reachable if not bot.delivered[c])
+    dup = sum(v - 1 for v in bot.delivered.values() if v > 1)
+    print(f"{n} 个群（{len(kicked)} 个已踢出机器人），往返 {rtt * 1000:.0f} ms，Telegram 每秒上限 {rate}")
+    print(f"状态 {status}，{states}，用时 {elapsed:.1f}s（{n / elapsed:.0f} 群/秒）")
+    print(f"API 调用 {bot.calls}，RetryAfter {bot.retry_after}，进度消息编辑 {bot.edits}")
+    print(f"漏发 {missing}，重复 {dup}，已踢出的群仍在 bot_groups：{left}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
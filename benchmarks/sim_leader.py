@@ -0,0 +1,103 @@
+# 多实例调度选主模拟：一个进程里跑几个 LeaderElector（各自独立的锁连接），对着本地 PostgreSQL
+# 依次模拟 启动抢锁 -> 正常退出交接 -> 进程崩溃 -> 新实例加入，记录每次分片易主的耗时，
+# 并检查任意时刻每个分片最多只有一个实例持有。
+# 用法: DATABASE_URL=... python benchmarks/sim_leader.py [实例数] [分片数]
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import asyncpg
+from leader import LEADER_CHANNEL, LeaderElector
+from utils import PG_URL
+
+RETRY = 1.0
+
+class Cluster:
+    def __init__(self, shards):
+        self.shards = shards
+        self.electors = {}
+        self.holder = {}      # 分片 -> 实例名
+        self.conflicts = 0
+        self.released_at = {}  # 分片 -> 失去的时刻
+
+    def spawn(self, name):
+        e = LeaderElector(shards=self.shards, retry=RETRY)
+        e.instance = name
+
+        async def on_change(gained, lost):
+            now = time.perf_counter()
+            for s in lost:
+                if self.holder.get(s) == name:
+                    del self.holder[s]
+                    self.released_at[s] = now
+            for s in gained:
+                if s in self.holder:
+                    self.conflicts += 1
+                    print(f"  !! 分片 {s} 同时被 {self.holder[s]} 和 {name} 持有")
+                self.holder[s] = name
+                if s in self.released_at:
+                    print(f"  分片 {s} -> {name}，空窗 {(now - self.released_at.pop(s)) * 1000:.0f} ms")
+        e.on_change(on_change)
+        e.start()
+        self.electors[name] = e
+        return e
+
+    async def crash(self, name):
+        # 不解锁、不通知：取消任务后直接断开连接，相当于进程被杀
+        e = self.electors.pop(name)
+        e._task.cancel()
+        e._notifier.cancel()
+        now = time.perf_counter()
+        for s in list(e.owned):
+            self.holder.pop(s, None)
+            self.released_at[s] = now
+        e._conn.remove_termination_listener(e._on_conn_lost)
+        e._conn.terminate()
+
+    async def settle(self, timeout=10):
+        # 等所有分片都有人持有，且各实例分到的分片数相差不超过 1
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            counts = [len(e.owned) for e in self.electors.values()]
+            if len(self.holder) == self.shards and max(counts) - min(counts) <= 1:
+                break
+            await asyncio.sleep(0.01)
+        return {n: sorted(e.owned) for n, e in self.electors.items()}
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    cluster = Cluster(shards)
+    # 各实例共用一条监听连接收 NOTIFY（实际部署中每个实例各有 utils.db_listener）
+    listener = await asyncpg.connect(PG_URL)
+    await listener.add_listener(LEADER_CHANNEL, lambda *a: [e.wake() for e in cluster.electors.values()])
+
+    print(f"{n} 个实例，{shards} 个分片，抢锁间隔 {RETRY}s")
+    for i in range(n):
+        cluster.spawn(f"bot{i}")
+    print("启动后:", await cluster.settle())
+
+    victim = max(cluster.electors, key=lambda n: len(cluster.electors[n].owned))
+    print(f"{victim} 正常退出（解锁 + NOTIFY）:")
+    e = cluster.electors.pop(victim)
+    await e.stop()
+    print("  ->", await cluster.settle())
+
+    victim = max(cluster.electors, key=lambda n: len(cluster.electors[n].owned))
+    print(f"{victim} 崩溃（连接直接断开）:")
+    await cluster.crash(victim)
+    print("  ->", await cluster.settle())
+
+    print("新实例 bot9 加入:")
+    cluster.spawn("bot9")
+    print("  ->", await cluster.settle())
+
+    for e in list(cluster.electors.values()):
+        await e.stop()
+    await listener.close()
+    print(f"冲突次数 {cluster.conflicts}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,108 @@
+import asyncio
 import os
+import signal
 from telegram.ext import Application
 from handlers import register as register_handlers
+from utils import get_db, close_db, start_db_listener, stop_db_listener
+from checkin_writer import checkin_writer
+from roster import roster
+from regions import regions
+from handlers.schedule import start_scheduler, stop_scheduler
+from handlers.autoreply import load_rules
+from sweeper import member_sweeper
+from broadcast import broadcaster
+from outbound import outbound
+from updates import ChatOrderedUpdateProcessor
+from migrate import migrate
+from persistence import PostgresPersistence
+from web import start_web
 
-TOKEN = os.getenv("TELEGRAM_TOKEN") or "YOUR_BOT_TOKEN"
+TOKEN = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN") or "YOUR_BOT_TOKEN"
 
-def main():
-    application = Application.builder().token(TOKEN).build()
+# 配置了 WEBHOOK_URL（公网地址，如 https://xxx.onrender.com）时默认用 webhook 模式
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+BOT_MODE = os.getenv("BOT_MODE") or ("webhook" if WEBHOOK_URL else "polling")
+PORT = int(os.getenv("PORT", "8443"))
+
+# 已完成的启动步骤对应的关闭函数：post_init 中途失败时 post_shutdown 仍会执行，
+# 只关闭真正启动过的部分，按启动的相反顺序
+_teardown = []
+
+async def on_startup(application):
+    _teardown.clear()
+    await migrate()
+    # 启动时建好连接池并预编译热点查询，第一条消息不再等待建连
+    await get_db()
+    _teardown.append(close_db)
+    await start_db_listener()
+    _teardown.append(stop_db_listener)
+    await roster.warm()
+    await regions.warm()
+    await load_rules()
+    checkin_writer.start()
+    _teardown.append(checkin_writer.stop)
+    broadcaster.start(application.bot)  # 拿到 0 号分片后继续未完成的群发
+    _teardown.append(broadcaster.stop)
+    await start_scheduler(application)
+    _teardown.append(stop_scheduler)
+    member_sweeper.start(application.bot)
+    _teardown.append(member_sweeper.stop)
+
+async def on_shutdown(application):
+    while _teardown:
+        step = _teardown.pop()
+        try:
+            await step()
+        except Exception as e:
+            print(f"关闭失败（{step.__qualname__}）：{e!r}")
+
+def build_application():
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .rate_limiter(outbound)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        .persistence(PostgresPersistence())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     register_handlers(application)
-    print("Bot started!")
-    application.run_polling()  # Render推荐写法
+    return application
+
+async def serve(application):
+    # 与 run_polling/run_webhook 相同的启动、停止顺序；另外在 PORT 上用自己的 HTTP 服务
+    # 同时提供 webhook、/metrics 和 /healthz（PTB 自带的 webhook 服务只有 webhook 一个路由）
+    webhook = BOT_MODE == "webhook"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        async with application:
+            await application.post_init(application)
+            server = start_web(application, PORT, WEBHOOK_PATH if webhook else None, WEBHOOK_SECRET)
+            try:
+                if webhook:
+                    await application.bot.set_webhook(f"{WEBHOOK_URL}/{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+                    print(f"Bot started! webhook 模式，端口 {PORT}")
+                else:
+                    await application.updater.start_polling()
+                    print(f"Bot started! 指标端口 {PORT}")
+                await application.start()
+                await stop.wait()
+                if application.updater.running:
+                    await application.updater.stop()
+                await application.stop()
+            finally:
+                server.stop()
+    finally:
+        await application.post_shutdown(application)
+
+def main():
+    asyncio.run(serve(build_application()))
 
 if __name__ == "__main__":
     main()
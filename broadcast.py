@@ -0,0 +1,376 @@
+import asyncio
+import json
+import os
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from leader import leader
+from outbound import BROADCAST, outbound
+from utils import get_db, hot_execute, hot_fetch, hot_fetchrow, hot_query, listen
+
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "8"))       # 同时在途的请求数上限
+BROADCAST_CHECKPOINT = float(os.environ.get("BROADCAST_CHECKPOINT", "1"))       # 秒：投递状态写回间隔
+BROADCAST_PROGRESS = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "3"))  # 秒：进度消息最短编辑间隔
+BROADCAST_ATTEMPTS = int(os.environ.get("BROADCAST_ATTEMPTS", "3"))             # 网络错误/限流时每个群最多发几次
+BROADCAST_RETRY_DELAY = 10  # 秒：一轮发完后隔多久重发失败可重试的群
+BROADCAST_BATCH = 500       # 每次从库里取多少个待发的群
+BROADCAST_CHANNEL = "broadcast_created"
+CURSOR_MIN = -2 ** 63
+
+Q_PENDING = hot_query(
+    "broadcast_pending",
+    "SELECT chat_id, attempts FROM broadcast_targets WHERE broadcast_id=$1 AND state='pending' AND chat_id > $2 "
+    "ORDER BY chat_id LIMIT $3"
+)
+# 一批投递结果写回，顺便读出群发状态（管理员点了停止时为 cancelled）
+Q_CHECKPOINT = hot_query("broadcast_checkpoint", """
+WITH done AS (
+    UPDATE broadcast_targets t SET state=v.state, attempts=v.attempts, message_id=v.message_id, error=v.error,
+        updated_at=now()
+    FROM unnest($2::bigint[], $3::text[], $4::smallint[], $5::bigint[], $6::text[])
+        AS v(chat_id, state, attempts, message_id, error)
+    WHERE t.broadcast_id=$1 AND t.chat_id=v.chat_id
+)
+SELECT status FROM broadcasts WHERE id=$1
+""")
+Q_COUNTS = hot_query(
+    "broadcast_counts", "SELECT state, count(*) AS n FROM broadcast_targets WHERE broadcast_id=$1 GROUP BY state"
+)
+Q_GET = hot_query("broadcast_get", "SELECT * FROM broadcasts WHERE id=$1")
+Q_RUNNING = hot_query("broadcast_running", "SELECT * FROM broadcasts WHERE status='running' ORDER BY id")
+Q_FINISH = hot_query(
+    "broadcast_finish", "UPDATE broadcasts SET status=$2, finished_at=now() WHERE id=$1 AND status='running'"
+)
+Q_CANCEL = hot_query(
+    "broadcast_cancel",
+    "UPDATE broadcasts SET status='cancelled', finished_at=now() WHERE id=$1 AND status='running' RETURNING id"
+)
+Q_GROUPS_GONE = hot_query("broadcast_groups_gone", "DELETE FROM bot_groups WHERE chat_id = ANY($1::bigint[])")
+
+def target_filter(text):
+    # 空：所有群；全是数字：指定的群 ID；否则按群名包含关键词筛选
+    text = (text or "").strip()
+    if not text:
+        return "TRUE", ()
+    words = text.replace(",", " ").split()
+    try:
+        return "chat_id = ANY($2::bigint[])", ([int(w) for w in words],)
+    except ValueError:
+        return "title ILIKE '%' || $2 || '%'", (text,)
+
+# 一次群发的执行过程：按 chat_id 分批取待发的群，最多 limit 个请求同时在途，
+# 结果攒一批写回（检查点），进程重启后从还是 pending 的群接着发。
+# 已发出但还没写回的群重启后会再发一次，检查点间隔越短重复越少。
+# limit 按 AIMD 自适应：每成功发出 limit 条加一，遇到限流或网络错误减半，RetryAfter 时整体暂停；
+# 实际发送速率再由 outbound 的全局令牌桶兜底，群发走最低优先级，不挤占交互回复。
+class BroadcastRun:
+    def __init__(self, row, bot, concurrency=BROADCAST_CONCURRENCY):
+        self.id = row["id"]
+        self.row = row
+        self.bot = bot
+        self.max_limit = concurrency
+        self.limit = concurrency
+        self.markup = InlineKeyboardMarkup.de_json(json.loads(row["reply_markup"]), bot) if row["reply_markup"] else None
+        self.total = row["total"]
+        self.sent = 0
+        self.failed = 0
+        self.status = "running"
+        self.throttled = 0      # 遇到限流/网络错误（触发减半）的次数
+        self._grown = 0
+        self._shrunk_at = 0.0
+        self._paused_until = 0.0
+        self._results = []      # 待写回的 (chat_id, state, attempts, message_id, error)
+        self._retry = []        # 本轮失败、稍后重发的 (chat_id, attempts)
+        self._gone = []         # 机器人已不在其中的群，从 bot_groups 删除
+        self._checkpoint_at = time.monotonic()
+        self._progress_at = 0.0
+        self._progress_text = None
+        self._rate_mark = (time.monotonic(), 0)
+        self.rate = 0.0
+
+    async def run(self):
+        try:
+            for r in await hot_fetch(Q_COUNTS, self.id):
+                if r["state"] == "sent":
+                    self.sent = r["n"]
+                elif r["state"] == "failed":
+                    self.failed = r["n"]
+            await self._progress(force=True)
+            targets = self._pending()
+            while self.status == "running":
+                await self._send_all(targets)
+                await self._checkpoint()
+                if not self._retry or self.status != "running":
+                    break
+                await asyncio.sleep(BROADCAST_RETRY_DELAY)
+                targets, self._retry = self._iter(self._retry), []
+            if self.status == "running":
+                self.status = "done"
+                await hot_execute(Q_FINISH, self.id, "done")
+            print(f"群发 #{self.id} 结束（{self.status}）：成功 {self.sent}，失败 {self.failed}，共 {self.total}")
+            await self._progress(force=True)
+        finally:
+            if self._results or self._gone:
+                try:
+                    await self._checkpoint()
+                except Exception as e:
+                    print(f"群发 #{self.id} 写回进度失败：{e}")
+
+    async def _pending(self):
+        cursor = CURSOR_MIN
+        while True:
+            rows = await hot_fetch(Q_PENDING, self.id, cursor, BROADCAST_BATCH)
+            for r in rows:
+                yield r["chat_id"], r["attempts"]
+            if len(rows) < BROADCAST_BATCH:
+                return
+            cursor = rows[-1]["chat_id"]
+
+    async def _iter(self, items):
+        for item in items:
+            yield item
+
+    async def _send_all(self, targets):
+        inflight = set()
+        try:
+            async for chat_id, attempts in targets:
+                while len(inflight) >= self.limit:
+                    done, inflight = await asyncio.wait(inflight, timeout=BROADCAST_CHECKPOINT,
+                                                        return_when=asyncio.FIRST_COMPLETED)
+                    self._reap(done)
+                    await self._tick()
+                if self.status != "running":
+                    break
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                inflight.add(asyncio.create_task(self._send(chat_id, attempts)))
+                await self._tick()
+            while inflight:
+                done, inflight = await asyncio.wait(inflight, timeout=BROADCAST_CHECKPOINT)
+                self._reap(done)
+                await self._tick()
+        finally:
+            if inflight:
+                # 被取消时等在途的请求结束，结果照常写回
+                self._reap((await asyncio.wait(inflight))[0])
+
+    def _reap(self, done):
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                print(f"群发 #{self.id} 发送异常：{task.exception()!r}")
+
+    async def _send(self, chat_id, attempts):
+        attempts += 1
+        throttled = outbound.throttled
+        try:
+            msg = await self.bot.copy_message(chat_id, self.row["from_chat_id"], self.row["message_id"],
+                                              reply_markup=self.markup, rate_limit_args=BROADCAST)
+            self._done(chat_id, "sent", attempts, msg.message_id)
+            if outbound.throttled != throttled:
+                self._shrink()
+            else:
+                self._grow()
+        except BadRequest as e:
+            # 群不存在、没有发言权限等，重发也没用
+            if "not found" in e.message.lower():
+                self._gone.append(chat_id)
+            self._done(chat_id, "failed", attempts, error=e.message)
+        except RetryAfter as e:
+            # outbound 重试几次后仍被限流：整个群发暂停，这个群不算失败，这一轮结束后再发
+            self._shrink()
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self._results.append((chat_id, "pending", attempts - 1, None, e.message))
+            self._retry.append((chat_id, attempts - 1))
+        except NetworkError as e:
+            # 超时/连接错误：放慢，这一轮结束后再发
+            self._shrink()
+            if attempts < BROADCAST_ATTEMPTS:
+                self._results.append((chat_id, "pending", attempts, None, e.message))
+                self._retry.append((chat_id, attempts))
+            else:
+                self._done(chat_id, "failed", attempts, error=e.message)
+        except Forbidden as e:
+            # 机器人已被踢出或群已解散
+            self._gone.append(chat_id)
+            self._done(chat_id, "failed", attempts, error=e.message)
+        except TelegramError as e:
+            self._done(chat_id, "failed", attempts, error=e.message)
+
+    def _done(self, chat_id, state, attempts, message_id=None, error=None):
+        if state == "sent":
+            self.sent += 1
+        else:
+            self.failed += 1
+        self._results.append((chat_id, state, attempts, message_id, error))
+
+    def _grow(self):
+        self._grown += 1
+        if self._grown >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._grown = 0
+
+    def _shrink(self):
+        # 同一波限流只减半一次
+        now = time.monotonic()
+        if now - self._shrunk_at >= 1:
+            self.limit = max(1, self.limit // 2)
+            self._shrunk_at = now
+            self._grown = 0
+            self.throttled += 1
+
+    async def _tick(self):
+        now = time.monotonic()
+        if now - self._checkpoint_at >= BROADCAST_CHECKPOINT or len(self._results) >= BROADCAST_BATCH:
+            await self._checkpoint()
+        await self._progress()
+
+    async def _checkpoint(self):
+        results, self._results = self._results, []
+        gone, self._gone = self._gone, []
+        self._checkpoint_at = time.monotonic()
+        try:
+            if results:
+                status = await hot_fetchrow(Q_CHECKPOINT, self.id, *map(list, zip(*results)))
+            else:
+                status = await hot_fetchrow(Q_GET, self.id)
+            if gone:
+                await hot_execute(Q_GROUPS_GONE, gone)
+        except Exception:
+            self._results = results + self._results
+            self._gone = gone + self._gone
+            raise
+        if status is None or status["status"] == "cancelled":
+            self.status = "cancelled"
+
+    def progress_text(self):
+        state = {"running": "进行中", "done": "已完成", "cancelled": "已停止"}[self.status]
+        text = f"📣 群发 #{self.id} {state}\n成功 {self.sent} / 失败 {self.failed} / 共 {self.total}"
+        if self.status == "running":
+            text += f"\n速率 {self.rate:.1f} 条/秒，并发 {self.limit}"
+        return text
+
+    async def _progress(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._progress_at < BROADCAST_PROGRESS:
+            return
+        mark_at, mark_count = self._rate_mark
+        done = self.sent + self.failed
+        if now > mark_at:
+            self.rate = (done - mark_count) / (now - mark_at)
+        self._rate_mark = (now, done)
+        self._progress_at = now
+        text = self.progress_text()
+        chat_id, message_id = self.row["progress_chat_id"], self.row["progress_msg_id"]
+        if text == self._progress_text or not message_id:
+            return
+        self._progress_text = text
+        markup = None
+        if self.status == "running":
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("⏹ 停止", callback_data=f"broadcast_cancel_{self.id}")]])
+        try:
+            await self.bot.edit_message_text(text, chat_id, message_id, reply_markup=markup)
+        except TelegramError as e:
+            print(f"群发 #{self.id} 更新进度失败：{e}")
+
+# 群发只由 0 号分片的持有者执行（与会员到期扫描相同）：新建的群发通过 NOTIFY 交给它，
+# 它失去分片时停下手里的群发，下一个持有者接管后从检查点继续。
+class Broadcaster:
+    def __init__(self, concurrency=BROADCAST_CONCURRENCY):
+        self.concurrency = concurrency
+        self.runs = {}    # id -> BroadcastRun
+        self._tasks = {}  # id -> asyncio.Task
+        self._bot = None
+
+    def start(self, bot):
+        self._bot = bot
+        leader.on_change(self._on_leadership)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def create(self, created_by, from_chat_id, message_id, reply_markup=None, filter_text=None,
+                     progress_chat_id=None, progress_msg_id=None):
+        # 建群发和全部目标在一个事务里；返回群发行，total 为 0 时不会执行
+        where, params = target_filter(filter_text)
+        db = await get_db()
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    "INSERT INTO broadcasts(created_by, from_chat_id, message_id, reply_markup, filter, "
+                    "progress_chat_id, progress_msg_id) VALUES($1, $2, $3, $4::jsonb, $5, $6, $7) RETURNING id",
+                    created_by, from_chat_id, message_id,
+                    json.dumps(reply_markup.to_dict()) if reply_markup else None,
+                    filter_text or None, progress_chat_id, progress_msg_id
+                )
+                bid = row["id"]
+                total = await conn.fetchval(
+                    "WITH t AS (INSERT INTO broadcast_targets(broadcast_id, chat_id) "
+                    f"SELECT $1, chat_id FROM bot_groups WHERE {where} RETURNING 1) SELECT count(*) FROM t",
+                    bid, *params
+                )
+                status = "running" if total else "done"
+                row = await conn.fetchrow(
+                    "UPDATE broadcasts SET total=$2, status=$3, finished_at=CASE WHEN $3='done' THEN now() END "
+                    "WHERE id=$1 RETURNING *", bid, total, status
+                )
+                if total:
+                    await conn.execute("SELECT pg_notify($1, $2)", BROADCAST_CHANNEL, str(bid))
+        print(f"新建群发 #{bid}：{total} 个群（筛选：{filter_text or '全部'}）")
+        if total:
+            # 本实例就是执行者时直接开始，不依赖监听连接
+            self._launch(row)
+        return row
+
+    async def cancel(self, bid):
+        return await hot_fetchrow(Q_CANCEL, bid) is not None
+
+    def _launch(self, row):
+        bid = row["id"]
+        if bid in self._tasks or self._bot is None or not leader.is_leader(0):
+            return
+        run = self.runs[bid] = BroadcastRun(row, self._bot, self.concurrency)
+        task = self._tasks[bid] = asyncio.create_task(run.run())
+        task.add_done_callback(lambda t, bid=bid: self._finished(bid, t))
+
+    def _finished(self, bid, task):
+        self._tasks.pop(bid, None)
+        run = self.runs.pop(bid, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"群发 #{bid} 中断：{task.exception()!r}，等下次接管时继续")
+        elif run is not None and run.status == "running":
+            print(f"群发 #{bid} 已暂停，等下次接管时继续")
+
+    async def resume(self):
+        for row in await hot_fetch(Q_RUNNING):
+            self._launch(row)
+
+    async def _on_leadership(self, gained, lost):
+        if 0 in lost:
+            await self.stop()
+        if 0 in gained:
+            await self.resume()
+
+    async def _on_created(self, payload):
+        # payload 为空：监听连接重连，断开期间别的实例建的群发可能没收到通知，全部检查一遍
+        if not leader.is_leader(0):
+            return
+        if not payload:
+            await self.resume()
+            return
+        row = await hot_fetchrow(Q_GET, int(payload))
+        if row is not None and row["status"] == "running":
+            self._launch(row)
+
+    def stats(self):
+        return {
+            bid: {"sent": r.sent, "failed": r.failed, "total": r.total, "limit": r.limit, "rate": r.rate,
+                  "throttled": r.throttled}
+            for bid, r in self.runs.items()
+        }
+
+broadcaster = Broadcaster()
+listen(BROADCAST_CHANNEL, broadcaster._on_created)
@@ -0,0 +1,76 @@
+from collections import namedtuple
+
+# 按钮回调路由：callback_data 形如 "命名空间_动作_参数1_参数2"，例如 schedule_delprev_yes_12。
+# 注册的路径按 "_" 拆成词存进前缀树，匹配时从左到右每个词查一次字典，取最长的已注册路径，
+# 剩下的部分按声明的类型转换成参数。整个过程只扫描一遍 callback_data，和注册了多少路由无关。
+# 本模块不依赖 telegram，便于单独压测。
+
+Route = namedtuple("Route", ["path", "namespace", "action", "handler", "types"])
+Match = namedtuple("Match", ["route", "args"])
+
+class CallbackRouter:
+    def __init__(self):
+        self._root = {}  # 词 -> 子节点；键 None 存放在该节点结束的路由
+
+    def add(self, path, handler, *types):
+        # types 为参数的转换函数（如 int）；给了 types 时剩余部分最多拆成 len(types) 段，
+        # 最后一个参数可以包含 "_"。不给 types 时剩余部分按 "_" 全部拆开，参数为字符串
+        namespace, _, action = path.partition("_")
+        node = self._root
+        for token in path.split("_"):
+            node = node.setdefault(token, {})
+        node[None] = Route(path, namespace, action, handler, types)
+
+    def match(self, data):
+        node = self._root
+        best = None
+        pos = 0
+        while True:
+            end = data.find("_", pos)
+            child = node.get(data[pos:] if end < 0 else data[pos:end])
+            if child is None:
+                break
+            node = child
+            route = node.get(None)
+            if end < 0:
+                if route is not None:
+                    best = (route, None)
+                break
+            pos = end + 1
+            if route is not None:
+                best = (route, pos)
+        if best is None:
+            return None
+        route, pos = best
+        if pos is None:
+            args = []
+        elif route.types:
+            args = data[pos:].split("_", len(route.types) - 1)
+        else:
+            args = data[pos:].split("_")
+        if route.types:
+            if len(args) != len(route.types):
+                return None
+            try:
+                args = [t(a) for t, a in zip(route.types, args)]
+            except ValueError:
+                return None
+        return Match(route, args)
+
+    def wrap(self, decorator):
+        # 用 decorator(handler, path) 替换所有已注册路由的处理函数（如加上耗时统计）
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for token, child in node.items():
+                if token is None:
+                    node[None] = child._replace(handler=decorator(child.handler, child.path))
+                else:
+                    stack.append(child)
+
+    def parse(self, data):
+        # 返回 (命名空间, 动作, 参数)，未注册的 callback_data 返回 None
+        m = self.match(data)
+        return None if m is None else (m.route.namespace, m.route.action, m.args)
+
+router = CallbackRouter()
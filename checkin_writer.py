@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import sys
+import asyncpg
+from utils import close_db, hot_execute, hot_query
+
+CHECKIN_QUEUE_SIZE = int(os.environ.get("CHECKIN_QUEUE_SIZE", "10000"))
+CHECKIN_BATCH_SIZE = int(os.environ.get("CHECKIN_BATCH_SIZE", "500"))
+CHECKIN_FLUSH_INTERVAL = float(os.environ.get("CHECKIN_FLUSH_INTERVAL", "1.0"))
+CHECKIN_RETRY_MAX = int(os.environ.get("CHECKIN_RETRY_MAX", "5"))  # 连接类错误的重试次数
+# 写不进去的打卡追加到这个文件（每行一条 JSON），修好后用 python checkin_writer.py --replay 重新写入
+CHECKIN_DEAD_LETTER = os.environ.get("CHECKIN_DEAD_LETTER", "checkin_dead_letter.jsonl")
+
+# 连接断开、数据库重启/过载、超时等，过一会儿重试可能成功；其余错误（约束、数据、表结构）重试也没用
+TRANSIENT_ERRORS = (
+    asyncpg.InterfaceError, asyncpg.PostgresConnectionError, asyncpg.InsufficientResourcesError,
+    asyncpg.OperatorInterventionError, OSError, asyncio.TimeoutError,
+)
+
+# 一条语句批量写入，依赖 checkins(chat_id, day, user_id) 唯一索引去重；
+# 只有真正新插入的打卡才累加到 checkin_stats / checkin_months，重试整批也不会重复计数
+Q_INSERT = hot_query("checkin_insert_batch", """
+WITH ins AS (
+    INSERT INTO checkins(user_id, chat_id, day)
+    SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[])
+    ON CONFLICT DO NOTHING
+    RETURNING user_id, chat_id, day::date AS d
+), stats AS (
+    INSERT INTO checkin_stats AS s (chat_id, user_id, total, current_streak, longest_streak, last_day)
+    SELECT chat_id, user_id, 1, 1, 1, d FROM ins
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET
+        total = s.total + 1,
+        current_streak = CASE WHEN s.last_day = EXCLUDED.last_day - 1 THEN s.current_streak + 1
+                              WHEN s.last_day >= EXCLUDED.last_day THEN s.current_streak
+                              ELSE 1 END,
+        longest_streak = GREATEST(s.longest_streak,
+                                  CASE WHEN s.last_day = EXCLUDED.last_day - 1 THEN s.current_streak + 1 ELSE 1 END),
+        last_day = GREATEST(s.last_day, EXCLUDED.last_day)
+), months AS (
+    INSERT INTO checkin_months AS m (chat_id, user_id, month, days, days_count)
+    SELECT chat_id, user_id, date_trunc('month', d)::date, 1 << (extract(day FROM d)::int - 1), 1 FROM ins
+    ON CONFLICT (chat_id, user_id, month) DO UPDATE SET
+        days = m.days | EXCLUDED.days,
+        days_count = m.days_count + CASE WHEN m.days & EXCLUDED.days = 0 THEN 1 ELSE 0 END
+)
+SELECT count(*) FROM ins
+""")
+
+def split_rounds(batch):
+    # ON CONFLICT DO UPDATE 不能在一条语句里改同一行两次：同一人（跨日界时）在一批里
+    # 出现多次就拆成几轮，按日期先后写入。绝大多数批次只有一轮。
+    rounds = []
+    for r in sorted(batch, key=lambda r: r[2]):
+        key = (r[0], r[1])
+        for rnd in rounds:
+            if key not in rnd:
+                rnd[key] = r
+                break
+        else:
+            rounds.append({key: r})
+    return [list(rnd.values()) for rnd in rounds]
+
+# 打卡异步批量落库：处理器只负责入队，后台任务按批次/时间间隔写数据库。
+# 队列有上限，满了 submit 会等待（反压）；关闭时把剩余数据全部写完。
+# 一批写不进去时不能一直卡住后面的打卡：连接类错误有限次重试，其他错误对半拆开找出坏数据，
+# 最后仍写不进去的转存到 CHECKIN_DEAD_LETTER。
+class CheckinWriter:
+    def __init__(self, maxsize, batch_size, interval):
+        self.queue = asyncio.Queue(maxsize)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task = None
+        self._pending = []  # 已出队、尚未写入成功的数据
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_letters = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, user_id, chat_id, day):
+        await self.queue.put((user_id, chat_id, day))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._pending.append(await self.queue.get())
+            deadline = loop.time() + self.interval
+            while len(self._pending) < self.batch_size:
+                try:
+                    self._pending.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(self._pending)
+            self._pending = []
+
+    async def _write(self, batch, retries=CHECKIN_RETRY_MAX):
+        # 写入是幂等的（唯一索引去重，只累加新插入的），部分轮次已提交后重试整批也不会重复计数
+        for attempt in range(retries + 1):
+            error = await self._flush(batch)
+            if error is None:
+                return
+            if not isinstance(error, TRANSIENT_ERRORS):
+                break
+            if attempt < retries:
+                await asyncio.sleep(min(self.interval * 2 ** attempt, 30))
+        else:
+            self.dead_letter(batch, f"重试{retries}次仍失败：{error}")
+            return
+        if len(batch) == 1:
+            self.dead_letter(batch, str(error))
+            return
+        # 按日期排好再对半拆，两半各自仍按时间先后写入
+        batch = sorted(batch, key=lambda r: r[2])
+        mid = len(batch) // 2
+        await self._write(batch[:mid], retries)
+        await self._write(batch[mid:], retries)
+
+    async def _flush(self, batch):
+        # 成功返回 None，失败返回异常
+        try:
+            for rnd in split_rounds(batch):
+                await hot_execute(Q_INSERT, [r[0] for r in rnd], [r[1] for r in rnd], [r[2] for r in rnd])
+        except Exception as e:
+            self.failures += 1
+            print(f"打卡批量写入失败（{len(batch)}条）：{e!r}")
+            return e
+        self.written += len(batch)
+        self.batches += 1
+        return None
+
+    def dead_letter(self, batch, reason):
+        self.dead_letters += len(batch)
+        try:
+            with open(CHECKIN_DEAD_LETTER, "a", encoding="utf-8") as f:
+                for user_id, chat_id, day in batch:
+                    f.write(json.dumps({"user_id": user_id, "chat_id": chat_id, "day": day, "error": reason},
+                                       ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"{len(batch)}条打卡无法写入，转存 {CHECKIN_DEAD_LETTER} 也失败：{e}")
+            return
+        print(f"{len(batch)}条打卡无法写入，已转存到 {CHECKIN_DEAD_LETTER}：{reason}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        batch = self._pending
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            # 关闭时不再长时间等待，重试两次后转存
+            await self._write(batch, retries=2)
+        self._pending = []
+
+async def replay(path=CHECKIN_DEAD_LETTER):
+    # 把转存的打卡重新写入；仍然失败的会追加到新的转存文件里
+    if not os.path.exists(path):
+        print(f"{path} 不存在")
+        return
+    replaying = path + ".replaying"
+    os.replace(path, replaying)
+    with open(replaying, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    writer = CheckinWriter(0, CHECKIN_BATCH_SIZE, CHECKIN_FLUSH_INTERVAL)
+    try:
+        for i in range(0, len(rows), CHECKIN_BATCH_SIZE):
+            await writer._write([(r["user_id"], r["chat_id"], r["day"]) for r in rows[i:i + CHECKIN_BATCH_SIZE]])
+    finally:
+        await close_db()
+    os.remove(replaying)
+    print(f"重新写入打卡 {len(rows)} 条：成功 {writer.written} 条，仍失败 {writer.dead_letters} 条")
+
+checkin_writer = CheckinWriter(CHECKIN_QUEUE_SIZE, CHECKIN_BATCH_SIZE, CHECKIN_FLUSH_INTERVAL)
+
+if __name__ == "__main__":
+    if "--replay" in sys.argv:
+        asyncio.run(replay(*sys.argv[sys.argv.index("--replay") + 1:][:1]))
+    else:
+        print("用法: python checkin_writer.py --replay [转存文件]")
@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta, time
+
+MAX_LOOKAHEAD_DAYS = 400
+
+# 计算定时消息下一次有效的触发时间。
+# 触发时刻固定为 anchor + k * interval；不在有效期/时段内的时刻直接跳过，
+# 跳到下一个时段开始后的第一个触发点，不在时段外唤醒。
+def next_fire_time(anchor, interval, after, windows=(), start_date=None, end_date=None):
+    step = timedelta(minutes=interval)
+    if after < anchor:
+        t = anchor
+    else:
+        t = anchor + step * ((after - anchor) // step + 1)
+    for _ in range(MAX_LOOKAHEAD_DAYS * (len(windows) + 1) + 2):
+        d = t.date()
+        if end_date and d > end_date:
+            return None
+        if start_date and d < start_date:
+            target = datetime.combine(start_date, time())
+        elif not windows:
+            return t
+        else:
+            now = t.time()
+            target = None
+            for start, end in windows:
+                if start <= now <= end:
+                    return t
+                if start > now and (target is None or start < target.time()):
+                    target = datetime.combine(d, start)
+            if target is None:
+                # 当天的时段都已过去，跳到第二天第一个时段
+                first = min(start for start, _ in windows)
+                target = datetime.combine(d + timedelta(days=1), first)
+        t = anchor + step * -(-(target - anchor) // step)
+    return None
+
+# 所有定时消息放在一个最小堆里，按下一次触发时间排序，只用一个任务等待堆顶。
+# 同一时刻到期的消息并发发送，并发数受 Semaphore 限制。
+class ScheduleDispatcher:
+    def __init__(self, fire, concurrency=8, clock=datetime.now):
+        self.fire = fire          # async fire(key, planned_time)
+        self.clock = clock
+        self.sem = asyncio.Semaphore(concurrency)
+        self._heap = []           # (触发时间, 序号, key)
+        self._entries = {}        # key -> (序号, anchor, interval, windows, start_date, end_date)
+        self._next = {}           # key -> 下一次触发时间（没有下一次时为 None）
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._task = None
+        self._inflight = set()
+        self.wakeups = 0
+        self.fired = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, interval, windows=(), start_date=None, end_date=None, anchor=None, after=None):
+        # 触发时刻为 anchor + k * interval；after 为空时从 anchor 之后的第一个触发点开始，
+        # 否则为 after 之后（after 早于 anchor 时即 anchor 本身）的第一个触发点：
+        # 重启时沿用原来的节奏，但不补发中间错过的几次
+        if anchor is None:
+            anchor = self.clock()
+        self._seq += 1
+        entry = (self._seq, anchor, interval, windows, start_date, end_date)
+        self._entries[key] = entry
+        self._push(key, entry, anchor if after is None else after)
+
+    def remove(self, key):
+        # 堆里的旧条目靠序号失效，弹出时丢弃
+        self._entries.pop(key, None)
+        self._next.pop(key, None)
+
+    def timing(self, key):
+        # (interval, windows, start_date, end_date)，未调度时为 None
+        entry = self._entries.get(key)
+        return entry[2:] if entry is not None else None
+
+    def next_time(self, key):
+        return self._next.get(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._next.clear()
+        self._heap.clear()
+        self._wake.set()
+
+    def _push(self, key, entry, after, aligned=False):
+        seq, anchor, interval, windows, start_date, end_date = entry
+        t = None
+        if aligned:
+            # 快速路径：after 本身就是触发点，下一个触发点仍在时段内时不用重新推算
+            t = after + timedelta(minutes=interval)
+            d = t.date()
+            if (start_date and d < start_date) or (end_date and d > end_date):
+                t = None
+            elif windows:
+                now = t.time()
+                for start, end in windows:
+                    if start <= now <= end:
+                        break
+                else:
+                    t = None
+        if t is None:
+            t = next_fire_time(anchor, interval, after, windows, start_date, end_date)
+            self._next[key] = t
+            if t is None:
+                return
+        else:
+            self._next[key] = t
+        top = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (t, seq, key))
+        if top is None or t < top:
+            self._wake.set()
+
+    def next_due(self):
+        while self._heap:
+            t, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == seq:
+                return t
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            t, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != seq:
+                continue
+            due.append((key, t))
+            self._push(key, entry, t, aligned=True)
+        return due
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            t = self.next_due()
+            if t is None:
+                await self._wake.wait()
+                continue
+            delay = (t - self.clock()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                    continue  # 堆顶变了，重新计算
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeups += 1
+            for key, planned in self.pop_due(self.clock()):
+                self.fire_now(key, planned)
+
+    def fire_now(self, key, planned):
+        # 不经过堆直接触发一次（如重启后补发错过的一次），不影响之后的节奏
+        task = asyncio.create_task(self._fire(key, planned))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _fire(self, key, planned):
+        async with self.sem:
+            lag = (self.clock() - planned).total_seconds()
+            self.fired += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                await self.fire(key, planned)
+            except Exception as e:
+                print(f"定时消息{key}发送失败：{e}")
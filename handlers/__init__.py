@@ -1,4 +1,18 @@
-from . import menu, checkin, member, autoreply, schedule
+from telegram.ext import CallbackQueryHandler
+from callbacks import router
+from metrics import timed
+from . import menu, checkin, member, autoreply, schedule, group_manage, trace, text
+
+# 所有按钮回调只注册一个处理器，由 callbacks.router 解析 callback_data 并分发；
+# 解析出的参数放在 context.args，路由信息（命名空间、动作）放在 context.route
+async def dispatch_callback(update, context):
+    match = router.match(update.callback_query.data or "")
+    if match is None:
+        await update.callback_query.answer()
+        return
+    context.route = match.route
+    context.args = match.args
+    await match.route.handler(update, context)
 
 def register(application):
     menu.register(application)
@@ -6,3 +20,12 @@ def register(application):
     member.register(application)
     autoreply.register(application)
     schedule.register(application)
+    group_manage.register(application)
+    trace.register(application)
+    text.register(application)
+    application.add_handler(CallbackQueryHandler(dispatch_callback))
+    # 所有处理器和按钮路由统一加上耗时/异常统计（/metrics 的 bot_handler_seconds）
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+    router.wrap(lambda handler, path: timed(handler, f"callback.{path}"))
@@ -1,6 +1,80 @@
 from telegram import Update
-from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes
-from utils import get_db, admin_required
+from telegram.ext import CommandHandler, ContextTypes
+from callbacks import router
+from utils import (admin_required, hot_fetch, hot_fetchrow, hot_execute, hot_query, listen, normalize_text,
+                   keyset_page, pager_markup, send_page)
+from matcher import KeywordMatcher
+
+# 自动回复规则常驻内存，编译成关键词自动机；规则表没有 chat_id，所有群共用一份。
+# 关键词按 normalize_text 规范化后入自动机，与文本分类阶段规范化后的消息匹配（不区分大小写/全半角）
+matcher = KeywordMatcher()
+# 规范化后相同的多条规则（如 "Hi" 和 "hi"）共用自动机里的一项：规范化关键词 -> {原关键词: 回复}，
+# 生效的是原关键词最小的那条；删掉其中一条时换成剩下的，全删完才从自动机移除
+_rules = {}
+
+Q_ALL = hot_query("autoreply_all", "SELECT keyword, reply FROM autoreplies")
+Q_GET = hot_query("autoreply_get", "SELECT reply FROM autoreplies WHERE keyword=$1")
+Q_UPSERT = hot_query(
+    "autoreply_upsert",
+    "INSERT INTO autoreplies(keyword, reply) VALUES($1, $2) ON CONFLICT (keyword) DO UPDATE SET reply=$2"
+)
+Q_DELETE = hot_query("autoreply_delete", "DELETE FROM autoreplies WHERE keyword=$1")
+# 按关键词排序，游标是翻页边界那条规则的 id（关键词可能超过 callback_data 的长度限制）
+Q_PAGE_FIRST = hot_query(
+    "autoreply_page_first", "SELECT id, keyword, reply FROM autoreplies ORDER BY keyword LIMIT $1"
+)
+Q_PAGE_AFTER = hot_query(
+    "autoreply_page_after",
+    "SELECT id, keyword, reply FROM autoreplies "
+    "WHERE keyword > (SELECT keyword FROM autoreplies WHERE id=$1) ORDER BY keyword LIMIT $2"
+)
+Q_PAGE_BEFORE = hot_query(
+    "autoreply_page_before",
+    "SELECT id, keyword, reply FROM autoreplies "
+    "WHERE keyword < (SELECT keyword FROM autoreplies WHERE id=$1) ORDER BY keyword DESC LIMIT $2"
+)
+REPLY_PREVIEW = 40  # 列表里回复内容只显示前 N 个字
+
+def _add_rule(keyword, reply):
+    key = normalize_text(keyword)
+    same = _rules.setdefault(key, {})
+    same[keyword] = reply
+    matcher.add(key, same[min(same)])
+
+def _remove_rule(keyword):
+    key = normalize_text(keyword)
+    same = _rules.get(key)
+    if same is None or same.pop(keyword, None) is None:
+        return
+    if same:
+        matcher.add(key, same[min(same)])
+    else:
+        del _rules[key]
+        matcher.remove(key)
+
+async def load_rules():
+    rows = await hot_fetch(Q_ALL)
+    matcher.clear()
+    _rules.clear()
+    for r in rows:
+        _add_rule(r["keyword"], r["reply"])
+    return len(rows)
+
+async def _on_autoreplies_changed(payload):
+    # 其他实例（或本实例，重复应用无妨）改了规则：payload 为关键词，空表示整表重新加载
+    try:
+        if not payload:
+            await load_rules()
+            return
+        row = await hot_fetchrow(Q_GET, payload)
+        if row is None:
+            _remove_rule(payload)
+        else:
+            _add_rule(payload, row["reply"])
+    except Exception as e:
+        print(f"自动回复规则重新加载失败：{e}")
+
+listen("autoreplies_changed", _on_autoreplies_changed)
 
 # 设置自动回复
 @admin_required
@@ -8,11 +82,8 @@ async def set_autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         keyword = context.args[0]
         reply = " ".join(context.args[1:])
-        db = await get_db()
-        await db.execute(
-            "INSERT INTO autoreplies(keyword, reply) VALUES($1, $2) ON CONFLICT (keyword) DO UPDATE SET reply=$2",
-            keyword, reply
-        )
+        await hot_execute(Q_UPSERT, keyword, reply)
+        _add_rule(keyword, reply)
         await update.message.reply_text(f"设置自动回复：{keyword} -> {reply}")
     except Exception:
         await update.message.reply_text("用法: /setautoreply 关键词 回复内容")
@@ -21,33 +92,36 @@ async def set_autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def del_autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         keyword = context.args[0]
-        db = await get_db()
-        await db.execute("DELETE FROM autoreplies WHERE keyword=$1", keyword)
+        await hot_execute(Q_DELETE, keyword)
+        _remove_rule(keyword)
         await update.message.reply_text(f"已删除关键词：{keyword}")
     except Exception:
         await update.message.reply_text("用法: /delautoreply 关键词")
 
 @admin_required
 async def list_autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db = await get_db()
-    rows = await db.fetch("SELECT keyword, reply FROM autoreplies ORDER BY keyword")
+    direction, cursor = None, ()
+    if update.callback_query:
+        # ar_<n|p>_<id>
+        direction, cursor = context.route.action, tuple(context.args)
+    rows, has_prev, has_next = await keyset_page(Q_PAGE_FIRST, Q_PAGE_AFTER, Q_PAGE_BEFORE, (), direction, cursor)
+    if not rows and direction:
+        # 游标那条规则已被删除，回到第一页
+        rows, has_prev, has_next = await keyset_page(Q_PAGE_FIRST, Q_PAGE_AFTER, Q_PAGE_BEFORE, ())
     if not rows:
-        await update.message.reply_text("暂无自动回复规则。")
+        await send_page(update, "暂无自动回复规则。", None)
         return
-    lines = [f"{i+1}. {r['keyword']} → {r['reply']}" for i, r in enumerate(rows)]
-    await update.message.reply_text("\n".join(lines))
-
-async def reply_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    db = await get_db()
-    rows = await db.fetch("SELECT keyword, reply FROM autoreplies")
+    lines = []
     for r in rows:
-        if r["keyword"] in text:
-            await update.message.reply_text(r["reply"])
-            break
+        reply = r["reply"] if len(r["reply"]) <= REPLY_PREVIEW else r["reply"][:REPLY_PREVIEW] + "…"
+        lines.append(f"• {r['keyword']} → {reply}")
+    prev_data = f"ar_p_{rows[0]['id']}" if has_prev else None
+    next_data = f"ar_n_{rows[-1]['id']}" if has_next else None
+    await send_page(update, "\n".join(lines), pager_markup(prev_data, next_data))
 
 def register(application):
     application.add_handler(CommandHandler("setautoreply", set_autoreply))
     application.add_handler(CommandHandler("delautoreply", del_autoreply))
     application.add_handler(CommandHandler("listautoreply", list_autoreply))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, reply_message))
+    router.add("ar_n", list_autoreply, int)
+    router.add("ar_p", list_autoreply, int)
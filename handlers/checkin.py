@@ -1,33 +1,159 @@
+import datetime
+import os
 from telegram import Update
-from telegram.ext import MessageHandler, CommandHandler, ContextTypes, filters
-from utils import get_db, today_str
+from telegram.ext import CommandHandler, ContextTypes
+from callbacks import router
+from checkin_writer import checkin_writer
+from roster import roster
+from regions import regions
+from utils import PAGE_SIZE, pager_markup, send_page, hot_fetch, hot_fetchrow, hot_query
+
+RANK_SIZE = int(os.environ.get("CHECKIN_RANK_SIZE", "10"))
+
+# 统计都来自 checkin_writer 增量维护的汇总表，按主键/排行索引直接取，不扫打卡明细
+Q_MY_STATS = hot_query(
+    "checkin_my_stats",
+    "SELECT total, current_streak, longest_streak, last_day FROM checkin_stats WHERE chat_id=$1 AND user_id=$2"
+)
+Q_MY_MONTH = hot_query(
+    "checkin_my_month",
+    "SELECT days, days_count FROM checkin_months WHERE chat_id=$1 AND user_id=$2 AND month=$3"
+)
+Q_RANK_MONTH = hot_query(
+    "checkin_rank_month",
+    "SELECT user_id, days_count AS score FROM checkin_months WHERE chat_id=$1 AND month=$2 "
+    "ORDER BY days_count DESC, user_id LIMIT $3"
+)
+Q_RANK_TOTAL = hot_query(
+    "checkin_rank_total",
+    "SELECT user_id, total AS score FROM checkin_stats WHERE chat_id=$1 ORDER BY total DESC, user_id LIMIT $2"
+)
+# 断签的人 current_streak 不会被清零，按索引顺序取时跳过 last_day 早于昨天的行
+Q_RANK_STREAK = hot_query(
+    "checkin_rank_streak",
+    "SELECT user_id, current_streak AS score FROM checkin_stats WHERE chat_id=$1 AND last_day >= $2 "
+    "ORDER BY current_streak DESC, user_id LIMIT $3"
+)
+Q_MEMBER_NAMES = hot_query(
+    "checkin_member_names",
+    "SELECT user_id, name FROM members WHERE chat_id=$1 AND user_id = ANY($2::bigint[])"
+)
+
+CHECKIN_KEYWORD = "打卡"  # 文本分类阶段按规范化后的整条消息比较
 
 async def checkin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    today = today_str()
-    db = await get_db()
-    exists = await db.fetchval("SELECT 1 FROM checkins WHERE user_id=$1 AND chat_id=$2 AND day=$3", user_id, chat_id, today)
-    if exists:
+    # 先在内存名单去重再入队，回复不等待落库
+    if not roster.add(chat_id, user_id, update.effective_user.full_name):
         await update.message.reply_text("今日已经打卡过，无需重复打卡")
     else:
-        await db.execute(
-            "INSERT INTO checkins(user_id, chat_id, day) VALUES($1, $2, $3)",
-            user_id, chat_id, today
-        )
+        await checkin_writer.submit(user_id, chat_id, roster.day)
         await update.message.reply_text("打卡成功")
 
 async def today_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    today = today_str()
-    db = await get_db()
-    rows = await db.fetch("SELECT user_id FROM checkins WHERE chat_id=$1 AND day=$2", chat_id, today)
+    chat = roster.chat(chat_id)
+    start = 0
+    if update.callback_query:
+        # ck_<日期>_<起始序号>；当天打卡顺序只追加不改动，序号就是稳定的游标，跨天后回到第一页
+        day, offset = context.args
+        if day == roster.day:
+            start = max(0, min(offset, len(chat)))
+    entries = chat.entries(start, start + PAGE_SIZE)
+    if not entries:
+        await send_page(update, "今天还没有人打卡哦～", None)
+        return
+    lines = [
+        f"{i}. {name} (ID:{uid})" if name else f"{i}. 用户ID：{uid}"
+        for i, (uid, name) in enumerate(entries, start + 1)
+    ]
+    stop = start + len(entries)
+    markup = pager_markup(
+        f"ck_{roster.day}_{max(0, start - PAGE_SIZE)}" if start else None,
+        f"ck_{roster.day}_{stop}" if stop < len(chat) else None,
+    )
+    await send_page(update, '\n'.join(lines), markup)
+
+def _streak(stats, today):
+    # 最后一次打卡是今天或昨天时连续天数仍然有效
+    if stats["last_day"] and stats["last_day"] >= today - datetime.timedelta(days=1):
+        return stats["current_streak"]
+    return 0
+
+async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    today = datetime.date.today()
+    stats = await hot_fetchrow(Q_MY_STATS, chat_id, user_id)
+    if stats is None:
+        await update.message.reply_text("你在本群还没有打卡记录。")
+        return
+    month = await hot_fetchrow(Q_MY_MONTH, chat_id, user_id, today.replace(day=1))
+    days = month["days"] if month else 0
+    marked = [str(d + 1) for d in range(31) if days >> d & 1]
+    await update.message.reply_text(
+        f"📊 {update.effective_user.full_name} 的打卡统计\n"
+        f"累计打卡：{stats['total']} 天\n"
+        f"当前连续：{_streak(stats, today)} 天\n"
+        f"最长连续：{stats['longest_streak']} 天\n"
+        f"最近打卡：{stats['last_day']}\n"
+        f"本月打卡：{len(marked)} 天" + (f"（{' '.join(marked)} 日）" if marked else "")
+    )
+
+RANK_MODES = {"month": "本月打卡天数", "total": "累计打卡天数", "streak": "当前连续打卡天数"}
+
+# /checkin_rank [month|total|streak]，默认按本月打卡天数
+async def checkin_rank(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    mode = context.args[0].lower() if context.args else "month"
+    if mode not in RANK_MODES:
+        await update.message.reply_text("用法: /checkin_rank [month|total|streak]")
+        return
+    today = datetime.date.today()
+    if mode == "month":
+        rows = await hot_fetch(Q_RANK_MONTH, chat_id, today.replace(day=1), RANK_SIZE)
+    elif mode == "total":
+        rows = await hot_fetch(Q_RANK_TOTAL, chat_id, RANK_SIZE)
+    else:
+        rows = await hot_fetch(Q_RANK_STREAK, chat_id, today - datetime.timedelta(days=1), RANK_SIZE)
     if not rows:
-        await update.message.reply_text("今天还没有人打卡哦～")
+        await update.message.reply_text("暂无打卡数据。")
+        return
+    chat = roster.chat(chat_id)
+    names = {r["user_id"]: chat.name(r["user_id"]) for r in rows}
+    missing = [uid for uid, name in names.items() if not name]
+    if missing:
+        for r in await hot_fetch(Q_MEMBER_NAMES, chat_id, missing):
+            names[r["user_id"]] = r["name"]
+    lines = [f"🏆 {RANK_MODES[mode]}排行"]
+    for i, r in enumerate(rows, 1):
+        name = names[r["user_id"]]
+        who = f"{name} (ID:{r['user_id']})" if name else f"用户ID：{r['user_id']}"
+        lines.append(f"{i}. {who} — {r['score']} 天")
+    await update.message.reply_text("\n".join(lines))
+
+# 地区查询：消息恰好是本群某个地区名时（由文本分类阶段判断），列出该地区会员今天的打卡情况
+async def region_checkins(update: Update, key):
+    chat_id = update.effective_chat.id
+    users = regions.members(chat_id, key)
+    chat = roster.chat(chat_id)
+    # 地区会员集合与当天打卡位图求交集，只和该地区人数有关
+    done = [uid for uid in users if chat.has(uid)]
+    label = regions.label(chat_id, key)
+    if not done:
+        await update.message.reply_text(f"📍 {label}：今天还没有人打卡（共 {len(users)} 人）")
         return
-    lines = [f"{i+1}. 用户ID：{r['user_id']}" for i, r in enumerate(rows)]
-    await update.message.reply_text('\n'.join(lines))
+    lines = [f"📍 {label} 今日打卡 {len(done)}/{len(users)}"]
+    for uid in done[:PAGE_SIZE * 5]:
+        name = chat.name(uid)
+        lines.append(f"• {name} (ID:{uid})" if name else f"• 用户ID：{uid}")
+    if len(done) > PAGE_SIZE * 5:
+        lines.append(f"……另有 {len(done) - PAGE_SIZE * 5} 人")
+    await update.message.reply_text("\n".join(lines))
 
 def register(application):
-    application.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"^打卡$"), checkin_message))
     application.add_handler(CommandHandler("today_checkins", today_checkins))
+    router.add("ck", today_checkins, str, int)
+    application.add_handler(CommandHandler("mystats", my_stats))
+    application.add_handler(CommandHandler("checkin_rank", checkin_rank))
@@ -2,15 +2,22 @@ from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup
 )
 from telegram.ext import (
-    ContextTypes, CallbackQueryHandler, CommandHandler, ChatMemberHandler
+    ContextTypes, CommandHandler, ChatMemberHandler, filters
 )
+from broadcast import broadcaster
+from callbacks import router
 from utils import get_db, is_admin
 
-# 1. 机器人被拉入新群时自动记录群信息
+# 1. 机器人被拉入新群时自动记录群信息，被移出时删除
 async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_status = update.my_chat_member.new_chat_member.status
     old_status = update.my_chat_member.old_chat_member.status
     chat = update.effective_chat
+    if chat.type in ("group", "supergroup") and old_status not in ("left", "kicked") and new_status in ("left", "kicked"):
+        db = await get_db()
+        async with db.acquire() as conn:
+            await conn.execute("DELETE FROM bot_groups WHERE chat_id=$1", chat.id)
+        print(f"机器人已离开群: {chat.id} - {chat.title}")
     # 只记录机器人被拉入新群的情况
     if chat.type in ("group", "supergroup") and old_status in ("left", "kicked") and new_status in ("member", "administrator"):
         chat_id = chat.id
@@ -26,7 +33,7 @@ async def on_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 2. 私聊命令，展示所有管理的群，让管理员选择
 async def show_group_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not is_admin(user_id):
+    if not await is_admin(user_id):
         await update.message.reply_text("只有管理员才能操作。")
         return
     db = await get_db()
@@ -43,13 +50,60 @@ async def show_group_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # 3. 处理群选择，记录到用户上下文
 async def on_select_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = int(update.callback_query.data.split('_')[-1])
+    chat_id = context.args[0]
     context.user_data['selected_group'] = chat_id
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(f"已选择群：{chat_id}\n你可以使用相关命令进行管理。")
 
-# 4. 注册到 application
+# 4. 群发：私聊里回复要群发的消息（文字、图片、视频、文件均可）发送
+#    /broadcast [群名关键词 或 群ID...]
+#    按钮名|https://xxx.com     （可选，每行一个按钮）
+BROADCAST_USAGE = (
+    "用法：回复要群发的消息，发送\n"
+    "/broadcast [群名关键词 或 群ID，不填为全部群]\n"
+    "按钮名|https://xxx.com（可选，每行一个按钮）"
+)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not await is_admin(user_id):
+        await update.message.reply_text("只有管理员才能操作。")
+        return
+    source = update.message.reply_to_message
+    if source is None:
+        await update.message.reply_text(BROADCAST_USAGE)
+        return
+    first, _, rest = update.message.text.partition("\n")
+    filter_text = first.partition(" ")[2].strip()
+    buttons = []
+    for line in rest.splitlines():
+        if "|" in line:
+            name, url = line.split("|", 1)
+            buttons.append([InlineKeyboardButton(name.strip(), url=url.strip())])
+    progress = await update.message.reply_text("📣 群发准备中…")
+    row = await broadcaster.create(
+        user_id, source.chat_id, source.message_id,
+        reply_markup=InlineKeyboardMarkup(buttons) if buttons else None,
+        filter_text=filter_text, progress_chat_id=progress.chat_id, progress_msg_id=progress.message_id,
+    )
+    if not row["total"]:
+        await progress.edit_text(f"没有符合条件的群（筛选：{filter_text or '全部'}）。")
+
+async def on_broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update.effective_user.id):
+        await update.callback_query.answer("⚠️ 只有管理员可用此功能。", show_alert=True)
+        return
+    bid = context.args[0]
+    if await broadcaster.cancel(bid):
+        # 执行中的群发在下一个检查点发现状态变化后停下并更新进度消息
+        await update.callback_query.answer(f"群发 #{bid} 正在停止…")
+    else:
+        await update.callback_query.answer(f"群发 #{bid} 已经结束。")
+
+# 5. 注册到 application
 def register(application):
-    application.add_handler(ChatMemberHandler(on_my_chat_member, chat_member_types=["my_chat_member"]))
+    application.add_handler(ChatMemberHandler(on_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
     application.add_handler(CommandHandler("groups", show_group_list))
-    application.add_handler(CallbackQueryHandler(on_select_group, pattern="^select_group_\\-?\\d+$"))
+    application.add_handler(CommandHandler("broadcast", broadcast_command, filters=filters.ChatType.PRIVATE))
+    router.add("select_group", on_select_group, int)
+    router.add("broadcast_cancel", on_broadcast_cancel, int)
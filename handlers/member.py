@@ -1,6 +1,40 @@
+import csv
+import datetime
+import os
+import tempfile
+import time
+import asyncpg
 from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
-from utils import get_db, admin_required, today_str
+from telegram.error import TelegramError
+from telegram.ext import CommandHandler, MessageHandler, ContextTypes, filters
+from callbacks import router
+from utils import (admin_required, today_str, get_db, hot_execute, hot_query,
+                   keyset_page, pager_markup, send_page)
+
+IMPORT_BATCH = int(os.environ.get("MEMBER_IMPORT_BATCH", "5000"))    # 每次 COPY 的行数
+IMPORT_MAX_ERRORS = int(os.environ.get("MEMBER_IMPORT_MAX_ERRORS", "20"))  # 回复里最多列出的错误行（其余只计数）
+
+Q_UPSERT = hot_query(
+    "member_upsert",
+    "INSERT INTO members(user_id, chat_id, name, expire_date) VALUES($1, $2, $3, $4) "
+    "ON CONFLICT (user_id, chat_id) DO UPDATE SET name=$3, expire_date=$4"
+)
+Q_DELETE = hot_query("member_delete", "DELETE FROM members WHERE user_id=$1 AND chat_id=$2")
+Q_RENEW = hot_query("member_renew", "UPDATE members SET expire_date=$1 WHERE user_id=$2 AND chat_id=$3")
+
+# 会员列表按 (到期日, user_id) 分页；没有到期日的排在最后（按 infinity 处理），
+# 排序键和 members_chat_expire_key 索引一致
+_KEY = "COALESCE(expire_date, 'infinity'::date)"
+_SELECT = f"SELECT user_id, name, expire_date, {_KEY} AS k FROM members WHERE chat_id=$1"
+Q_PAGE_FIRST = hot_query("member_page_first", f"{_SELECT} ORDER BY {_KEY}, user_id LIMIT $2")
+Q_PAGE_AFTER = hot_query(
+    "member_page_after",
+    f"{_SELECT} AND ({_KEY}, user_id) > ($2, $3) ORDER BY {_KEY}, user_id LIMIT $4"
+)
+Q_PAGE_BEFORE = hot_query(
+    "member_page_before",
+    f"{_SELECT} AND ({_KEY}, user_id) < ($2, $3) ORDER BY {_KEY} DESC, user_id DESC LIMIT $4"
+)
 
 # 添加会员
 @admin_required
@@ -9,12 +43,8 @@ async def add_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
         args = context.args
         user_id = int(args[0])
         name = args[1]
-        expire = args[2]  # YYYY-MM-DD
-        db = await get_db()
-        await db.execute(
-            "INSERT INTO members(user_id, name, expire) VALUES($1, $2, $3) ON CONFLICT (user_id) DO UPDATE SET name=$2, expire=$3",
-            user_id, name, expire
-        )
+        expire = datetime.date.fromisoformat(args[2])  # YYYY-MM-DD
+        await hot_execute(Q_UPSERT, user_id, update.effective_chat.id, name, expire)
         await update.message.reply_text(f"添加会员成功：{name} (ID:{user_id}) 到期:{expire}")
     except Exception:
         await update.message.reply_text("用法: /addmember user_id name expire(YYYY-MM-DD)")
@@ -24,8 +54,7 @@ async def add_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def del_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = int(context.args[0])
-        db = await get_db()
-        await db.execute("DELETE FROM members WHERE user_id=$1", user_id)
+        await hot_execute(Q_DELETE, user_id, update.effective_chat.id)
         await update.message.reply_text(f"已删除会员ID:{user_id}")
     except Exception:
         await update.message.reply_text("用法: /delmember user_id")
@@ -35,26 +64,177 @@ async def del_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def renew_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = int(context.args[0])
-        expire = context.args[1]
-        db = await get_db()
-        await db.execute("UPDATE members SET expire=$1 WHERE user_id=$2", expire, user_id)
+        expire = datetime.date.fromisoformat(context.args[1])
+        await hot_execute(Q_RENEW, expire, user_id, update.effective_chat.id)
         await update.message.reply_text(f"会员ID:{user_id} 已续费到 {expire}")
     except Exception:
         await update.message.reply_text("用法: /renewmember user_id expire(YYYY-MM-DD)")
 
-# 查询所有会员
+# 查询会员（分页）
+def _cursor(row):
+    # date.max 与 PostgreSQL 的 infinity 互相转换
+    return f"{row['k'].isoformat()}_{row['user_id']}"
+
 @admin_required
 async def list_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db = await get_db()
-    rows = await db.fetch("SELECT user_id, name, expire FROM members ORDER BY expire")
+    direction, cursor = None, ()
+    if update.callback_query:
+        # mem_<n|p>_<到期日>_<user_id>
+        direction, cursor = context.route.action, tuple(context.args)
+    rows, has_prev, has_next = await keyset_page(
+        Q_PAGE_FIRST, Q_PAGE_AFTER, Q_PAGE_BEFORE, (update.effective_chat.id,), direction, cursor)
     if not rows:
-        await update.message.reply_text("无会员。")
+        await send_page(update, "无会员。", None)
         return
-    lines = [f"{i+1}. {r['name']} (ID:{r['user_id']}) 到期:{r['expire']}" for i, r in enumerate(rows)]
-    await update.message.reply_text("\n".join(lines))
+    lines = [f"• {r['name']} (ID:{r['user_id']}) 到期:{r['expire_date']}" for r in rows]
+    markup = pager_markup(
+        f"mem_p_{_cursor(rows[0])}" if has_prev else None,
+        f"mem_n_{_cursor(rows[-1])}" if has_next else None,
+    )
+    await send_page(update, "\n".join(lines), markup)
+
+# ---------- CSV 批量导入/导出 ----------
+# 文件格式与导出一致：user_id,name,expire_date（表头可有可无，到期日为空表示不限期）
+# 导入：文件落到临时文件后逐行校验，分批 COPY 进临时表，最后一条 upsert 合并进 members，
+# 同一 user_id 出现多次时以最后一行为准。
+Q_IMPORT_MERGE = """
+INSERT INTO members(user_id, chat_id, name, expire_date)
+SELECT DISTINCT ON (user_id) user_id, $1, name, expire_date
+FROM members_import ORDER BY user_id, line DESC
+ON CONFLICT (user_id, chat_id) DO UPDATE SET name=EXCLUDED.name, expire_date=EXCLUDED.expire_date
+RETURNING (xmax = 0) AS inserted
+"""
+
+class ImportErrors:
+    # 导入的错误行：只保留前 limit 条用于回复，其余只计数，大文件全是错行时内存也不会涨
+    def __init__(self, limit=IMPORT_MAX_ERRORS):
+        self.limit = limit
+        self.items = []
+        self.count = 0
+
+    def add(self, line, error):
+        self.count += 1
+        if len(self.items) < self.limit:
+            self.items.append((line, error))
+
+def _parse_rows(path, errors):
+    # 逐行读取并校验，生成 (line, user_id, name, expire_date)；错误行记到 errors 里跳过
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            if not row or not any(c.strip() for c in row):
+                continue
+            if line == 1 and row[0].strip().lower() == "user_id":
+                continue
+            try:
+                if len(row) < 2:
+                    raise ValueError("至少需要 user_id,name 两列")
+                try:
+                    user_id = int(row[0])
+                except ValueError:
+                    raise ValueError(f"user_id 不是整数：{row[0]!r}")
+                name = row[1].strip()
+                if not name:
+                    raise ValueError("name 为空")
+                day = row[2].strip() if len(row) > 2 else ""
+                try:
+                    expire = datetime.date.fromisoformat(day) if day else None
+                except ValueError:
+                    raise ValueError(f"到期日格式应为 YYYY-MM-DD：{day!r}")
+            except ValueError as e:
+                errors.add(line, str(e))
+                continue
+            yield line, user_id, name, expire
+
+def _batches(rows, size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@admin_required
+async def import_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 用法：发送 CSV 文件并附言 /importmembers，或回复一个 CSV 文件发送 /importmembers
+    msg = update.message
+    doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    if doc is None:
+        await msg.reply_text("用法: 发送 CSV 文件（user_id,name,expire_date）并附言 /importmembers，"
+                             "或回复该文件发送 /importmembers")
+        return
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    errors = ImportErrors()
+    try:
+        try:
+            tg_file = await doc.get_file()
+            await tg_file.download_to_drive(path)
+        except TelegramError as e:
+            # 超过 Bot API 的 20MB 下载上限等
+            await msg.reply_text(f"导入失败：文件下载失败（{e.message}）。")
+            return
+        db = await get_db()
+        loaded = inserted = 0
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "CREATE TEMP TABLE members_import "
+                    "(line INTEGER, user_id BIGINT, name TEXT, expire_date DATE) ON COMMIT DROP"
+                )
+                for batch in _batches(_parse_rows(path, errors), IMPORT_BATCH):
+                    await conn.copy_records_to_table("members_import", records=batch)
+                    loaded += len(batch)
+                merged = await conn.fetch(Q_IMPORT_MERGE, update.effective_chat.id)
+        inserted = sum(1 for r in merged if r["inserted"])
+    except UnicodeDecodeError:
+        await msg.reply_text("导入失败：文件需为 UTF-8 编码的 CSV。")
+        return
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+        # 整个导入在一个事务里，失败时什么都没写入
+        print(f"导入会员失败（chat={update.effective_chat.id}）：{e!r}")
+        await msg.reply_text(f"导入失败，未写入任何数据：{type(e).__name__}: {str(e)[:500]}")
+        return
+    finally:
+        os.unlink(path)
+    lines = [
+        f"导入完成：有效 {loaded} 行，新增 {inserted}，更新 {len(merged) - inserted}，"
+        f"错误 {errors.count} 行，用时 {time.perf_counter() - started:.2f}s"
+    ]
+    lines += [f"第{line}行：{err}" for line, err in errors.items]
+    if errors.count > len(errors.items):
+        lines.append(f"……其余 {errors.count - len(errors.items)} 个错误未列出")
+    await msg.reply_text("\n".join(lines))
+
+# 导出：COPY ... TO 直接写临时文件再发送，数据不经过 Python 内存
+@admin_required
+async def export_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        db = await get_db()
+        async with db.acquire() as conn:
+            await conn.copy_from_query(
+                "SELECT user_id, name, expire_date FROM members WHERE chat_id=$1 "
+                "ORDER BY COALESCE(expire_date, 'infinity'::date), user_id",
+                chat_id, output=path, format="csv", header=True,
+            )
+        with open(path, "rb") as f:
+            await update.message.reply_document(f, filename=f"members_{chat_id}_{today_str()}.csv")
+    finally:
+        os.unlink(path)
 
 def register(application):
     application.add_handler(CommandHandler("addmember", add_member))
     application.add_handler(CommandHandler("delmember", del_member))
     application.add_handler(CommandHandler("renewmember", renew_member))
     application.add_handler(CommandHandler("listmembers", list_members))
+    router.add("mem_n", list_members, datetime.date.fromisoformat, int)
+    router.add("mem_p", list_members, datetime.date.fromisoformat, int)
+    application.add_handler(CommandHandler("importmembers", import_members))
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/importmembers(@\w+)?\b"), import_members))
+    application.add_handler(CommandHandler("exportmembers", export_members))
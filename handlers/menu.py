@@ -1,5 +1,6 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import CommandHandler, ContextTypes
+from callbacks import router
 from utils import is_admin
 
 def main_menu_markup(page=1):
@@ -50,10 +51,8 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(update, "callback_query") and update.callback_query:
         cb = update.callback_query
         await cb.answer()
-        if cb.data == "main_menu_2":
+        if context.args == ["2"]:
             page = 2
-        elif cb.data == "main_menu_1":
-            page = 1
         await cb.edit_message_text(txt, reply_markup=main_menu_markup(page), parse_mode='HTML')
     else:
         await update.message.reply_text(txt, reply_markup=main_menu_markup(page), parse_mode='HTML')
@@ -64,7 +63,8 @@ async def handle_menu_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE
         "• 会员每日可通过发送“打卡”完成签到。\n"
         "• /today_checkins 查看今日已打卡名单。\n"
         "• 发送地区名可查该地区今日打卡情况。\n"
-        "• 管理员可在会员管理菜单查看更多打卡统计。"
+        "• /mystats 查看自己的累计、连续和本月打卡统计。\n"
+        "• /checkin_rank 查看本群打卡排行（可加 month / total / streak）。"
     )
     if hasattr(update, "callback_query") and update.callback_query:
         cb = update.callback_query
@@ -77,5 +77,5 @@ def register(application):
     application.add_handler(CommandHandler("start", show_main_menu))
     application.add_handler(CommandHandler("menu", show_main_menu))
     application.add_handler(CommandHandler("help", show_main_menu))
-    application.add_handler(CallbackQueryHandler(show_main_menu, pattern="^main_menu_[12]$"))
-    application.add_handler(CallbackQueryHandler(handle_menu_checkin, pattern="^menu_checkin$"))
+    router.add("main_menu", show_main_menu)
+    router.add("menu_checkin", handle_menu_checkin)
@@ -2,14 +2,59 @@ from telegram import (
     InlineKeyboardButton, InlineKeyboardMarkup, Update,
     InputMediaPhoto, InputMediaVideo, InputMediaDocument
 )
-from telegram.ext import (
-    CallbackQueryHandler, MessageHandler, filters, ConversationHandler, ContextTypes
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, MessageHandler, filters, ContextTypes
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+import asyncio
+import json
+import os
+from utils import get_db, admin_required, hot_fetch, hot_fetchrow, hot_execute, hot_query, listen
+from callbacks import router
+from dispatcher import ScheduleDispatcher
+from leader import leader, shard_of
+from metrics import SCHEDULE_LAG
+from outbound import SCHEDULED
+
+SCHEDULE_CONCURRENCY = int(os.environ.get("SCHEDULE_CONCURRENCY", "8"))
+# 停机期间错过的定时：catchup 启动后立即补发一次（不论错过几次），skip 不补发；都按原来的节奏继续
+SCHEDULE_MISSED = os.environ.get("SCHEDULE_MISSED", "catchup")
+SCHEDULE_CATCHUP_WINDOW = timedelta(minutes=int(os.environ.get("SCHEDULE_CATCHUP_WINDOW", "60")))  # 错过更久的不补发
+ALBUM_MAX = 10  # Telegram 一个相册最多 10 个
+ALBUM_WAIT = float(os.environ.get("ALBUM_WAIT", "1.5"))  # 秒：相册的各条消息分开到达，最后一条之后等这么久再保存
+
+Q_GET = hot_query("schedule_get", "SELECT * FROM scheduled_message WHERE chat_id=$1 AND id=$2")
+Q_GET_ID = hot_query("schedule_get_id", "SELECT * FROM scheduled_message WHERE id=$1")
+# 本实例分片内还会再触发的定时：next_run_at 为空且运行过的是已过有效期的，不再加载
+Q_ENABLED = hot_query(
+    "schedule_enabled",
+    "SELECT * FROM scheduled_message WHERE enabled=TRUE AND interval > 0 "
+    "AND (next_run_at IS NOT NULL OR last_run_at IS NULL) AND ((chat_id % $1) + $1) % $1 = ANY($2::bigint[])"
+)
+Q_SET_RUN = hot_query(
+    "schedule_set_run",
+    "UPDATE scheduled_message SET last_msg_ids=COALESCE($1::bigint[], last_msg_ids), last_run_at=$2, next_run_at=$3 "
+    "WHERE chat_id=$4 AND id=$5"
 )
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, time
-from utils import get_db, is_admin
+Q_SET_NEXT = hot_query(
+    "schedule_set_next",
+    "UPDATE scheduled_message s SET next_run_at=v.t FROM unnest($1::int[], $2::timestamp[]) AS v(id, t) WHERE s.id=v.id"
+)
+
+_bot = None
 
-scheduler = AsyncIOScheduler()
+async def _fire_schedule(key, planned):
+    chat_id, sid = key
+    msg_ids = None
+    try:
+        msg_ids = await send_cron_message(chat_id, sid, _bot)
+        if msg_ids:
+            SCHEDULE_LAG.observe((datetime.now() - planned).total_seconds())
+    finally:
+        # 运行状态和这次发出的消息ID一起回写，一次更新
+        await hot_execute(Q_SET_RUN, msg_ids, planned, dispatcher.next_time(key), chat_id, sid)
+
+dispatcher = ScheduleDispatcher(_fire_schedule, concurrency=SCHEDULE_CONCURRENCY)
 
 def get_schedule_list_markup(schedules):
     keyboard = []
@@ -22,30 +67,35 @@ def get_schedule_list_markup(schedules):
     keyboard.append([InlineKeyboardButton("⬅️ 返回", callback_data="main_menu")])
     return InlineKeyboardMarkup(keyboard)
 
-async def show_schedule_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
+async def show_schedule_list(update: Update, context: ContextTypes.DEFAULT_TYPE, notice=None):
     chat_id = update.effective_chat.id
-    if not is_admin(user_id):
-        await update.callback_query.answer()
-        await update.callback_query.edit_message_text("只有管理员才能操作。")
-        return
     db = await get_db()
     async with db.acquire() as conn:
         rows = await conn.fetch("SELECT * FROM scheduled_message WHERE chat_id=$1 ORDER BY id", chat_id)
     schedules = [dict(r) for r in rows]
-    await update.callback_query.answer()
+    await update.callback_query.answer(notice)
     await update.callback_query.edit_message_text(
         "所有定时消息：", reply_markup=get_schedule_list_markup(schedules)
     )
 
+def media_items(s):
+    # [(类型, file_id), ...]；旧数据只有 media/media_type
+    if s['media_items']:
+        return [tuple(item) for item in json.loads(s['media_items'])]
+    if s['media'] and s['media_type']:
+        return [(s['media_type'], s['media'])]
+    return []
+
 def get_schedule_status_text(s):
+    items = media_items(s)
+    media_label = f"相册 {len(items)} 个" if len(items) > 1 else (s['media_type'] or '--')
     detail = (
         f"🕰️ <b>定时消息</b> [ID:{s['id']}]\n\n"
         f"状态: {'✅开启' if s['enabled'] else '❌关闭'}\n"
         f"重复: 每{s['interval']}分钟\n"
         f"删除上一条: {'✅' if s['del_prev'] else '❌'}\n"
         f"置顶: {'✅' if s['pin'] else '❌'}\n"
-        f"媒体: {'✅' if s['media'] else '❌'}（{s['media_type'] or '--'}）\n"
+        f"媒体: {'✅' if items else '❌'}（{media_label}）\n"
         f"按钮: {'✅' if s['button'] else '❌'}\n"
         f"时段: {s['period'] or '全天'}\n"
         f"有效期: {s['start_date'] or '--'} ~ {s['end_date'] or '--'}\n"
@@ -74,45 +124,27 @@ def schedule_detail_markup(s):
     return InlineKeyboardMarkup(keyboard)
 
 async def get_schedule(chat_id, sid):
-    db = await get_db()
-    async with db.acquire() as conn:
-        s = await conn.fetchrow("SELECT * FROM scheduled_message WHERE chat_id=$1 AND id=$2", chat_id, sid)
+    s = await hot_fetchrow(Q_GET, chat_id, sid)
     return dict(s) if s else None
 
+async def edit_schedule_detail(query, s):
+    text, markup = get_schedule_status_text(s), schedule_detail_markup(s)
+    media_cls = ALBUM_TYPES.get(s['media_type'])
+    if s['media'] and media_cls:
+        await query.edit_message_media(media=media_cls(s['media'], caption=text, parse_mode="HTML"), reply_markup=markup)
+    else:
+        await query.edit_message_text(text, reply_markup=markup, parse_mode="HTML")
+
 async def show_schedule_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    sid = int(update.callback_query.data.split('_')[-1])
-    if not is_admin(user_id):
-        await update.callback_query.answer()
-        await update.callback_query.edit_message_text("只有管理员才能操作。")
-        return
+    sid = context.args[0]
     s = await get_schedule(chat_id, sid)
+    if s is None:
+        # 已被其他管理员/实例删除：提示并回到列表
+        await show_schedule_list(update, context, "该定时消息已删除")
+        return
     await update.callback_query.answer()
-    if s['media']:
-        if s['media_type'] == "photo":
-            await update.callback_query.edit_message_media(
-                media=InputMediaPhoto(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        elif s['media_type'] == "video":
-            await update.callback_query.edit_message_media(
-                media=InputMediaVideo(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        elif s['media_type'] == "document":
-            await update.callback_query.edit_message_media(
-                media=InputMediaDocument(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        else:
-            await update.callback_query.edit_message_text(
-                get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-            )
-    else:
-        await update.callback_query.edit_message_text(
-            get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-        )
+    await edit_schedule_detail(update.callback_query, s)
 
 async def create_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
@@ -126,400 +158,471 @@ async def create_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def delete_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    sid = int(update.callback_query.data.split('_')[-1])
+    sid = context.args[0]
     db = await get_db()
     async with db.acquire() as conn:
         await conn.execute("DELETE FROM scheduled_message WHERE chat_id=$1 AND id=$2", chat_id, sid)
     await show_schedule_list(update, context)
-    await reload_cron_jobs(context)
+    await reconcile(sid)
+
+# 开关类按钮：动作 -> (字段, 值)
+TOGGLES = {
+    "enable": ("enabled", True),
+    "disable": ("enabled", False),
+    "delprev_yes": ("del_prev", True),
+    "delprev_no": ("del_prev", False),
+    "pin_yes": ("pin", True),
+    "pin_no": ("pin", False),
+}
 
 async def toggle_switch(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    parts = update.callback_query.data.split('_')
-    action, sid = '_'.join(parts[:-1]), int(parts[-1])
+    sid = context.args[0]
+    column, value = TOGGLES[context.route.action]
     db = await get_db()
     async with db.acquire() as conn:
-        if action == "schedule_enable":
-            await conn.execute("UPDATE scheduled_message SET enabled=TRUE WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        elif action == "schedule_disable":
-            await conn.execute("UPDATE scheduled_message SET enabled=FALSE WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        elif action == "schedule_delprev_yes":
-            await conn.execute("UPDATE scheduled_message SET del_prev=TRUE WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        elif action == "schedule_delprev_no":
-            await conn.execute("UPDATE scheduled_message SET del_prev=FALSE WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        elif action == "schedule_pin_yes":
-            await conn.execute("UPDATE scheduled_message SET pin=TRUE WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        elif action == "schedule_pin_no":
-            await conn.execute("UPDATE scheduled_message SET pin=FALSE WHERE chat_id=$1 AND id=$2", chat_id, sid)
+        await conn.execute(f"UPDATE scheduled_message SET {column}=$1 WHERE chat_id=$2 AND id=$3", value, chat_id, sid)
     s = await get_schedule(chat_id, sid)
-    if s['media']:
-        if s['media_type'] == "photo":
-            await update.callback_query.edit_message_media(
-                media=InputMediaPhoto(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        elif s['media_type'] == "video":
-            await update.callback_query.edit_message_media(
-                media=InputMediaVideo(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        elif s['media_type'] == "document":
-            await update.callback_query.edit_message_media(
-                media=InputMediaDocument(s['media'], caption=get_schedule_status_text(s), parse_mode="HTML"),
-                reply_markup=schedule_detail_markup(s)
-            )
-        else:
-            await update.callback_query.edit_message_text(
-                get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-            )
-    else:
-        await update.callback_query.edit_message_text(
-            get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-        )
-    await reload_cron_jobs(context)
-
-(EDIT_TEXT, EDIT_MEDIA, EDIT_BUTTON, EDIT_INTERVAL, EDIT_PERIOD, EDIT_START, EDIT_END) = range(200, 207)
-
-async def edit_text_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
+    # 先更新调度，界面编辑失败（如内容没变的 BadRequest）也不影响
+    await reconcile(sid)
+    if s is None:
+        await show_schedule_list(update, context, "该定时消息已删除")
+        return
     await update.callback_query.answer()
-    await update.callback_query.edit_message_text("请发送新的文本内容（支持多行）。")
-    return EDIT_TEXT
+    await edit_schedule_detail(update.callback_query, s)
 
-async def edit_text_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    text = update.message.text
-    db = await get_db()
-    async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET text=$1 WHERE chat_id=$2 AND id=$3", text, chat_id, sid)
-    await update.message.reply_text("文本已更新。")
-    s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-    )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
+# 修改定时消息：七个字段共用一个状态机。点"修改xx"按钮后把 (字段, sid) 按群记在 user_data 里，
+# 该管理员在本群发的下一条消息按字段解析并保存；格式错误时提示并保持等待。
+def _parse_button(text):
+    buttons = []
+    for l in text.strip().splitlines():
+        if "|" in l: btn, url = l.split("|",1); buttons.append({"text":btn.strip(),"url":url.strip()})
+    return json.dumps(buttons, ensure_ascii=False)
 
-async def edit_media_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
-    await update.callback_query.answer()
-    await update.callback_query.edit_message_text("请发送图片、视频或文件（支持jpg/png/gif/mp4/pdf/doc/xls/zip等）或回复要用的多媒体消息。")
-    return EDIT_MEDIA
+def _parse_interval(text):
+    interval = int(text.strip())
+    if interval <= 0:
+        raise ValueError(text)
+    return interval
 
-async def edit_media_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    db = await get_db()
-    media_type = None
-    file_id = None
-    if update.message.photo:
-        file_id = update.message.photo[-1].file_id
-        media_type = "photo"
-    elif update.message.video:
-        file_id = update.message.video.file_id
-        media_type = "video"
-    elif update.message.document:
-        file_id = update.message.document.file_id
-        mime = update.message.document.mime_type or ""
-        if mime.startswith("image/"):
-            media_type = "photo"
-        elif mime.startswith("video/"):
-            media_type = "video"
-        else:
-            media_type = "document"
-    else:
-        await update.message.reply_text("请发送图片、视频或文件。")
-        return EDIT_MEDIA
+def _parse_date(text):
+    return datetime.strptime(text.strip(), "%Y-%m-%d").date()
 
-    async with db.acquire() as conn:
-        await conn.execute(
-            "UPDATE scheduled_message SET media=$1, media_type=$2 WHERE chat_id=$3 AND id=$4",
-            file_id, media_type, chat_id, sid
-        )
+EditField = namedtuple("EditField", ["column", "prompt", "parse", "done", "error"])
+EDIT_FIELDS = {
+    "text": EditField("text", "请发送新的文本内容（支持多行）。", lambda t: t, "文本已更新。", None),
+    "media": EditField(
+        "media", "请发送图片、视频或文件（支持jpg/png/gif/mp4/pdf/doc/xls/zip等）或回复要用的多媒体消息。"
+                 f"一次发送多张（相册，最多{ALBUM_MAX}个）则按相册整组发送。",
+        None, "多媒体内容已更新。", "请发送图片、视频或文件。"),
+    "button": EditField("button", "请发送按钮文本和链接（如：按钮名|https://xxx.com），多行可多个。",
+                        _parse_button, "按钮已更新。", None),
+    "interval": EditField("interval", "请输入重复间隔，单位分钟（如60）。",
+                          _parse_interval, "重复间隔已更新。", "格式错误，请输入正整数。"),
+    "period": EditField("period", "请输入时段（如08:00-20:00），多段用逗号隔开，如08:00-12:00,14:00-18:00。",
+                        str.strip, "时段已更新。", None),
+    "start": EditField("start_date", "请输入开始日期（YYYY-MM-DD）。",
+                       _parse_date, "开始日期已更新。", "格式错误，请输入YYYY-MM-DD格式。"),
+    "end": EditField("end_date", "请输入终止日期（YYYY-MM-DD）。",
+                     _parse_date, "终止日期已更新。", "格式错误，请输入YYYY-MM-DD格式。"),
+}
+EDIT_KEY = "schedule_edit"  # user_data[EDIT_KEY] = {chat_id: (字段, sid)}
 
-    await update.message.reply_text("多媒体内容已更新。")
-    s = await get_schedule(chat_id, sid)
-    if media_type == "photo":
-        await update.message.reply_photo(file_id, caption=get_schedule_status_text(s), parse_mode="HTML",
-                                        reply_markup=schedule_detail_markup(s))
-    elif media_type == "video":
-        await update.message.reply_video(file_id, caption=get_schedule_status_text(s), parse_mode="HTML",
-                                        reply_markup=schedule_detail_markup(s))
-    elif media_type == "document":
-        await update.message.reply_document(file_id, caption=get_schedule_status_text(s), parse_mode="HTML",
-                                           reply_markup=schedule_detail_markup(s))
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
-
-async def edit_button_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
+async def edit_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    field, sid = context.args
+    if field not in EDIT_FIELDS:
+        await update.callback_query.answer()
+        return
+    context.user_data.setdefault(EDIT_KEY, {})[update.effective_chat.id] = (field, sid)
     await update.callback_query.answer()
-    await update.callback_query.edit_message_text(
-        "请发送按钮文本和链接（如：按钮名|https://xxx.com），多行可多个。")
-    return EDIT_BUTTON
+    await update.callback_query.edit_message_text(EDIT_FIELDS[field].prompt)
 
-async def edit_button_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    lines = update.message.text.strip().splitlines()
-    buttons = []
-    for l in lines:
-        if "|" in l: btn, url = l.split("|",1); buttons.append({"text":btn.strip(),"url":url.strip()})
-    import json
-    btn_json = json.dumps(buttons, ensure_ascii=False)
-    db = await get_db()
-    async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET button=$1 WHERE chat_id=$2 AND id=$3", btn_json, chat_id, sid)
-    await update.message.reply_text("按钮已更新。")
-    s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-    )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
+def pending_edit(context, chat_id):
+    if context.user_data is None:
+        return None
+    return context.user_data.get(EDIT_KEY, {}).get(chat_id)
 
-async def edit_interval_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
-    await update.callback_query.answer()
-    await update.callback_query.edit_message_text("请输入重复间隔，单位分钟（如60）。")
-    return EDIT_INTERVAL
+def _message_media(message):
+    if message.photo:
+        return message.photo[-1].file_id, "photo"
+    if message.video:
+        return message.video.file_id, "video"
+    if message.document:
+        mime = message.document.mime_type or ""
+        if mime.startswith("image/"):
+            return message.document.file_id, "photo"
+        if mime.startswith("video/"):
+            return message.document.file_id, "video"
+        return message.document.file_id, "document"
+    return None, None
 
-async def edit_interval_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def edit_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 返回 True 表示这条消息是待保存修改的回复（已保存、已提示格式错误或已收进相册）
     chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    try:
-        interval = int(update.message.text.strip())
-        assert interval > 0
-    except:
-        await update.message.reply_text("格式错误，请输入正整数。")
-        return EDIT_INTERVAL
-    db = await get_db()
-    async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET interval=$1 WHERE chat_id=$2 AND id=$3", interval, chat_id, sid)
-    await update.message.reply_text("重复间隔已更新。")
-    s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-    )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
+    pending = pending_edit(context, chat_id)
+    if pending is None:
+        return False
+    field, sid = pending
+    edit = EDIT_FIELDS[field]
+    message = update.message
+    if field == "media":
+        file_id, media_type = _message_media(message)
+        if file_id is None:
+            return False
+        if message.media_group_id:
+            _album_part(context, chat_id, sid, message, (media_type, file_id))
+            return True
+        sql, params = _media_update([(media_type, file_id)], chat_id, sid)
+    else:
+        if not message.text or message.text.startswith("/"):
+            return False
+        try:
+            value = edit.parse(message.text)
+        except ValueError:
+            await message.reply_text(edit.error)
+            return True
+        sql, params = (f"UPDATE scheduled_message SET {edit.column}=$1 WHERE chat_id=$2 AND id=$3",
+                       (value, chat_id, sid))
+    await _apply_edit(message, context, field, sid, sql, params)
+    return True
 
-async def edit_period_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
-    await update.callback_query.answer()
-    await update.callback_query.edit_message_text(
-        "请输入时段（如08:00-20:00），多段用逗号隔开，如08:00-12:00,14:00-18:00。")
-    return EDIT_PERIOD
+def _media_update(items, chat_id, sid):
+    media_type, file_id = items[0]
+    return ("UPDATE scheduled_message SET media=$1, media_type=$2, media_items=$3::jsonb WHERE chat_id=$4 AND id=$5",
+            (file_id, media_type, json.dumps(items), chat_id, sid))
 
-async def edit_period_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    period = update.message.text.strip()
+async def _apply_edit(message, context, field, sid, sql, params):
+    chat_id = message.chat_id
     db = await get_db()
     async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET period=$1 WHERE chat_id=$2 AND id=$3", period, chat_id, sid)
-    await update.message.reply_text("时段已更新。")
+        await conn.execute(sql, *params)
+    del context.user_data[EDIT_KEY][chat_id]
+    if not context.user_data[EDIT_KEY]:
+        del context.user_data[EDIT_KEY]
+    await message.reply_text(EDIT_FIELDS[field].done)
     s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-    )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
+    caption = get_schedule_status_text(s)
+    markup = schedule_detail_markup(s)
+    if field == "media" and s['media_type'] == "photo":
+        await message.reply_photo(s['media'], caption=caption, parse_mode="HTML", reply_markup=markup)
+    elif field == "media" and s['media_type'] == "video":
+        await message.reply_video(s['media'], caption=caption, parse_mode="HTML", reply_markup=markup)
+    elif field == "media":
+        await message.reply_document(s['media'], caption=caption, parse_mode="HTML", reply_markup=markup)
+    else:
+        await message.reply_text(caption, reply_markup=markup, parse_mode="HTML")
+    await reconcile(sid)
 
-async def edit_start_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
-    await update.callback_query.answer()
-    await update.callback_query.edit_message_text("请输入开始日期（YYYY-MM-DD）。")
-    return EDIT_START
+# 正在接收的相册：(chat_id, media_group_id) -> [第一条消息, 各项, 定时器, sid]。
+# 相册的每张图是一条单独的消息，收到最后一条 ALBUM_WAIT 秒后整组保存
+_albums = {}
 
-async def edit_start_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
-    try:
-        val = update.message.text.strip()
-        datetime.strptime(val, "%Y-%m-%d")
-    except:
-        await update.message.reply_text("格式错误，请输入YYYY-MM-DD格式。")
-        return EDIT_START
-    db = await get_db()
-    async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET start_date=$1 WHERE chat_id=$2 AND id=$3", val, chat_id, sid)
-    await update.message.reply_text("开始日期已更新。")
-    s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
+def _album_part(context, chat_id, sid, message, item):
+    key = (chat_id, message.media_group_id)
+    album = _albums.get(key)
+    if album is None:
+        album = _albums[key] = [message, [], None, sid]
+    else:
+        album[2].cancel()
+    album[1].append(item)
+    album[2] = asyncio.get_running_loop().call_later(
+        ALBUM_WAIT, lambda: asyncio.ensure_future(_album_done(context, key))
     )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
 
-async def edit_end_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sid = int(update.callback_query.data.split('_')[-1])
-    context.user_data["sid"] = sid
-    await update.callback_query.answer()
-    await update.callback_query.edit_message_text("请输入终止日期（YYYY-MM-DD）。")
-    return EDIT_END
-
-async def edit_end_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    sid = context.user_data["sid"]
+async def _album_done(context, key):
+    message, items, _, sid = _albums.pop(key)
     try:
-        val = update.message.text.strip()
-        datetime.strptime(val, "%Y-%m-%d")
-    except:
-        await update.message.reply_text("格式错误，请输入YYYY-MM-DD格式。")
-        return EDIT_END
-    db = await get_db()
-    async with db.acquire() as conn:
-        await conn.execute("UPDATE scheduled_message SET end_date=$1 WHERE chat_id=$2 AND id=$3", val, chat_id, sid)
-    await update.message.reply_text("终止日期已更新。")
-    s = await get_schedule(chat_id, sid)
-    await update.message.reply_text(
-        get_schedule_status_text(s), reply_markup=schedule_detail_markup(s), parse_mode="HTML"
-    )
-    await reload_cron_jobs(update)
-    return ConversationHandler.END
+        docs = sum(1 for media_type, _ in items if media_type == "document")
+        if docs and docs != len(items):
+            # Telegram 的相册里文件不能和图片/视频混在一起
+            await message.reply_text("文件不能和图片/视频放在同一个相册里，请重新发送。")
+            return
+        await _apply_edit(message, context, "media", sid, *_media_update(items[:ALBUM_MAX], message.chat_id, sid))
+        # 保存发生在更新处理完之后，让持久化把清掉的编辑状态也写回
+        context.application.mark_data_for_update_persistence(user_ids=message.from_user.id)
+    except Exception as e:
+        print(f"定时消息ID{sid}保存相册失败：{e}")
 
-def in_period(period_str, now=None):
-    if not period_str:
-        return True
-    if now is None:
-        now = datetime.now().time()
-    for p in period_str.split(','):
+async def edit_media_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 文本回复由文本分类阶段处理，这里只接图片/视频/文件
+    if await edit_save(update, context):
+        raise ApplicationHandlerStop
+
+def parse_period(period_str):
+    # "08:00-12:00,14:00-18:00" -> ((time(8), time(12)), (time(14), time(18)))，格式错误的段忽略
+    windows = []
+    for p in (period_str or '').split(','):
         p = p.strip()
         if not p: continue
         try:
             start, end = p.split('-')
-            start = time.fromisoformat(start.strip())
-            end = time.fromisoformat(end.strip())
-            if start <= now <= end:
-                return True
+            windows.append((time.fromisoformat(start.strip()), time.fromisoformat(end.strip())))
         except Exception:
             continue
+    return tuple(windows)
+
+def in_windows(windows, now):
+    for start, end in windows:
+        if start <= now <= end:
+            return True
     return False
 
-async def reload_cron_jobs(context):
-    scheduler.remove_all_jobs()
-    db = await get_db()
-    async with db.acquire() as conn:
-        rows = await conn.fetch("SELECT * FROM scheduled_message WHERE enabled=TRUE")
+def in_period(period_str, now=None):
+    if not period_str:
+        return True
+    if now is None:
+        now = datetime.now().time()
+    return in_windows(parse_period(period_str), now)
+
+def build_button_markup(button_json):
+    if not button_json:
+        return None
+    try:
+        blist = json.loads(button_json)
+        buttons = []
+        for b in blist:
+            buttons.append([InlineKeyboardButton(b['text'], url=b['url'])])
+        return InlineKeyboardMarkup(buttons)
+    except:
+        return None
+
+# 各发送函数返回这次发出的消息列表
+async def _send_text(bot, p):
+    return [await bot.send_message(p.chat_id, p.text, reply_markup=p.reply_markup, rate_limit_args=SCHEDULED)]
+
+async def _send_photo(bot, p):
+    return [await bot.send_photo(p.chat_id, p.media, caption=p.text, reply_markup=p.reply_markup, rate_limit_args=SCHEDULED)]
+
+async def _send_video(bot, p):
+    return [await bot.send_video(p.chat_id, p.media, caption=p.text, reply_markup=p.reply_markup, rate_limit_args=SCHEDULED)]
+
+async def _send_document(bot, p):
+    return [await bot.send_document(p.chat_id, p.media, caption=p.text, reply_markup=p.reply_markup, rate_limit_args=SCHEDULED)]
+
+async def _send_album(bot, p):
+    # 整组一次 sendMediaGroup；相册不能带按钮，有按钮时文本和按钮另发一条
+    msgs = list(await bot.send_media_group(p.chat_id, p.album, rate_limit_args=SCHEDULED))
+    if p.reply_markup and p.text:
+        msgs.append(await bot.send_message(p.chat_id, p.text, reply_markup=p.reply_markup, rate_limit_args=SCHEDULED))
+    return msgs
+
+MEDIA_SENDERS = {"photo": _send_photo, "video": _send_video, "document": _send_document}
+ALBUM_TYPES = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+
+def build_album(items, caption):
+    return tuple(
+        ALBUM_TYPES[media_type](file_id, caption=caption if i == 0 else None)
+        for i, (media_type, file_id) in enumerate(items)
+    )
+
+# 编译好的发送计划：时段、日期范围、按钮都已解析好，定时触发时直接使用
+SendPlan = namedtuple("SendPlan", [
+    "version", "chat_id", "sid", "text", "media", "album", "send", "reply_markup",
+    "windows", "all_day", "start_date", "end_date", "interval", "del_prev", "pin",
+])
+
+def compile_plan(row, version=0):
+    if not row or not row['enabled']:
+        return None
+    items = media_items(row)
+    if any(media_type not in MEDIA_SENDERS for media_type, _ in items):
+        return None
+    reply_markup = build_button_markup(row['button'])
+    album = None
+    if len(items) > 1:
+        send = _send_album
+        album = build_album(items, None if reply_markup else row['text'])
+    elif items:
+        send = MEDIA_SENDERS[items[0][0]]
+    else:
+        send = _send_text
+    return SendPlan(
+        version=version,
+        chat_id=row['chat_id'],
+        sid=row['id'],
+        text=row['text'],
+        media=items[0][1] if items else None,
+        album=album,
+        send=send,
+        reply_markup=reply_markup,
+        windows=parse_period(row['period']),
+        all_day=not row['period'],
+        start_date=row['start_date'],
+        end_date=row['end_date'],
+        interval=row['interval'],
+        del_prev=bool(row['del_prev']),
+        pin=bool(row['pin']),
+    )
+
+def plan_active(plan, now):
+    if plan.start_date and now.date() < plan.start_date:
+        return False
+    if plan.end_date and now.date() > plan.end_date:
+        return False
+    return plan.all_day or in_windows(plan.windows, now.time())
+
+# 发送计划缓存：sid -> SendPlan（已关闭的定时为 None）。
+# 只有编辑/开关定时消息时调用 invalidate_plan 使其失效，版本号防止并发加载写回旧数据。
+_plans = {}
+_plan_versions = {}
+_last_msg_ids = {}  # sid -> 上一次发出的消息ID列表
+
+def invalidate_plan(sid):
+    _plan_versions[sid] = _plan_versions.get(sid, 0) + 1
+    _plans.pop(sid, None)
+
+async def get_plan(chat_id, sid):
+    if sid in _plans:
+        return _plans[sid]
+    version = _plan_versions.get(sid, 0)
+    row = await hot_fetchrow(Q_GET, chat_id, sid)
+    plan = compile_plan(row, version)
+    if _plan_versions.get(sid, 0) == version:
+        _plans[sid] = plan
+        if row and sid not in _last_msg_ids:
+            _last_msg_ids[sid] = row['last_msg_ids']
+    return plan
+
+_scheduled = {}  # sid -> chat_id，本实例正在调度的定时消息
+
+def _timing(plan):
+    return (plan.interval, plan.windows, plan.start_date, plan.end_date)
+
+async def load_schedules(shards):
+    # 加载落在这些分片里的定时消息：沿用库里的 next_run_at 节奏，错过的按 SCHEDULE_MISSED 处理
+    now = datetime.now()
+    rows = await hot_fetch(Q_ENABLED, leader.shards, list(shards))
+    moved, caught_up = [], 0
     for row in rows:
+        sid = row["id"]
         try:
-            interval = row["interval"]
-            if not interval: continue
-            chat_id = row["chat_id"]
-            sid = row["id"]
-            scheduler.add_job(
-                send_cron_message,
-                'interval',
-                minutes=interval,
-                args=[chat_id, sid, context.bot],
-                id=f"cronmsg_{row['id']}",
-                replace_existing=True,
-            )
+            invalidate_plan(sid)
+            plan = _plans[sid] = compile_plan(row, _plan_versions[sid])
+            _last_msg_ids[sid] = row["last_msg_ids"]
+            if plan is None:
+                continue
+            key = (row["chat_id"], sid)
+            interval, windows, start_date, end_date = _timing(plan)
+            last_next = row["next_run_at"]
+            if last_next is None:
+                dispatcher.add(key, interval, windows=windows, start_date=start_date, end_date=end_date, anchor=now)
+            else:
+                dispatcher.add(key, interval, windows=windows, start_date=start_date, end_date=end_date,
+                               anchor=last_next, after=now)
+                if last_next <= now and SCHEDULE_MISSED == "catchup" and now - last_next <= SCHEDULE_CATCHUP_WINDOW:
+                    dispatcher.fire_now(key, now)
+                    caught_up += 1
+            _scheduled[sid] = row["chat_id"]
+            if dispatcher.next_time(key) != last_next:
+                moved.append((sid, dispatcher.next_time(key)))
         except Exception as e:
-            print(f"定时消息ID{row['id']}调度失败：{e}")
+            print(f"定时消息ID{sid}调度失败：{e}")
+    if moved:
+        await hot_execute(Q_SET_NEXT, [m[0] for m in moved], [m[1] for m in moved])
+    print(f"加载定时消息 {len(rows)} 条（分片 {sorted(shards)}），补发 {caught_up} 条，"
+          f"用时 {(datetime.now() - now).total_seconds():.3f}s")
+    return len(rows)
 
-async def send_cron_message(chat_id, sid, bot):
-    db = await get_db()
-    async with db.acquire() as conn:
-        s = await conn.fetchrow("SELECT * FROM scheduled_message WHERE chat_id=$1 AND id=$2", chat_id, sid)
-        if not s or not s['enabled']:
-            return
-        now = datetime.now()
-        if s['start_date'] and now.date() < s['start_date']:
-            return
-        if s['end_date'] and now.date() > s['end_date']:
-            return
-        if not in_period(s['period'], now.time()):
-            return
-        if s['del_prev'] and s.get('last_msg_id'):
-            try:
-                await bot.delete_message(chat_id, s['last_msg_id'])
-            except: pass
-        reply_markup = None
-        if s['button']:
-            import json
-            try:
-                blist = json.loads(s['button'])
-                buttons = []
-                for b in blist:
-                    buttons.append([InlineKeyboardButton(b['text'], url=b['url'])])
-                reply_markup = InlineKeyboardMarkup(buttons)
-            except:
-                pass
-        msg = None
-        if s['media'] and s['media_type']:
-            if s['media_type'] == "photo":
-                msg = await bot.send_photo(chat_id, s['media'], caption=s['text'], reply_markup=reply_markup)
-            elif s['media_type'] == "video":
-                msg = await bot.send_video(chat_id, s['media'], caption=s['text'], reply_markup=reply_markup)
-            elif s['media_type'] == "document":
-                msg = await bot.send_document(chat_id, s['media'], caption=s['text'], reply_markup=reply_markup)
+async def reconcile(sid):
+    # 某条定时消息的配置变了（本实例修改或收到通知）：只调整这一条的调度。
+    # 间隔/时段/有效期没变时保持原来的节奏，变了（或刚开启）时从现在起重新计时
+    invalidate_plan(sid)
+    version = _plan_versions[sid]
+    row = await hot_fetchrow(Q_GET_ID, sid)
+    chat_id = _scheduled.pop(sid, None)
+    if chat_id is not None and (row is None or row["chat_id"] != chat_id):
+        dispatcher.remove((chat_id, sid))
+    if row is None or not leader.owns(row["chat_id"]):
+        return
+    key = (row["chat_id"], sid)
+    plan = compile_plan(row, version)
+    if _plan_versions[sid] == version:
+        _plans[sid] = plan
+    if plan is None or not plan.interval:
+        dispatcher.remove(key)
+    else:
+        _scheduled[sid] = row["chat_id"]
+        timing = _timing(plan)
+        if dispatcher.timing(key) != timing:
+            interval, windows, start_date, end_date = timing
+            dispatcher.add(key, interval, windows=windows, start_date=start_date, end_date=end_date)
+    next_run = dispatcher.next_time(key)
+    if next_run != row["next_run_at"]:
+        await hot_execute(Q_SET_NEXT, [sid], [next_run])
+
+async def _on_leadership(gained, lost):
+    # 失去的分片停止调度；获得的分片从库里加载（易主期间其他实例可能发过消息，上一条消息ID以库里为准）
+    for sid, chat_id in list(_scheduled.items()):
+        if shard_of(chat_id, leader.shards) in lost:
+            dispatcher.remove((chat_id, sid))
+            del _scheduled[sid]
+            _plans.pop(sid, None)
+            _last_msg_ids.pop(sid, None)
+    if gained:
+        await load_schedules(gained)
+
+leader.on_change(_on_leadership)
+
+async def _on_schedule_changed(payload):
+    # payload 为修改过的定时消息 id，为空表示整表变更
+    try:
+        if payload:
+            await reconcile(int(payload))
         else:
-            msg = await bot.send_message(chat_id, s['text'], reply_markup=reply_markup)
-        if s['pin'] and msg:
-            try:
-                await bot.pin_chat_message(chat_id, msg.message_id, disable_notification=True)
-            except: pass
-        if msg:
-            await conn.execute("UPDATE scheduled_message SET last_msg_id=$1 WHERE chat_id=$2 AND id=$3", msg.message_id, chat_id, sid)
+            dispatcher.clear()
+            _scheduled.clear()
+            _plans.clear()
+            if leader.owned:
+                await load_schedules(leader.owned)
+    except Exception as e:
+        print(f"定时消息重新加载失败：{e}")
+
+listen("scheduled_message_changed", _on_schedule_changed, _plans.clear)
+
+async def start_scheduler(application):
+    global _bot
+    _bot = application.bot
+    dispatcher.start()
+    leader.start()  # 拿到分片后由 _on_leadership 加载定时消息
+
+async def stop_scheduler():
+    await leader.stop()
+    await dispatcher.stop()
+
+async def send_cron_message(chat_id, sid, bot):
+    plan = await get_plan(chat_id, sid)
+    if not plan or not plan_active(plan, datetime.now()):
+        return
+    last_ids = _last_msg_ids.get(sid)
+    if plan.del_prev and last_ids:
+        # 上一次的整组消息（相册 + 按钮）一次删掉
+        try:
+            await bot.delete_messages(chat_id, last_ids, rate_limit_args=SCHEDULED)
+        except TelegramError as e:
+            print(f"定时消息ID{sid}删除上一条失败：{e}")
+    msgs = await plan.send(bot, plan)
+    if plan.pin and msgs:
+        try:
+            await bot.pin_chat_message(chat_id, msgs[0].message_id, disable_notification=True,
+                                       rate_limit_args=SCHEDULED)
+        except TelegramError as e:
+            print(f"定时消息ID{sid}置顶失败：{e}")
+    if msgs:
+        ids = [m.message_id for m in msgs]
+        _last_msg_ids[sid] = ids
+        return ids
+
+EDIT_GROUP = -1  # 先于其他处理器处理待保存的媒体修改
 
 def register(application):
-    application.add_handler(CallbackQueryHandler(show_schedule_list, pattern="^menu_schedule$"))
-    application.add_handler(CallbackQueryHandler(show_schedule_detail, pattern="^schedule_detail_\\d+$"))
-    application.add_handler(CallbackQueryHandler(create_schedule, pattern="^schedule_create$"))
-    application.add_handler(CallbackQueryHandler(delete_schedule, pattern="^schedule_delete_\\d+$"))
-    application.add_handler(CallbackQueryHandler(toggle_switch,
-        pattern="^schedule_(enable|disable|delprev_yes|delprev_no|pin_yes|pin_no)_\\d+$"))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_text_entry, pattern="^schedule_edit_text_\\d+$")],
-        states={EDIT_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_text_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_media_entry, pattern="^schedule_edit_media_\\d+$")],
-        states={EDIT_MEDIA: [MessageHandler(
-            filters.PHOTO | filters.VIDEO | filters.Document.ALL, edit_media_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_button_entry, pattern="^schedule_edit_button_\\d+$")],
-        states={EDIT_BUTTON: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_button_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_interval_entry, pattern="^schedule_edit_interval_\\d+$")],
-        states={EDIT_INTERVAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_interval_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_period_entry, pattern="^schedule_edit_period_\\d+$")],
-        states={EDIT_PERIOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_period_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_start_entry, pattern="^schedule_edit_start_\\d+$")],
-        states={EDIT_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_start_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    application.add_handler(ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_end_entry, pattern="^schedule_edit_end_\\d+$")],
-        states={EDIT_END: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_end_save)]},
-        fallbacks=[],
-        per_chat=True
-    ))
-    # 不要在这里 scheduler.start()，只在主程序入口调用一次
+    router.add("menu_schedule", admin_required(show_schedule_list))
+    router.add("schedule_detail", admin_required(show_schedule_detail), int)
+    router.add("schedule_create", admin_required(create_schedule))
+    router.add("schedule_delete", admin_required(delete_schedule), int)
+    for action in TOGGLES:
+        router.add(f"schedule_{action}", admin_required(toggle_switch), int)
+    router.add("schedule_edit", admin_required(edit_entry), str, int)
+    application.add_handler(MessageHandler(
+        filters.UpdateType.MESSAGE & (filters.PHOTO | filters.VIDEO | filters.Document.ALL),
+        edit_media_save,
+    ), group=EDIT_GROUP)
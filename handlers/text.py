@@ -0,0 +1,43 @@
+from telegram import Update
+from telegram.ext import MessageHandler, ContextTypes, filters
+from regions import regions
+from utils import normalize_text
+from . import autoreply, checkin, schedule
+
+# 文本分类阶段：所有普通文本消息只进这一个处理器，规范化一次后按优先级判断一遍：
+# 未完成的编辑回复 > 打卡 > 地区名 > 自动回复关键词 > 都不是。
+# 全程只查内存（会话状态、地区索引、关键词自动机），"都不是"的消息除规范化后的字符串外不分配对象。
+OUTCOMES = ("conversation", "checkin", "region", "autoreply", "none")
+text_stats = dict.fromkeys(OUTCOMES, 0)
+
+CHECKIN_KEYWORD = normalize_text(checkin.CHECKIN_KEYWORD)
+
+async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    chat_id = message.chat_id
+    if schedule.pending_edit(context, chat_id) is not None and await schedule.edit_save(update, context):
+        text_stats["conversation"] += 1
+        return
+    norm = normalize_text(message.text)
+    if norm == CHECKIN_KEYWORD:
+        text_stats["checkin"] += 1
+        await checkin.checkin_message(update, context)
+        return
+    key = regions.match(chat_id, norm)
+    if key is not None:
+        text_stats["region"] += 1
+        await checkin.region_checkins(update, key)
+        return
+    hit = autoreply.matcher.search(norm)
+    if hit is not None:
+        text_stats["autoreply"] += 1
+        await message.reply_text(hit[1])
+        return
+    text_stats["none"] += 1
+
+def stats():
+    total = sum(text_stats.values())
+    return {"total": total, **text_stats}
+
+def register(application):
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, on_text))
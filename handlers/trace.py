@@ -0,0 +1,81 @@
+import os
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, CommandHandler, filters
+import tracing
+from utils import is_admin, reset_connections
+
+TRACE_USAGE = (
+    "/trace 查看跟踪状态和最近的慢更新\n"
+    "/trace on [慢更新ms] [慢查询ms] 打开跟踪\n"
+    "/trace off 关闭跟踪\n"
+    "/trace profile [秒] 用 cProfile 采样，结束后发回结果\n"
+    "（只影响收到命令的这个实例）"
+)
+
+def _status_text():
+    s = tracing.status()
+    text = (
+        f"跟踪：{'✅开启' if s['enabled'] else '❌关闭'}\n"
+        f"慢更新阈值 {s['slow_update_ms']:.0f}ms，慢查询阈值 {s['slow_query_ms']:.0f}ms\n"
+        f"已记录慢查询 {s['slow_queries']} 条"
+        f"{'，采样进行中' if s['profiling'] else ''}"
+    )
+    if tracing.recent:
+        text += "\n\n最近的慢更新：\n" + "\n".join(list(tracing.recent)[-5:])
+    return text[:4000]
+
+# 私聊命令：开关跟踪、采样
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("只有管理员才能操作。")
+        return
+    args = context.args
+    action = args[0].lower() if args else ""
+    if action == "on":
+        try:
+            values = [float(a) / 1000 for a in args[1:3]]
+        except ValueError:
+            await update.message.reply_text(TRACE_USAGE)
+            return
+        tracing.enable(*values)
+        await reset_connections()  # 连接重建时挂上查询日志
+        await update.message.reply_text(_status_text())
+    elif action == "off":
+        tracing.disable()
+        await reset_connections()
+        await update.message.reply_text(_status_text())
+    elif action == "profile":
+        try:
+            seconds = int(args[1]) if len(args) > 1 else 30
+        except ValueError:
+            await update.message.reply_text(TRACE_USAGE)
+            return
+        if tracing.profiling is not None:
+            await update.message.reply_text("已有采样进行中，请稍后再试。")
+            return
+        await update.message.reply_text(f"开始采样 {min(seconds, tracing.PROFILE_MAX)} 秒，期间机器人会变慢。")
+        # 不在处理器里等待：同一私聊的后续更新按顺序处理，会被挡住
+        context.application.create_task(_profile_and_reply(context.bot, update.effective_chat.id, seconds))
+    elif not action:
+        await update.message.reply_text(_status_text())
+    else:
+        await update.message.reply_text(TRACE_USAGE)
+
+async def _profile_and_reply(bot, chat_id, seconds):
+    try:
+        path, summary = await tracing.profile(seconds)
+    except Exception as e:
+        await bot.send_message(chat_id, f"采样失败：{e}")
+        return
+    print(f"cProfile 采样结果已写入 {path}")
+    try:
+        with open(path, "rb") as f:
+            await bot.send_document(chat_id, f, filename=os.path.basename(path),
+                                    caption=f"采样结果（完整 .prof 在服务器 {tracing.TRACE_DIR}/）")
+        await bot.send_message(chat_id, summary[-4000:])
+    except TelegramError as e:
+        print(f"发送采样结果失败：{e}")
+
+def register(application):
+    application.add_handler(CommandHandler("trace", trace_command, filters=filters.ChatType.PRIVATE))
@@ -0,0 +1,212 @@
+import asyncio
+import math
+import os
+import socket
+import time
+import asyncpg
+from utils import PG_URL, listen
+
+SCHEDULE_SHARDS = int(os.environ.get("SCHEDULE_SHARDS", "1"))      # 定时消息按 chat_id 分成几片，每片一把锁
+LEADER_MAX_SHARDS = int(os.environ.get("LEADER_MAX_SHARDS", "0"))  # 每个实例最多持有几片，0 为按在线实例数均分
+LEADER_RETRY = float(os.environ.get("LEADER_RETRY", "2"))         # 秒：抢锁/检查锁连接的间隔
+LEADER_LOCK = 7230002  # pg_try_advisory_lock(LEADER_LOCK, 分片号)；迁移用的是单参数锁，互不冲突
+MEMBER_LOCK = 7230003  # 每个在线实例持有 (MEMBER_LOCK, 0) 的共享锁，从 pg_locks 数出在线实例数
+LEADER_CHANNEL = "scheduler_leader"
+
+# 锁连接上让服务端尽快发现客户端失联（断网、宕机），锁随会话一起释放，其他实例才能接管
+KEEPALIVE_SETTINGS = {"tcp_keepalives_idle": "5", "tcp_keepalives_interval": "2", "tcp_keepalives_count": "3"}
+
+def shard_of(chat_id, shards=SCHEDULE_SHARDS):
+    return chat_id % shards
+
+# 多实例部署时用 PostgreSQL 会话级 advisory lock 决定谁来跑定时任务：每个分片一把锁，
+# 持有锁的实例负责 chat_id 落在该分片的定时消息；没拿到锁的实例照常处理更新。
+# 锁跟着专用连接走，实例退出或连接断开时自动释放：
+#   正常退出 —— 主动解锁并 NOTIFY，其他实例立即接管；
+#   进程崩溃 —— 连接被关闭，锁立即释放，其他实例在 LEADER_RETRY 秒内接管；
+#   网络中断 —— 本实例心跳超时（只限制锁连接上的查询，不含加载定时消息等回调）后先放弃分片，服务端靠 TCP keepalive 约 11 秒后释放锁。
+# 分片按在线实例数均分：实例增加时持有过多的实例交出多余分片，实例退出时剩下的实例分掉它的分片。
+class LeaderElector:
+    def __init__(self, shards=SCHEDULE_SHARDS, max_shards=LEADER_MAX_SHARDS, retry=LEADER_RETRY, dsn=PG_URL):
+        self.shards = shards
+        self.max_shards = max_shards
+        self.retry = retry
+        self.dsn = dsn
+        self.instance = f"{socket.gethostname()}:{os.getpid()}"
+        self.owned = set()     # 当前持有的分片
+        self._callbacks = []   # async callback(获得的分片, 失去的分片)
+        self._conn = None
+        self._task = None
+        self._notifier = None  # 串行执行分片变更回调的任务
+        self._changes = None   # 待执行的 (获得, 失去)
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self.instances = 0     # 最近一次看到的在线实例数
+        self.acquired = 0      # 累计获得/失去分片的次数
+        self.lost = 0
+        self.changed_at = None
+
+    def on_change(self, callback):
+        self._callbacks.append(callback)
+
+    def owns(self, chat_id):
+        return shard_of(chat_id, self.shards) in self.owned
+
+    def is_leader(self, shard=0):
+        return shard in self.owned
+
+    def wake(self, payload=None):
+        # 其他实例释放了锁（NOTIFY），马上重新抢
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._changes = asyncio.Queue()
+            self._notifier = asyncio.create_task(self._notify_loop())
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # wait_for 与 wake() 同时完成时取消可能被吞掉，靠标志位保证循环退出
+            self._stopping = True
+            self._wake.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 先停止调度（等回调处理完）再解锁，交接期间不会有两个实例同时调度同一分片
+        owned = bool(self.owned)
+        self._set_owned(set())
+        await self._settled()
+        if self._notifier is not None:
+            self._notifier.cancel()
+            self._notifier = None
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.remove_termination_listener(self._on_conn_lost)
+            try:
+                if owned:
+                    await asyncio.wait_for(self._release(conn), self.retry)
+                await conn.close(timeout=self.retry)
+            except Exception as e:
+                print(f"释放定时任务锁失败：{e!r}")
+                conn.terminate()
+
+    async def _run(self):
+        # 超时只限制锁连接上的查询（心跳、抢锁、解锁）；分片变更回调在 _notify_loop 里串行执行，
+        # 加载定时消息再慢也不会让心跳超时、把刚拿到的锁放掉
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                extra = await asyncio.wait_for(self._step(), self.retry)
+                if extra:
+                    # 有新实例加入：先等多出的分片停止调度，再解锁并通知
+                    await self._settled()
+                    await asyncio.wait_for(self._release(self._conn, extra), self.retry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"定时任务锁检查失败：{e!r}")
+                self._drop_connection()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.retry)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _step(self):
+        # 返回需要交出的分片（已从 owned 中去掉，由 _run 在回调处理完后解锁）
+        if self._conn is None:
+            conn = await asyncpg.connect(dsn=self.dsn, server_settings=KEEPALIVE_SETTINGS)
+            conn.add_termination_listener(self._on_conn_lost)
+            await conn.execute("SELECT pg_advisory_lock_shared($1, 0)", MEMBER_LOCK)
+            self._conn = conn
+        # 这条查询同时起心跳作用
+        self.instances = await self._conn.fetchval(
+            "SELECT count(*) FROM pg_locks WHERE locktype='advisory' AND classid=$1 AND objid=0 AND objsubid=2 AND granted",
+            MEMBER_LOCK
+        )
+        quota = self.max_shards or math.ceil(self.shards / max(self.instances, 1))
+        if len(self.owned) > quota:
+            extra = sorted(self.owned)[quota:]
+            self._set_owned(self.owned - set(extra))
+            return extra
+        want = quota - len(self.owned)
+        if want <= 0:
+            return None
+        free = [s for s in range(self.shards) if s not in self.owned]
+        rows = await self._conn.fetch(
+            "SELECT s FROM unnest($1::int[]) AS s WHERE pg_try_advisory_lock($2, s)", free, LEADER_LOCK
+        )
+        got = [r["s"] for r in rows]
+        if len(got) > want:
+            # 与其他实例同时抢时它们可能都扑空，放回的分片通知大家再抢一次
+            await self._release(self._conn, got[want:])
+            got = got[:want]
+        if got:
+            self._set_owned(self.owned | set(got))
+        return None
+
+    async def _release(self, conn, shards=None):
+        if shards is None:
+            await conn.execute("SELECT pg_advisory_unlock_all()")
+        else:
+            await conn.execute("SELECT pg_advisory_unlock($2, s) FROM unnest($1::int[]) AS s", shards, LEADER_LOCK)
+        await conn.execute("SELECT pg_notify($1, $2)", LEADER_CHANNEL, self.instance)
+
+    def _drop_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.remove_termination_listener(self._on_conn_lost)
+            conn.terminate()
+        self._set_owned(set())
+
+    def _on_conn_lost(self, conn):
+        # 锁连接断开：锁已随会话释放，立即停止调度，下一轮重连后重新抢
+        if conn is self._conn:
+            self._conn = None
+            self._set_owned(set())
+            self._wake.set()
+
+    def _set_owned(self, owned):
+        # owned 立即生效（owns/is_leader 马上反映），回调排队交给 _notify_loop 按顺序执行
+        gained, lost = owned - self.owned, self.owned - owned
+        if not gained and not lost:
+            return
+        self.owned = owned
+        self.acquired += len(gained)
+        self.lost += len(lost)
+        self.changed_at = time.time()
+        print(f"定时任务分片变更（{self.instance}）：获得 {sorted(gained)}，失去 {sorted(lost)}，"
+              f"当前持有 {sorted(owned)}/{self.shards}")
+        if self._changes is not None:
+            self._changes.put_nowait((gained, lost))
+
+    async def _notify_loop(self):
+        while True:
+            gained, lost = await self._changes.get()
+            try:
+                for callback in self._callbacks:
+                    try:
+                        await callback(gained, lost)
+                    except Exception as e:
+                        print(f"定时任务分片变更处理失败：{e!r}")
+            finally:
+                self._changes.task_done()
+
+    async def _settled(self):
+        # 等已排队的分片变更回调都执行完
+        if self._changes is not None and self._notifier is not None:
+            await self._changes.join()
+
+    def stats(self):
+        return {
+            "instance": self.instance, "instances": self.instances, "shards": self.shards, "owned": sorted(self.owned),
+            "acquired": self.acquired, "lost": self.lost, "changed_at": self.changed_at,
+            "connected": self._conn is not None,
+        }
+
+leader = LeaderElector()
+listen(LEADER_CHANNEL, leader.wake)
@@ -0,0 +1,156 @@
+from collections import deque
+
+# Aho-Corasick 多关键词匹配
+# 批量加载时只建 trie，失败指针/输出表在第一次匹配前整体构建；构建之后的增删按失败树
+# （节点 -> 失败指针指向它的节点）只更新受影响的节点，不再整体重建。
+# 匹配时对文本只扫描一遍，不访问数据库。
+class KeywordMatcher:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._goto = [{}]     # 节点 -> {字符: 子节点}
+        self._fail = [0]
+        self._word = [None]   # 节点 -> 以该节点结尾的关键词
+        self._hit = [None]    # 节点 -> 在该位置命中的关键词（含失败链上的）
+        self._kids = None     # 失败树：节点 -> 失败指针指向它的节点；构建后第一次增删时才生成
+        self._values = {}     # 关键词 -> 回复
+        self._dead = 0        # 已删除关键词留下的节点数
+        self._relink = True   # 失败指针还没整体构建过
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, keyword):
+        return keyword in self._values
+
+    def get(self, keyword, default=None):
+        return self._values.get(keyword, default)
+
+    def add(self, keyword, value):
+        if not keyword:
+            return
+        if keyword in self._values:
+            # 只改回复内容，自动机结构不变
+            self._values[keyword] = value
+            return
+        self._values[keyword] = value
+        node = 0
+        goto = self._goto
+        for ch in keyword:
+            nxt = goto[node].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[node][ch] = nxt
+                goto.append({})
+                self._fail.append(0)
+                self._word.append(None)
+                self._hit.append(None)
+                if not self._relink:
+                    self._link(nxt, node, ch)
+            node = nxt
+        if self._word[node] is None:
+            self._word[node] = keyword
+            if not self._relink:
+                self._update_hit(node)
+
+    def remove(self, keyword):
+        if keyword not in self._values:
+            return
+        del self._values[keyword]
+        node = 0
+        for ch in keyword:
+            node = self._goto[node][ch]
+        self._word[node] = None
+        self._dead += 1
+        # 删除过多时整体重建，避免 trie 里堆积无用节点
+        if self._dead > max(len(self._values), 256):
+            items = list(self._values.items())
+            self.clear()
+            for k, v in items:
+                self.add(k, v)
+        elif not self._relink:
+            self._update_hit(node)
+
+    def _link(self, node, parent, ch):
+        # 新节点 node = parent + ch：求它的失败指针，再把原来失败到更短后缀、现在应失败到 node 的节点改过来。
+        # 这些节点是失败树上 parent 子树里某个节点 w 的 ch 子节点；w 自己有 ch 子节点时，
+        # w 子树里的节点都以 w + ch 为更长的后缀，不受影响，不用再往下找
+        goto, fail, kids = self._goto, self._fail, self._fail_tree()
+        f = 0
+        if parent:
+            f = fail[parent]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            f = goto[f].get(ch, 0)
+        fail[node] = f
+        kids.setdefault(f, set()).add(node)
+        # 新节点本身不是关键词时，命中的就是失败链上的关键词；被改过来的节点命中结果也不变
+        self._hit[node] = self._hit[f]
+        stack = list(kids.get(parent, ()))
+        while stack:
+            w = stack.pop()
+            v = goto[w].get(ch)
+            if v is None:
+                stack.extend(kids.get(w, ()))
+            elif v != node:
+                kids[fail[v]].discard(v)
+                fail[v] = node
+                kids.setdefault(node, set()).add(v)
+
+    def _update_hit(self, node):
+        # node 是否为关键词变了：重算它的命中结果，沿失败树往下传，遇到自身就是关键词的节点为止
+        word, hit, kids = self._word, self._hit, self._fail_tree()
+        hit[node] = word[node] if word[node] is not None else hit[self._fail[node]]
+        stack = [node]
+        while stack:
+            v = stack.pop()
+            h = hit[v]
+            for c in kids.get(v, ()):
+                if word[c] is None and hit[c] != h:
+                    hit[c] = h
+                    stack.append(c)
+
+    def _fail_tree(self):
+        if self._kids is None:
+            kids = self._kids = {}
+            fail = self._fail
+            for node in range(1, len(fail)):
+                kids.setdefault(fail[node], set()).add(node)
+        return self._kids
+
+    def _build(self):
+        goto, fail, word, hit = self._goto, self._fail, self._word, self._hit
+        self._kids = None
+        queue = deque()
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            w = word[node]
+            hit[node] = w if w is not None else hit[fail[node]]
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                queue.append(nxt)
+        self._relink = False
+
+    def search(self, text):
+        # 返回文本中最先结束的命中 (关键词, 回复)，没有命中返回 None
+        if not self._values:
+            return None
+        if self._relink:
+            self._build()
+        goto, fail, hit = self._goto, self._fail, self._hit
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            w = hit[state]
+            if w is not None:
+                return w, self._values[w]
+        return None
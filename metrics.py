@@ -0,0 +1,134 @@
+import bisect
+import functools
+import time
+from telegram.ext import ApplicationHandlerStop
+import tracing
+
+# Prometheus 文本格式的指标，不依赖 prometheus_client。
+# 热路径上只有 observe/inc：一次字典查找 + 一次二分查找，约 0.5 µs；
+# 处理一条更新（处理器 + 3 条 SQL + 一次 API 调用）的埋点总开销预算 10 µs，
+# 不到一条更新处理时间（毫秒级）的 1%，见 benchmarks/bench_metrics.py。
+# SQL 只统计登记过的热点查询（utils.hot_query），asyncpg 的查询日志回调每条约 6–10 µs，
+# 只在 tracing 打开时使用。/metrics 由 web.py 提供。
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}  # 标签值 -> 计数
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.series.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # 标签值 -> [各桶计数（不累计）, 总和, 次数]
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        s = self.series.get(labels)
+        if s is None:
+            s = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        s[0][bisect.bisect_left(self.buckets, value)] += 1
+        s[1] += value
+        s[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{format_labels(self.labels, labels, le)} {count}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {count}"
+
+# 已有 stats() 的模块不必改成埋点：抓取时调用 collector()，返回
+# [(指标名, 类型, 说明, [(标签 dict, 值), ...]), ...]
+COLLECTORS = []
+
+def collector(fn):
+    COLLECTORS.append(fn)
+    return fn
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for fn in COLLECTORS:
+        try:
+            families = fn()
+        except Exception as e:
+            print(f"指标收集失败 {fn.__name__}：{e!r}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels.keys(), labels.values())} {float(value)}")
+    lines.append("")
+    return "\n".join(lines)
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "处理器耗时", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "处理器抛出的异常", ("handler", "error"))
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "热点查询执行耗时（按登记名）", ("statement",))
+DB_QUERY_ERRORS = Counter("bot_db_query_errors_total", "SQL 执行出错", ("statement", "error"))
+DB_POOL_WAIT = Histogram("bot_db_pool_wait_seconds", "从连接池取连接的等待时间")
+TG_API_SECONDS = Histogram("bot_telegram_api_seconds", "Telegram Bot API 请求耗时（不含限速排队）", ("method",))
+TG_API_ERRORS = Counter("bot_telegram_api_errors_total", "Telegram Bot API 请求出错", ("method", "error"))
+TG_QUEUE_WAIT = Histogram("bot_telegram_queue_wait_seconds", "请求在 outbound 限速器里的排队时间", ("lane",))
+SCHEDULE_LAG = Histogram("bot_schedule_lag_seconds", "定时消息实际发出时间减计划时间")
+
+def handler_name(fn):
+    return f"{fn.__module__.rpartition('.')[2]}.{getattr(fn, '__name__', type(fn).__name__)}"
+
+def timed(fn, name=None):
+    # 包装处理器：记录耗时和异常；ApplicationHandlerStop 是正常的流程控制，不算错误
+    name = name or handler_name(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await fn(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_SECONDS.observe(elapsed, name)
+            if tracing.enabled:
+                tracing.add_span(name, elapsed)
+    wrapper.metrics_name = name
+    return wrapper
@@ -0,0 +1,96 @@
+-- 配置表
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- 会员表
+CREATE TABLE IF NOT EXISTS members (
+    user_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    region TEXT,
+    name TEXT,
+    name_link TEXT,
+    channel TEXT,
+    channel_link TEXT,
+    bust TEXT,
+    price1 TEXT,
+    price2 TEXT,
+    expire_date DATE,
+    checkins TEXT[] DEFAULT '{}',
+    PRIMARY KEY (user_id, chat_id)
+);
+-- 旧版 database.sql / schema.sql 建的表没有 price2
+ALTER TABLE members ADD COLUMN IF NOT EXISTS price2 TEXT;
+
+-- 打卡记录
+CREATE TABLE IF NOT EXISTS checkins (
+    user_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    day TEXT NOT NULL
+);
+
+-- 自动回复
+CREATE TABLE IF NOT EXISTS autoreplies (
+    keyword TEXT PRIMARY KEY,
+    reply TEXT NOT NULL
+);
+
+-- 管理员
+CREATE TABLE IF NOT EXISTS admins (
+    user_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    PRIMARY KEY (user_id, chat_id)
+);
+
+-- 机器人所在的群
+CREATE TABLE IF NOT EXISTS bot_groups (
+    chat_id BIGINT PRIMARY KEY,
+    title TEXT
+);
+
+-- 定时消息
+CREATE TABLE IF NOT EXISTS scheduled_message (
+    id SERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    text TEXT,
+    media TEXT,
+    media_type TEXT,
+    button TEXT,
+    interval INTEGER,
+    period TEXT,
+    start_date DATE,
+    end_date DATE,
+    enabled BOOLEAN NOT NULL DEFAULT FALSE,
+    del_prev BOOLEAN NOT NULL DEFAULT FALSE,
+    pin BOOLEAN NOT NULL DEFAULT FALSE,
+    last_msg_id BIGINT
+);
+ALTER TABLE scheduled_message ADD COLUMN IF NOT EXISTS last_msg_id BIGINT;
+
+-- 管理员变更时通知机器人刷新缓存（payload 为 user_id，空表示整表变更）
+CREATE OR REPLACE FUNCTION notify_admins_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('admins_changed', '');
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('admins_changed', OLD.user_id::text);
+    ELSE
+        PERFORM pg_notify('admins_changed', NEW.user_id::text);
+        IF TG_OP = 'UPDATE' AND OLD.user_id <> NEW.user_id THEN
+            PERFORM pg_notify('admins_changed', OLD.user_id::text);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS admins_changed ON admins;
+CREATE TRIGGER admins_changed
+    AFTER INSERT OR UPDATE OR DELETE ON admins
+    FOR EACH ROW EXECUTE FUNCTION notify_admins_changed();
+
+DROP TRIGGER IF EXISTS admins_truncated ON admins;
+CREATE TRIGGER admins_truncated
+    AFTER TRUNCATE ON admins
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_admins_changed();
@@ -0,0 +1,15 @@
+-- 打卡：同一天同一用户只记一次；建唯一索引前先清掉历史重复数据
+DELETE FROM checkins a USING checkins b
+WHERE a.ctid < b.ctid AND a.chat_id = b.chat_id AND a.day = b.day AND a.user_id = b.user_id;
+CREATE UNIQUE INDEX IF NOT EXISTS checkins_chat_day_user ON checkins (chat_id, day, user_id);
+-- 启动时按天加载所有群的打卡名单
+CREATE INDEX IF NOT EXISTS checkins_day ON checkins (day);
+
+-- 会员按群列出、按到期日排序
+CREATE INDEX IF NOT EXISTS members_chat_expire ON members (chat_id, expire_date, user_id);
+
+-- 管理员查询 (user_id) / (user_id, chat_id) 由主键覆盖
+
+-- 定时消息：按群列出；启动/重载时只取开启的
+CREATE INDEX IF NOT EXISTS scheduled_message_chat ON scheduled_message (chat_id, id);
+CREATE INDEX IF NOT EXISTS scheduled_message_enabled ON scheduled_message (id) WHERE enabled;
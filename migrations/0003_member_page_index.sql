@@ -0,0 +1,5 @@
+-- 会员列表按 (到期日, user_id) 键集分页，没有到期日的排在最后；
+-- 索引键与查询的排序表达式一致，翻页时直接从游标位置开始扫描
+CREATE INDEX IF NOT EXISTS members_chat_expire_key
+    ON members (chat_id, (COALESCE(expire_date, 'infinity'::date)), user_id);
+DROP INDEX IF EXISTS members_chat_expire;
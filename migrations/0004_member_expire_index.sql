@@ -0,0 +1,2 @@
+-- 每日到期扫描：跨所有群按到期日做范围查询
+CREATE INDEX IF NOT EXISTS members_expire ON members (expire_date);
@@ -0,0 +1,81 @@
+-- 打卡统计：每人一行汇总 + 每人每月一个位图，打卡时增量更新，查询不再扫打卡明细
+
+-- members.checkins 数组不再使用，把里面的日期并入 checkins 表；该列先保留，确认无误后由后续迁移删除
+INSERT INTO checkins(user_id, chat_id, day)
+SELECT user_id, chat_id, d FROM (SELECT user_id, chat_id, unnest(checkins) AS d FROM members) m
+WHERE d IS NOT NULL AND d <> ''
+ON CONFLICT DO NOTHING;
+
+-- checkins.day 是 TEXT，旧数据里可能有不是日期的值：按不同的 day 逐个转换（日期种类很少），
+-- 只接受 YYYY-MM-DD（::date 本身还认 'yesterday'、'01/02/2024' 等），不合格或转换失败的跳过不回填，并在迁移输出里报告，不让一条脏数据挡住迁移和启动
+CREATE FUNCTION pg_temp.try_date(value TEXT) RETURNS DATE AS $$
+BEGIN
+    RETURN value::date;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END $$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE TEMP TABLE checkin_days ON COMMIT DROP AS
+SELECT day, CASE WHEN day ~ '^\d{4}-\d{2}-\d{2}$' THEN pg_temp.try_date(day) END AS d
+FROM (SELECT DISTINCT day FROM checkins) c;
+
+DO $$
+DECLARE
+    bad RECORD;
+BEGIN
+    SELECT count(*) AS n, string_agg(quote_literal(day), ', ') FILTER (WHERE rn <= 10) AS sample
+    INTO bad
+    FROM (SELECT day, row_number() OVER (ORDER BY day) AS rn FROM checkin_days WHERE d IS NULL) b;
+    IF bad.n > 0 THEN
+        RAISE WARNING '打卡记录中有 % 种无法识别的日期，未计入统计（如 %），可用 SELECT * FROM checkins WHERE day IN (...) 查看',
+            bad.n, bad.sample;
+    END IF;
+END $$;
+
+-- current_streak 是截至 last_day 的连续天数；last_day 早于昨天时实际连续天数为 0
+CREATE TABLE IF NOT EXISTS checkin_stats (
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_day DATE,
+    PRIMARY KEY (chat_id, user_id)
+);
+-- month 为当月 1 号；days 第 n 位表示当月 n+1 号已打卡
+CREATE TABLE IF NOT EXISTS checkin_months (
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    month DATE NOT NULL,
+    days INTEGER NOT NULL DEFAULT 0,
+    days_count SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, user_id, month)
+);
+
+-- 排行榜：按索引顺序取前 k 名
+CREATE INDEX IF NOT EXISTS checkin_stats_chat_total ON checkin_stats (chat_id, total DESC, user_id);
+CREATE INDEX IF NOT EXISTS checkin_stats_chat_streak ON checkin_stats (chat_id, current_streak DESC, user_id);
+CREATE INDEX IF NOT EXISTS checkin_months_rank ON checkin_months (chat_id, month, days_count DESC, user_id);
+
+-- 用已有打卡记录回填
+INSERT INTO checkin_months(chat_id, user_id, month, days, days_count)
+SELECT chat_id, user_id, date_trunc('month', d)::date, bit_or(1 << (extract(day FROM d)::int - 1)), count(*)
+FROM (SELECT DISTINCT chat_id, user_id, k.d FROM checkins JOIN checkin_days k USING (day) WHERE k.d IS NOT NULL) c
+GROUP BY chat_id, user_id, date_trunc('month', d)
+ON CONFLICT DO NOTHING;
+
+-- 连续天数：日期减去组内序号相同的属于同一段连续打卡
+INSERT INTO checkin_stats(chat_id, user_id, total, current_streak, longest_streak, last_day)
+SELECT chat_id, user_id, sum(len), (array_agg(len ORDER BY last DESC))[1], max(len), max(last)
+FROM (
+    SELECT chat_id, user_id, count(*) AS len, max(d) AS last
+    FROM (
+        SELECT chat_id, user_id, d, d - (row_number() OVER (PARTITION BY chat_id, user_id ORDER BY d))::int AS grp
+        FROM (SELECT DISTINCT chat_id, user_id, k.d FROM checkins JOIN checkin_days k USING (day) WHERE k.d IS NOT NULL) c
+    ) g
+    GROUP BY chat_id, user_id, grp
+) runs
+GROUP BY chat_id, user_id
+ON CONFLICT DO NOTHING;
+
+DROP FUNCTION pg_temp.try_date(TEXT);
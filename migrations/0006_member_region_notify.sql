@@ -0,0 +1,47 @@
+-- members.region 变更时按群发通知，机器人收到后只重新加载该群的地区索引。
+-- 语句级触发器 + 过渡表：批量导入/到期清理每个群只通知一次，且只在地区确实变化时通知
+CREATE OR REPLACE FUNCTION notify_member_regions_changed() RETURNS trigger AS $$
+DECLARE
+    c BIGINT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('member_regions_changed', '');
+    ELSIF TG_OP = 'INSERT' THEN
+        FOR c IN SELECT DISTINCT chat_id FROM new_rows WHERE region IS NOT NULL AND region <> '' LOOP
+            PERFORM pg_notify('member_regions_changed', c::text);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR c IN SELECT DISTINCT chat_id FROM old_rows WHERE region IS NOT NULL AND region <> '' LOOP
+            PERFORM pg_notify('member_regions_changed', c::text);
+        END LOOP;
+    ELSE
+        FOR c IN
+            SELECT DISTINCT n.chat_id FROM new_rows n JOIN old_rows o USING (user_id, chat_id)
+            WHERE n.region IS DISTINCT FROM o.region
+        LOOP
+            PERFORM pg_notify('member_regions_changed', c::text);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS members_regions_inserted ON members;
+CREATE TRIGGER members_regions_inserted
+    AFTER INSERT ON members REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_member_regions_changed();
+
+DROP TRIGGER IF EXISTS members_regions_updated ON members;
+CREATE TRIGGER members_regions_updated
+    AFTER UPDATE ON members REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_member_regions_changed();
+
+DROP TRIGGER IF EXISTS members_regions_deleted ON members;
+CREATE TRIGGER members_regions_deleted
+    AFTER DELETE ON members REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_member_regions_changed();
+
+DROP TRIGGER IF EXISTS members_regions_truncated ON members;
+CREATE TRIGGER members_regions_truncated
+    AFTER TRUNCATE ON members
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_member_regions_changed();
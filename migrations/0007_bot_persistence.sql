@@ -0,0 +1,24 @@
+-- PTB 持久化（persistence.PostgresPersistence）：user_data / chat_data / bot_data / 会话状态，
+-- 数据为 pickle 序列化后的字节
+CREATE TABLE IF NOT EXISTS bot_user_data (
+    user_id BIGINT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS bot_chat_data (
+    chat_id BIGINT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS bot_data (
+    id SMALLINT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS bot_conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (name, key)
+);
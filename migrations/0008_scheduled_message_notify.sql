@@ -0,0 +1,48 @@
+-- scheduled_message 变更时通知所有实例（payload 为定时消息 id，空表示整表变更）：
+-- 多实例部署时在任意实例上修改，持有该群调度分片的实例都能收到。
+-- 发送后回写 last_msg_id 不算变更，不通知
+CREATE OR REPLACE FUNCTION notify_scheduled_message_changed() RETURNS trigger AS $$
+DECLARE
+    sid INTEGER;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('scheduled_message_changed', '');
+    ELSIF TG_OP = 'INSERT' THEN
+        FOR sid IN SELECT id FROM new_rows LOOP
+            PERFORM pg_notify('scheduled_message_changed', sid::text);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR sid IN SELECT id FROM old_rows LOOP
+            PERFORM pg_notify('scheduled_message_changed', sid::text);
+        END LOOP;
+    ELSE
+        FOR sid IN
+            SELECT n.id FROM new_rows n JOIN old_rows o USING (id)
+            WHERE to_jsonb(n) - 'last_msg_id' IS DISTINCT FROM to_jsonb(o) - 'last_msg_id'
+        LOOP
+            PERFORM pg_notify('scheduled_message_changed', sid::text);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS scheduled_message_inserted ON scheduled_message;
+CREATE TRIGGER scheduled_message_inserted
+    AFTER INSERT ON scheduled_message REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_scheduled_message_changed();
+
+DROP TRIGGER IF EXISTS scheduled_message_updated ON scheduled_message;
+CREATE TRIGGER scheduled_message_updated
+    AFTER UPDATE ON scheduled_message REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_scheduled_message_changed();
+
+DROP TRIGGER IF EXISTS scheduled_message_deleted ON scheduled_message;
+CREATE TRIGGER scheduled_message_deleted
+    AFTER DELETE ON scheduled_message REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_scheduled_message_changed();
+
+DROP TRIGGER IF EXISTS scheduled_message_truncated ON scheduled_message;
+CREATE TRIGGER scheduled_message_truncated
+    AFTER TRUNCATE ON scheduled_message
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_scheduled_message_changed();
@@ -0,0 +1,50 @@
+-- 定时消息的运行状态落库：重启后按原来的节奏继续，并能判断停机期间错过了哪些
+ALTER TABLE scheduled_message ADD COLUMN IF NOT EXISTS next_run_at TIMESTAMP;
+ALTER TABLE scheduled_message ADD COLUMN IF NOT EXISTS last_run_at TIMESTAMP;
+
+-- 运行状态由调度实例自己回写，不算配置变更，不通知。
+-- 过渡表连接用 EXECUTE 每次重新规划：PL/pgSQL 缓存的计划是按第一次触发时过渡表的行数做的，
+-- 先有过单行修改后，一条语句改上万行时仍用嵌套循环连接，变成 O(n²)
+CREATE OR REPLACE FUNCTION notify_scheduled_message_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('scheduled_message_changed', '');
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('scheduled_message_changed', id::text) FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('scheduled_message_changed', id::text) FROM old_rows;
+    ELSE
+        EXECUTE $q$
+            SELECT pg_notify('scheduled_message_changed', n.id::text)
+            FROM new_rows n JOIN old_rows o USING (id)
+            WHERE to_jsonb(n) - '{last_msg_id,next_run_at,last_run_at}'::text[]
+                  IS DISTINCT FROM to_jsonb(o) - '{last_msg_id,next_run_at,last_run_at}'::text[]
+        $q$;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 地区变更通知有同样的问题（大批量导入/修改会员时）
+CREATE OR REPLACE FUNCTION notify_member_regions_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('member_regions_changed', '');
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('member_regions_changed', c::text)
+        FROM (SELECT DISTINCT chat_id AS c FROM new_rows WHERE region IS NOT NULL AND region <> '') AS x;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('member_regions_changed', c::text)
+        FROM (SELECT DISTINCT chat_id AS c FROM old_rows WHERE region IS NOT NULL AND region <> '') AS x;
+    ELSE
+        EXECUTE $q$
+            SELECT pg_notify('member_regions_changed', c::text)
+            FROM (
+                SELECT DISTINCT n.chat_id AS c FROM new_rows n JOIN old_rows o USING (user_id, chat_id)
+                WHERE n.region IS DISTINCT FROM o.region
+            ) AS x
+        $q$;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
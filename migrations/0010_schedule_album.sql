@@ -0,0 +1,30 @@
+-- 定时消息支持相册：media_items 为有序的 [[类型, file_id], ...]（最多 10 个），
+-- media/media_type 保留为第一个，用于详情页预览。
+-- 一次发出的所有消息ID记在 last_msg_ids，"删除上一条"时一次删掉整组；last_msg_id 不再使用
+ALTER TABLE scheduled_message ADD COLUMN IF NOT EXISTS media_items JSONB;
+ALTER TABLE scheduled_message ADD COLUMN IF NOT EXISTS last_msg_ids BIGINT[];
+
+UPDATE scheduled_message SET media_items = jsonb_build_array(jsonb_build_array(media_type, media))
+WHERE media IS NOT NULL AND media_type IS NOT NULL AND media_items IS NULL;
+UPDATE scheduled_message SET last_msg_ids = ARRAY[last_msg_id]
+WHERE last_msg_id IS NOT NULL AND last_msg_ids IS NULL;
+
+CREATE OR REPLACE FUNCTION notify_scheduled_message_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('scheduled_message_changed', '');
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('scheduled_message_changed', id::text) FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('scheduled_message_changed', id::text) FROM old_rows;
+    ELSE
+        EXECUTE $q$
+            SELECT pg_notify('scheduled_message_changed', n.id::text)
+            FROM new_rows n JOIN old_rows o USING (id)
+            WHERE to_jsonb(n) - '{last_msg_id,last_msg_ids,next_run_at,last_run_at}'::text[]
+                  IS DISTINCT FROM to_jsonb(o) - '{last_msg_id,last_msg_ids,next_run_at,last_run_at}'::text[]
+        $q$;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,32 @@
+-- 群发（broadcast.py）：一次群发一行，每个目标群一行投递状态。
+-- 群发内容是管理员私聊里的一条消息（from_chat_id, message_id），逐群 copyMessage；
+-- reply_markup 为按钮（InlineKeyboardMarkup 的 JSON）。进度消息的位置也记下来，重启后接着编辑
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id SERIAL PRIMARY KEY,
+    created_by BIGINT NOT NULL,
+    from_chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    reply_markup JSONB,
+    filter TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',  -- running / done / cancelled
+    progress_chat_id BIGINT,
+    progress_msg_id BIGINT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ
+);
+
+-- state: pending 待发 / sent 已发 / failed 放弃；重启后只发 pending 的
+CREATE TABLE IF NOT EXISTS broadcast_targets (
+    broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    message_id BIGINT,
+    error TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (broadcast_id, chat_id)
+);
+-- 续发时按 chat_id 分批取待发目标，只扫还没发的那部分
+CREATE INDEX IF NOT EXISTS broadcast_targets_pending ON broadcast_targets (broadcast_id, chat_id)
+WHERE state = 'pending';
@@ -0,0 +1,23 @@
+-- 0005 已把 members.checkins 数组并入 checkins 表；确认数组里每个日期都已在表中再删除该列，
+-- 有遗漏时保留该列并给出警告（删列不可恢复），处理后再次部署不会重跑，需要手动删除
+DO $$
+DECLARE
+    missing BIGINT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'members' AND column_name = 'checkins'
+    ) THEN
+        RETURN;
+    END IF;
+    SELECT count(*) INTO missing
+    FROM (SELECT user_id, chat_id, unnest(checkins) AS d FROM members) m
+    WHERE d IS NOT NULL AND d <> ''
+      AND NOT EXISTS (SELECT 1 FROM checkins c WHERE c.chat_id = m.chat_id AND c.day = m.d AND c.user_id = m.user_id);
+    IF missing > 0 THEN
+        RAISE WARNING 'members.checkins 中有 % 条打卡不在 checkins 表里，保留该列，核对后手动执行 ALTER TABLE members DROP COLUMN checkins',
+            missing;
+    ELSE
+        ALTER TABLE members DROP COLUMN checkins;
+    END IF;
+END $$;
@@ -0,0 +1,65 @@
+-- user_data / chat_data 加版本号：写入时带上读到的版本（乐观锁），多实例并发修改同一行时后写的一方
+-- 先合并对方的改动再写，不会整行覆盖；变更时通知各实例（payload 为 "id:版本"，删除时版本为 0，
+-- 空表示整表变更），收到通知的实例在下次访问该 id 前重新读取
+ALTER TABLE bot_user_data ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+ALTER TABLE bot_chat_data ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+-- TG_ARGV[0] 为通知频道，TG_ARGV[1] 为 id 列名
+CREATE OR REPLACE FUNCTION notify_bot_store_changed() RETURNS trigger AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify(TG_ARGV[0], '');
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR r IN EXECUTE format('SELECT %I AS id FROM old_rows', TG_ARGV[1]) LOOP
+            PERFORM pg_notify(TG_ARGV[0], r.id || ':0');
+        END LOOP;
+    ELSE
+        FOR r IN EXECUTE format('SELECT %I AS id, version FROM new_rows', TG_ARGV[1]) LOOP
+            PERFORM pg_notify(TG_ARGV[0], r.id || ':' || r.version);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bot_user_data_inserted ON bot_user_data;
+CREATE TRIGGER bot_user_data_inserted
+    AFTER INSERT ON bot_user_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_user_data_changed', 'user_id');
+
+DROP TRIGGER IF EXISTS bot_user_data_updated ON bot_user_data;
+CREATE TRIGGER bot_user_data_updated
+    AFTER UPDATE ON bot_user_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_user_data_changed', 'user_id');
+
+DROP TRIGGER IF EXISTS bot_user_data_deleted ON bot_user_data;
+CREATE TRIGGER bot_user_data_deleted
+    AFTER DELETE ON bot_user_data REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_user_data_changed', 'user_id');
+
+DROP TRIGGER IF EXISTS bot_user_data_truncated ON bot_user_data;
+CREATE TRIGGER bot_user_data_truncated
+    AFTER TRUNCATE ON bot_user_data
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_user_data_changed', 'user_id');
+
+DROP TRIGGER IF EXISTS bot_chat_data_inserted ON bot_chat_data;
+CREATE TRIGGER bot_chat_data_inserted
+    AFTER INSERT ON bot_chat_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_chat_data_changed', 'chat_id');
+
+DROP TRIGGER IF EXISTS bot_chat_data_updated ON bot_chat_data;
+CREATE TRIGGER bot_chat_data_updated
+    AFTER UPDATE ON bot_chat_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_chat_data_changed', 'chat_id');
+
+DROP TRIGGER IF EXISTS bot_chat_data_deleted ON bot_chat_data;
+CREATE TRIGGER bot_chat_data_deleted
+    AFTER DELETE ON bot_chat_data REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_chat_data_changed', 'chat_id');
+
+DROP TRIGGER IF EXISTS bot_chat_data_truncated ON bot_chat_data;
+CREATE TRIGGER bot_chat_data_truncated
+    AFTER TRUNCATE ON bot_chat_data
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bot_store_changed('bot_chat_data_changed', 'chat_id');
@@ -0,0 +1,71 @@
+-- 多实例部署时各实例内存里的自动回复规则和当天打卡名单靠通知保持一致
+
+-- 自动回复变更：payload 为关键词，空表示整表变更（TRUNCATE，或关键词太长放不进通知）
+CREATE OR REPLACE FUNCTION notify_autoreplies_changed() RETURNS trigger AS $$
+DECLARE
+    keywords TEXT[];
+    k TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('autoreplies_changed', '');
+        RETURN NULL;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT array_agg(keyword) INTO keywords FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(keyword) INTO keywords FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT keyword) INTO keywords
+        FROM (SELECT keyword FROM new_rows UNION ALL SELECT keyword FROM old_rows) k;
+    END IF;
+    FOREACH k IN ARRAY coalesce(keywords, '{}') LOOP
+        IF octet_length(k) > 7000 THEN
+            PERFORM pg_notify('autoreplies_changed', '');
+            EXIT;
+        END IF;
+        PERFORM pg_notify('autoreplies_changed', k);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS autoreplies_inserted ON autoreplies;
+CREATE TRIGGER autoreplies_inserted
+    AFTER INSERT ON autoreplies REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_autoreplies_changed();
+
+DROP TRIGGER IF EXISTS autoreplies_updated ON autoreplies;
+CREATE TRIGGER autoreplies_updated
+    AFTER UPDATE ON autoreplies REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_autoreplies_changed();
+
+DROP TRIGGER IF EXISTS autoreplies_deleted ON autoreplies;
+CREATE TRIGGER autoreplies_deleted
+    AFTER DELETE ON autoreplies REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_autoreplies_changed();
+
+DROP TRIGGER IF EXISTS autoreplies_truncated ON autoreplies;
+CREATE TRIGGER autoreplies_truncated
+    AFTER TRUNCATE ON autoreplies
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_autoreplies_changed();
+
+-- 新打卡：每批每个群一条，payload 为 "chat_id:日期:user_id,user_id,..."；
+-- 人数太多放不进通知时只发 "chat_id:日期"，由接收方按群读库
+CREATE OR REPLACE FUNCTION notify_checkins_added() RETURNS trigger AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT chat_id, day, string_agg(user_id::text, ',') AS users FROM new_rows GROUP BY chat_id, day LOOP
+        IF octet_length(r.users) > 7000 THEN
+            PERFORM pg_notify('checkins_added', r.chat_id || ':' || r.day);
+        ELSE
+            PERFORM pg_notify('checkins_added', r.chat_id || ':' || r.day || ':' || r.users);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS checkins_added ON checkins;
+CREATE TRIGGER checkins_added
+    AFTER INSERT ON checkins REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_checkins_added();
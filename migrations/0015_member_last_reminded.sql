@@ -0,0 +1,2 @@
+-- 到期提醒记下发送日期：扫描按到期日范围查询，停机错过的提醒在下一次扫描时补发，不会重复发
+ALTER TABLE members ADD COLUMN IF NOT EXISTS last_reminded DATE;
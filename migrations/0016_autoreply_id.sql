@@ -0,0 +1,3 @@
+-- 自动回复列表翻页的游标改用代理键：关键词可能超过 callback_data 的 64 字节，截断后的前缀做游标会重复或漏掉规则
+ALTER TABLE autoreplies ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+CREATE UNIQUE INDEX IF NOT EXISTS autoreplies_id ON autoreplies (id);
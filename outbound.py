@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import os
+import time
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import TG_API_ERRORS, TG_API_SECONDS, TG_QUEUE_WAIT
+import tracing
+
+# 优先级：数值越小越先发
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 1
+PRIORITY_BROADCAST = 2
+
+# 调用 bot 方法时通过 rate_limit_args 指定通道，例如
+# bot.send_message(chat_id, text, rate_limit_args=SCHEDULED)
+INTERACTIVE = {"priority": PRIORITY_INTERACTIVE}
+SCHEDULED = {"priority": PRIORITY_SCHEDULED}
+BROADCAST = {"priority": PRIORITY_BROADCAST}
+
+LANE_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_SCHEDULED: "scheduled", PRIORITY_BROADCAST: "broadcast"}
+
+GLOBAL_RATE = float(os.environ.get("TG_GLOBAL_RATE", "30"))        # 每秒
+GROUP_RATE = float(os.environ.get("TG_GROUP_RATE", "20")) / 60     # 每群每分钟 20 条
+PRIVATE_RATE = float(os.environ.get("TG_PRIVATE_RATE", "1"))       # 私聊每秒
+MAX_RETRIES = int(os.environ.get("TG_MAX_RETRIES", "3"))
+
+# 会往会话里发新消息的接口才受每会话限速（Telegram 的每群 20 条/分钟、私聊 1 条/秒说的是消息）；
+# 编辑、删除、置顶、查成员等按钮菜单常用的请求只占全局令牌
+SEND_ENDPOINTS = frozenset((
+    "sendMessage", "sendPhoto", "sendVideo", "sendAnimation", "sendAudio", "sendVoice", "sendVideoNote",
+    "sendDocument", "sendSticker", "sendMediaGroup", "sendLocation", "sendVenue", "sendContact", "sendPoll",
+    "sendDice", "sendGame", "sendInvoice", "copyMessage", "copyMessages", "forwardMessage", "forwardMessages",
+))
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "last")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def wait_time(self, now):
+        # 返回还需等待的秒数，0 表示已有令牌
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class LaneStats:
+    __slots__ = ("depth", "sent", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.depth = 0
+        self.sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+# 所有 Bot API 请求的统一出口（通过 Application.builder().rate_limiter() 挂载）。
+# 发消息的请求每个会话一个令牌桶，针对会话的请求共用一个全局令牌桶；
+# 全局令牌按优先级分配，交互回复优先于定时/群发。
+# 收到 RetryAfter 时全局暂停对应秒数后重试。
+class OutboundLimiter(BaseRateLimiter):
+    def __init__(self, global_rate=GLOBAL_RATE, group_rate=GROUP_RATE,
+                 private_rate=PRIVATE_RATE, max_retries=MAX_RETRIES):
+        self.global_rate = global_rate
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}          # chat_id -> (TokenBucket, asyncio.Lock)
+        self._waiters = []        # (优先级, 序号, future)
+        self._seq = 0
+        self._kick = asyncio.Event()
+        self._paused_until = 0.0
+        self._pump_task = None
+        self.lanes = {p: LaneStats() for p in LANE_NAMES}
+        self.throttled = 0        # 收到 RetryAfter 的次数
+        self.retry_after_total = 0.0
+
+    async def initialize(self):
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+
+    def _chat(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            if len(self._chats) > 10000:
+                self._prune()
+            group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if group else self.private_rate
+            capacity = 20 if group else 3
+            entry = self._chats[chat_id] = (TokenBucket(rate, capacity), asyncio.Lock())
+        return entry
+
+    def _prune(self):
+        now = time.monotonic()
+        for chat_id, (bucket, lock) in list(self._chats.items()):
+            if not lock.locked() and bucket.wait_time(now) == 0 and bucket.tokens >= bucket.capacity:
+                del self._chats[chat_id]
+
+    async def _acquire_global(self, priority):
+        if not self._waiters and time.monotonic() >= self._paused_until \
+                and self._global.wait_time(time.monotonic()) == 0:
+            self._global.consume()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        self._kick.set()
+        await fut
+
+    async def _pump(self):
+        while True:
+            if not self._waiters:
+                self._kick.clear()
+                await self._kick.wait()
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self._global.consume()
+                fut.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getUpdates、answerCallbackQuery 等不针对会话的请求不限速
+            return await self._call(endpoint, callback, args, kwargs)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        priority = (rate_limit_args or INTERACTIVE).get("priority", PRIORITY_INTERACTIVE)
+        lane = self.lanes.get(priority) or self.lanes[PRIORITY_BROADCAST]
+        started = time.monotonic()
+        lane.depth += 1
+        try:
+            if endpoint in SEND_ENDPOINTS:
+                # 同一会话按先来后到拿令牌，保证顺序；拿到后就放开锁，排全局令牌时不挡同一会话的交互回复
+                # （同优先级的请求按进入全局队列的先后出队，顺序不变）
+                bucket, lock = self._chat(chat_id)
+                async with lock:
+                    while True:
+                        wait = bucket.wait_time(time.monotonic())
+                        if wait <= 0:
+                            break
+                        await asyncio.sleep(wait)
+                    bucket.consume()
+            await self._acquire_global(priority)
+        finally:
+            lane.depth -= 1
+        waited = time.monotonic() - started
+        TG_QUEUE_WAIT.observe(waited, LANE_NAMES.get(priority, "broadcast"))
+        if tracing.enabled:
+            tracing.add_wait(waited)
+        lane.sent += 1
+        lane.wait_total += waited
+        lane.wait_max = max(lane.wait_max, waited)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._call(endpoint, callback, args, kwargs)
+            except RetryAfter as e:
+                self.throttled += 1
+                self.retry_after_total += e.retry_after
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Telegram 限流：{endpoint} chat={chat_id} 等待 {e.retry_after}s 后重试")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    async def _call(self, endpoint, callback, args, kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            TG_API_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TG_API_SECONDS.observe(elapsed, endpoint)
+            if tracing.enabled:
+                tracing.add_api(elapsed)
+
+    def stats(self):
+        return {
+            "throttled": self.throttled,
+            "retry_after_seconds": self.retry_after_total,
+            "chats": len(self._chats),
+            "lanes": {
+                LANE_NAMES[p]: {
+                    "depth": s.depth,
+                    "sent": s.sent,
+                    "wait_avg": s.wait_total / s.sent if s.sent else 0.0,
+                    "wait_max": s.wait_max,
+                }
+                for p, s in self.lanes.items()
+            },
+        }
+
+outbound = OutboundLimiter()
@@ -0,0 +1,410 @@
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import time
+from telegram.ext import BasePersistence, PersistenceInput
+from utils import hot_execute, hot_fetch, hot_fetchrow, hot_query, listen
+
+PERSIST_INTERVAL = float(os.environ.get("PERSIST_INTERVAL", "10"))  # 秒，PTB 每隔这么久调用一次 update_*
+# 秒：这么久没访问的 id 从缓存里移除（实际在 1~2 倍之间），须远大于 PERSIST_INTERVAL
+PERSIST_IDLE = float(os.environ.get("PERSIST_IDLE", "3600"))
+
+def _digest(blob):
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+EMPTY_BLOB = pickle.dumps({})
+EMPTY = _digest(EMPTY_BLOB)
+
+def _store_queries(table, id_col):
+    # get 带上本实例已有的版本，版本没变时不传数据；put 只在库里仍是读到的版本时写（版本 0 表示新行），
+    # 返回写成功的 id 和新版本，没返回的就是被其他实例抢先改了
+    return (
+        hot_query(
+            f"{table}_get",
+            f"SELECT version, CASE WHEN version <> $2 THEN data END AS data FROM {table} WHERE {id_col}=$1"
+        ),
+        hot_query(
+            f"{table}_get_many",
+            f"SELECT {id_col} AS id, version, data FROM {table} WHERE {id_col} = ANY($1::bigint[])"
+        ),
+        hot_query(
+            f"{table}_put",
+            f"WITH input AS (SELECT * FROM unnest($1::bigint[], $2::bytea[], $3::bigint[]) AS i(id, data, version)), "
+            f"upd AS (UPDATE {table} t SET data=i.data, version=t.version + 1, updated_at=now() FROM input i "
+            f"WHERE i.version > 0 AND t.{id_col}=i.id AND t.version=i.version RETURNING t.{id_col} AS id, t.version), "
+            f"ins AS (INSERT INTO {table}({id_col}, data) SELECT id, data FROM input WHERE version = 0 "
+            f"ON CONFLICT ({id_col}) DO NOTHING RETURNING {id_col} AS id, version) "
+            f"SELECT * FROM upd UNION ALL SELECT * FROM ins"
+        ),
+        hot_query(f"{table}_drop", f"DELETE FROM {table} WHERE {id_col} = ANY($1::bigint[])"),
+        hot_query(f"{table}_ids", f"SELECT {id_col} FROM {table}"),
+    )
+
+Q_USER = _store_queries("bot_user_data", "user_id")
+Q_CHAT = _store_queries("bot_chat_data", "chat_id")
+USER_CHANNEL = "bot_user_data_changed"
+CHAT_CHANNEL = "bot_chat_data_changed"
+
+# 一张 id -> 序列化数据 的表（user_data / chat_data 各一张）。
+# 按 id 首次访问时才读库；之后只有收到其他实例的变更通知（或监听连接断开过）才在下次访问前重新读。
+# 库里有哪些 id 整表读一次（只读 id）记在 known 里，之后靠变更通知维护：大部分新用户/群库里没有数据，
+# 首次访问直接跳过，不读库。
+# 记住数据所基于的库中版本和当时的内容：数据没变的 id 不重复写；写入带版本号，
+# 其他实例先改了同一行时，把本实例的改动（按顶层 key）合并到库里的新版本上再写。
+# 超过 idle 秒没访问的 id 从缓存里移除，同时清空 PTB 里它的数据 dict（改动早已写入），下次访问时重新读库。
+class _Store:
+    def __init__(self, queries, idle=PERSIST_IDLE):
+        self.q_get, self.q_get_many, self.q_put, self.q_drop, self.q_ids = queries
+        self.base = {}      # id -> 所基于的库中版本的序列化数据（已加载过的 id 都在这里）
+        self.versions = {}  # id -> 该版本号，0 表示库里还没有这一行
+        self.dicts = {}     # id -> PTB 的数据 dict，移出缓存时清空
+        self.stale = set()  # 其他实例改过、下次访问前要重新读的 id
+        self.loading = {}   # id -> 正在读库的任务，同一 id 并发访问时共用
+        self.dirty = {}     # id -> (待写入的序列化数据, PTB 的数据 dict)
+        self.dropped = set()
+        self.known = None   # 库里有行的 id；None 表示还没读（或监听断开过，要重新读）
+        self._known_task = None
+        self._known_changes = []  # 读 known 期间收到的变更，读完后按顺序补上
+        self.idle = idle
+        self.recent = set()  # 本周期访问过的 id
+        self._next_sweep = time.monotonic() + idle
+        self.loads = 0
+        self.absent = 0
+        self.evicted = 0
+        self.writes = 0
+        self.skipped = 0
+        self.conflicts = 0
+
+    async def refresh(self, key, data):
+        self.recent.add(key)
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        if key in self.base and key not in self.stale:
+            return
+        if self.known is None:
+            await self._load_known()
+        if key not in self.known and key not in self.base:
+            self.absent += 1
+            return  # 库里没有这一行，没什么可读的
+        task = self.loading.get(key)
+        if task is None:
+            task = self.loading[key] = asyncio.ensure_future(
+                hot_fetchrow(self.q_get, key, self.versions.get(key, 0)))
+            task.add_done_callback(lambda t, key=key: self.loading.pop(key, None))
+        row = await task
+        if key in self.base and key not in self.stale:
+            return  # 并发访问时已由另一个调用处理
+        self.loads += 1
+        self.stale.discard(key)
+        self.dicts[key] = data
+        if row is None:
+            self._rebase(key, data, 0, EMPTY_BLOB)
+        elif row["data"] is not None:
+            self._rebase(key, data, row["version"], row["data"])
+
+    async def _load_known(self):
+        if self._known_task is None:
+            self._known_changes = []
+            self._known_task = asyncio.ensure_future(hot_fetch(self.q_ids))
+        task = self._known_task
+        try:
+            rows = await task
+        finally:
+            if self._known_task is task:
+                self._known_task = None
+        if self.known is None:
+            known = {r[0] for r in rows}
+            for key, version in self._known_changes:
+                if version:
+                    known.add(key)
+                else:
+                    known.discard(key)
+            self.known = known
+            self._known_changes = []
+
+    def _sweep(self, now):
+        # 整个周期都没访问过、也没有待写入/正在读的 id 移出缓存
+        self._next_sweep = now + self.idle
+        for key in [k for k in self.base if k not in self.recent and k not in self.dirty and k not in self.loading]:
+            self.base.pop(key)
+            self.versions.pop(key, None)
+            self.stale.discard(key)
+            data = self.dicts.pop(key, None)
+            if data is not None:
+                data.clear()
+            self.evicted += 1
+        self.recent = set()
+
+    def _rebase(self, key, data, version, blob):
+        # 以库里的 blob 为准，叠加本实例相对旧版本改过/删掉的顶层 key，结果原地写回 PTB 的 dict
+        base = pickle.loads(self.base.get(key, EMPTY_BLOB))
+        merged = pickle.loads(blob)
+        for k, v in data.items():
+            if k not in base or pickle.dumps(v) != pickle.dumps(base[k]):
+                merged[k] = v
+        for k in base:
+            if k not in data:
+                merged.pop(k, None)
+        data.clear()
+        data.update(merged)
+        self.base[key] = blob
+        self.versions[key] = version
+        if key in self.dirty:
+            self.update(key, data)
+
+    def update(self, key, data):
+        blob = pickle.dumps(data)
+        if blob == self.base.get(key, EMPTY_BLOB):
+            self.dirty.pop(key, None)
+            if key not in self.base:
+                self.dicts.pop(key, None)
+            self.skipped += 1
+            return False
+        self.dirty[key] = (blob, data)
+        self.dicts[key] = data
+        self.dropped.discard(key)
+        return True
+
+    def drop(self, key):
+        self.dirty.pop(key, None)
+        self.base.pop(key, None)
+        self.versions.pop(key, None)
+        self.dicts.pop(key, None)
+        self.stale.discard(key)
+        self.dropped.add(key)
+
+    def on_changed(self, payload):
+        # 通知 payload 为 "id:版本"（删除时版本为 0），空表示整表变更；
+        # 自己写入引起的通知版本号与本地一致，忽略
+        if not payload:
+            self.on_lost()
+            return
+        key, _, version = payload.partition(":")
+        key, version = int(key), int(version)
+        if self.known is not None:
+            if version:
+                self.known.add(key)
+            else:
+                self.known.discard(key)
+        elif self._known_task is not None:
+            self._known_changes.append((key, version))
+        if key in self.base and version != self.versions.get(key):
+            self.stale.add(key)
+
+    def on_lost(self):
+        # 收不到通知期间的变更无从得知：已加载的 id 下次访问时都重新读一次（没变时只传版本号），
+        # 库里有哪些 id 也重新读
+        self.stale.update(self.base)
+        self.known = None
+
+    async def write(self):
+        dirty, self.dirty = self.dirty, {}
+        dropped, self.dropped = self.dropped, set()
+        keys = list(dirty)
+        rows = []
+        try:
+            if dirty:
+                rows = await hot_fetch(self.q_put, keys, [dirty[k][0] for k in keys],
+                                       [self.versions.get(k, 0) for k in keys])
+            if dropped:
+                await hot_execute(self.q_drop, list(dropped))
+        except Exception:
+            # 失败的数据放回去，下一轮再写（期间又有更新的以新数据为准）
+            for key, entry in dirty.items():
+                self.dirty.setdefault(key, entry)
+            self.dropped |= dropped - set(self.dirty)
+            raise
+        written = {r["id"]: r["version"] for r in rows}
+        for key, version in written.items():
+            self.base[key] = dirty[key][0]
+            self.versions[key] = version
+            if self.known is not None:
+                self.known.add(key)
+        if dropped and self.known is not None:
+            self.known -= dropped
+        self.writes += len(written)
+        conflicts = [k for k in keys if k not in written]
+        if conflicts:
+            # 其他实例先改了这些行：读出最新版本合并本实例的改动，重新登记待写（_flush 会接着写）
+            self.conflicts += len(conflicts)
+            fresh = {r["id"]: r for r in await hot_fetch(self.q_get_many, conflicts)}
+            for key in conflicts:
+                data = dirty[key][1]
+                self.dirty.setdefault(key, dirty[key])
+                row = fresh.get(key)
+                if row is None:
+                    self._rebase(key, data, 0, EMPTY_BLOB)
+                else:
+                    self._rebase(key, data, row["version"], row["data"])
+        return len(written) + len(dropped)
+
+Q_BOT_GET = hot_query("bot_data_get", "SELECT data FROM bot_data WHERE id=0")
+Q_BOT_PUT = hot_query(
+    "bot_data_put",
+    "INSERT INTO bot_data(id, data) VALUES(0, $1) ON CONFLICT (id) DO UPDATE SET data=EXCLUDED.data, updated_at=now()"
+)
+Q_CONV_GET = hot_query("bot_conversations_get", "SELECT key, state FROM bot_conversations WHERE name=$1")
+Q_CONV_PUT = hot_query(
+    "bot_conversations_put",
+    "INSERT INTO bot_conversations(name, key, state) SELECT * FROM unnest($1::text[], $2::text[], $3::bytea[]) "
+    "ON CONFLICT (name, key) DO UPDATE SET state=EXCLUDED.state, updated_at=now()"
+)
+Q_CONV_DROP = hot_query(
+    "bot_conversations_drop",
+    "DELETE FROM bot_conversations WHERE (name, key) IN (SELECT * FROM unnest($1::text[], $2::text[]))"
+)
+
+# user_data / chat_data / bot_data / 会话状态存进 PostgreSQL，复用 utils 的连接池。
+# PTB 每 update_interval 秒把这段时间内被访问过的 id 逐个交给 update_*，这里只记下真正变了的，
+# 同一轮的所有调用合并成每张表一条批量 upsert。读取是懒加载：处理某个用户/群的更新前
+# （refresh_*）才读它那一行，启动时不整表加载。
+# 多实例：user_data / chat_data 靠版本号和变更通知在实例间保持一致（见 _Store），但改动要等
+# 本实例下一次写入（最多 update_interval 秒）后其他实例才看得到，多实例部署时宜调小 PERSIST_INTERVAL。
+# bot_data 和会话状态（ConversationHandler）仍只在启动时读一次，按单实例使用。
+class PostgresPersistence(BasePersistence):
+    def __init__(self, update_interval=PERSIST_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.users = _Store(Q_USER)
+        self.chats = _Store(Q_CHAT)
+        listen(USER_CHANNEL, self.users.on_changed, self.users.on_lost)
+        listen(CHAT_CHANNEL, self.chats.on_changed, self.chats.on_lost)
+        self._bot_loaded = False
+        self._bot_digest = EMPTY
+        self._bot_dirty = None
+        self._conv_dirty = {}  # (name, key) -> 序列化后的状态，None 表示删除
+        self._flush_task = None
+        self.flushes = 0
+
+    # ---------- 读取 ----------
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await hot_fetch(Q_CONV_GET, name)
+        return {tuple(json.loads(r["key"])): pickle.loads(r["state"]) for r in rows}
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self.users.refresh(user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self.chats.refresh(chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        if self._bot_loaded:
+            return
+        row = await hot_fetchrow(Q_BOT_GET)
+        if not self._bot_loaded:
+            self._bot_loaded = True
+            if row is not None:
+                bot_data.update(pickle.loads(row["data"]))
+                self._bot_digest = _digest(row["data"])
+
+    # ---------- 写入：先记下变化，再合并成一次批量写 ----------
+    async def update_user_data(self, user_id, data):
+        if self.users.update(user_id, data):
+            await self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        if self.chats.update(chat_id, data):
+            await self._schedule_flush()
+
+    async def update_bot_data(self, data):
+        if not self._bot_loaded:
+            return  # 还没读过库，避免用空数据覆盖
+        blob = pickle.dumps(data)
+        if _digest(blob) != self._bot_digest:
+            self._bot_dirty = blob
+            await self._schedule_flush()
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        self._conv_dirty[(name, json.dumps(list(key)))] = None if new_state is None else pickle.dumps(new_state)
+        await self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self.users.drop(user_id)
+        await self._schedule_flush()
+
+    async def drop_chat_data(self, chat_id):
+        self.chats.drop(chat_id)
+        await self._schedule_flush()
+
+    async def _schedule_flush(self):
+        # 同一轮里 PTB 并发调用的 update_* 共用一个写入任务：任务在这些调用都登记完之后才运行
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        await asyncio.shield(self._flush_task)
+
+    def _pending(self):
+        return bool(self.users.dirty or self.users.dropped or self.chats.dirty or self.chats.dropped
+                    or self._bot_dirty is not None or self._conv_dirty)
+
+    async def _flush(self):
+        try:
+            await asyncio.sleep(0)
+            # 写入期间又有新变化时接着写，等待本任务的调用方返回时数据一定已落库
+            while self._pending():
+                await self.users.write()
+                await self.chats.write()
+                await self._write_bot_and_conversations()
+            self.flushes += 1
+        finally:
+            self._flush_task = None
+
+    async def _write_bot_and_conversations(self):
+        blob, self._bot_dirty = self._bot_dirty, None
+        conv, self._conv_dirty = self._conv_dirty, {}
+        try:
+            if blob is not None:
+                await hot_execute(Q_BOT_PUT, blob)
+                self._bot_digest = _digest(blob)
+                blob = None
+            puts = [(n, k, st) for (n, k), st in conv.items() if st is not None]
+            drops = [(n, k) for (n, k), st in conv.items() if st is None]
+            if puts:
+                await hot_execute(Q_CONV_PUT, *map(list, zip(*puts)))
+            if drops:
+                await hot_execute(Q_CONV_DROP, *map(list, zip(*drops)))
+        except Exception:
+            if blob is not None and self._bot_dirty is None:
+                self._bot_dirty = blob
+            for key, st in conv.items():
+                self._conv_dirty.setdefault(key, st)
+            raise
+
+    async def flush(self):
+        # Application.stop() 最后调用：等正在进行的写入完成，再把剩下的写掉
+        if self._flush_task is not None:
+            try:
+                await self._flush_task
+            except Exception as e:
+                print(f"持久化写入失败：{e}")
+        if self._pending():
+            await self._schedule_flush()
+
+    def stats(self):
+        return {
+            "flushes": self.flushes,
+            "user_loads": self.users.loads, "user_writes": self.users.writes, "user_unchanged": self.users.skipped,
+            "chat_loads": self.chats.loads, "chat_writes": self.chats.writes, "chat_unchanged": self.chats.skipped,
+            "user_absent": self.users.absent, "chat_absent": self.chats.absent,
+            "user_evicted": self.users.evicted, "chat_evicted": self.chats.evicted,
+            "conflicts": self.users.conflicts + self.chats.conflicts,
+        }
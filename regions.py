@@ -0,0 +1,77 @@
+import os
+from utils import hot_fetch, hot_query, listen, normalize_text
+
+REGION_MAX_LEN = int(os.environ.get("REGION_MAX_LEN", "32"))  # 超过这个长度的消息不可能是地区名
+
+Q_ALL = hot_query(
+    "member_regions_all",
+    "SELECT chat_id, user_id, region FROM members WHERE region IS NOT NULL AND region <> ''"
+)
+Q_CHAT = hot_query(
+    "member_regions_chat",
+    "SELECT user_id, region FROM members WHERE chat_id=$1 AND region IS NOT NULL AND region <> ''"
+)
+
+# 每个群：规范化地区名 -> 该地区会员 user_id 集合，以及用于显示的原始地区名。
+# 数据来自 members.region，变更时由数据库触发器通知按群重新加载。
+class RegionIndex:
+    def __init__(self):
+        self.chats = {}   # chat_id -> {规范化地区名: set(user_id)}
+        self.labels = {}  # chat_id -> {规范化地区名: 原始地区名}
+        self.reloads = 0
+
+    def _build(self, rows):
+        users, labels = {}, {}
+        for user_id, region in rows:
+            key = normalize_text(region)
+            if key:
+                users.setdefault(key, set()).add(user_id)
+                labels.setdefault(key, region.strip())
+        return users, labels
+
+    def match(self, chat_id, norm):
+        # norm 为 normalize_text 处理过的消息；恰好是本群某个地区名时返回它，否则返回 None
+        regions = self.chats.get(chat_id)
+        if not regions or len(norm) > REGION_MAX_LEN:
+            return None
+        return norm if norm in regions else None
+
+    def members(self, chat_id, key):
+        return self.chats.get(chat_id, {}).get(key, set())
+
+    def label(self, chat_id, key):
+        return self.labels.get(chat_id, {}).get(key, key)
+
+    async def warm(self):
+        rows = await hot_fetch(Q_ALL)
+        by_chat = {}
+        for r in rows:
+            by_chat.setdefault(r["chat_id"], []).append((r["user_id"], r["region"]))
+        self.chats, self.labels = {}, {}
+        for chat_id, chat_rows in by_chat.items():
+            self.chats[chat_id], self.labels[chat_id] = self._build(chat_rows)
+        return len(rows)
+
+    async def reload_chat(self, chat_id):
+        rows = await hot_fetch(Q_CHAT, chat_id)
+        users, labels = self._build((r["user_id"], r["region"]) for r in rows)
+        if users:
+            self.chats[chat_id], self.labels[chat_id] = users, labels
+        else:
+            self.chats.pop(chat_id, None)
+            self.labels.pop(chat_id, None)
+        self.reloads += 1
+
+    async def on_changed(self, payload):
+        # payload 为地区有变动的 chat_id；为空表示整表变更，或监听连接重连后的重新同步（断开期间的通知可能丢了），
+        # 都整表重新加载。断开期间照常用旧索引回复
+        try:
+            if payload:
+                await self.reload_chat(int(payload))
+            else:
+                await self.warm()
+        except Exception as e:
+            print(f"地区索引重新加载失败：{e}")
+
+regions = RegionIndex()
+listen("member_regions_changed", regions.on_changed)
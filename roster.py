@@ -0,0 +1,128 @@
+from array import array
+from utils import hot_fetch, hot_query, listen, today_str
+
+Q_TODAY = hot_query("checkin_day_all", "SELECT chat_id, user_id FROM checkins WHERE day=$1")
+Q_CHAT_DAY = hot_query("checkin_day_chat", "SELECT user_id FROM checkins WHERE chat_id=$1 AND day=$2")
+
+# 单个群的打卡名单。成员序号跨天保留，当天的打卡情况用位图表示，
+# 判断是否已打卡只需一次字典查找和一次位运算。
+class ChatRoster:
+    __slots__ = ("index", "users", "names", "bits", "order")
+
+    def __init__(self):
+        self.index = {}          # user_id -> 成员序号
+        self.users = array("q")  # 成员序号 -> user_id
+        self.names = []          # 成员序号 -> 显示名（没有时为 None）
+        self.bits = bytearray()  # 当天已打卡位图
+        self.order = array("l")  # 当天打卡顺序（成员序号）
+
+    def reset(self):
+        self.bits = bytearray()
+        self.order = array("l")
+
+    def __len__(self):
+        return len(self.order)
+
+    def has(self, user_id):
+        idx = self.index.get(user_id)
+        if idx is None or (idx >> 3) >= len(self.bits):
+            return False
+        return bool(self.bits[idx >> 3] & (1 << (idx & 7)))
+
+    def add(self, user_id, name=None):
+        idx = self.index.get(user_id)
+        if idx is None:
+            idx = len(self.users)
+            self.index[user_id] = idx
+            self.users.append(user_id)
+            self.names.append(name)
+        elif name:
+            self.names[idx] = name
+        byte, bit = idx >> 3, 1 << (idx & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if self.bits[byte] & bit:
+            return False
+        self.bits[byte] |= bit
+        self.order.append(idx)
+        return True
+
+    def name(self, user_id):
+        idx = self.index.get(user_id)
+        return None if idx is None else self.names[idx]
+
+    def entries(self, start=0, stop=None):
+        # 按打卡顺序返回 (user_id, 显示名)
+        return [(self.users[i], self.names[i]) for i in self.order[start:stop]]
+
+# 所有群当天的打卡名单，以 today_str() 为日界自动翻篇。
+# 多实例部署时其他实例的打卡经 checkins_added 通知并入（追加在末尾，只有 user_id 没有显示名）；
+# 通知在对方批量落库后才到（约 CHECKIN_FLUSH_INTERVAL 秒），这段时间内重复打卡的去重提示可能不准，
+# 但数据库唯一索引保证不会重复计数。
+class CheckinRoster:
+    def __init__(self):
+        self.day = None
+        self.chats = {}
+
+    def _get(self, chat_id):
+        today = today_str()
+        if today != self.day:
+            self.day = today
+            for r in self.chats.values():
+                r.reset()
+        r = self.chats.get(chat_id)
+        if r is None:
+            r = self.chats[chat_id] = ChatRoster()
+        return r
+
+    def has(self, chat_id, user_id):
+        return self._get(chat_id).has(user_id)
+
+    def add(self, chat_id, user_id, name=None):
+        return self._get(chat_id).add(user_id, name)
+
+    def chat(self, chat_id):
+        return self._get(chat_id)
+
+    async def warm(self):
+        # 启动时从数据库加载当天的打卡记录
+        today = today_str()
+        rows = await hot_fetch(Q_TODAY, today)
+        self.day = today
+        self.chats = {}
+        for r in rows:
+            self._get(r["chat_id"]).add(r["user_id"])
+        return len(rows)
+
+    async def sync(self):
+        # 监听连接重连后补上断开期间其他实例的打卡；只追加，已有的顺序和显示名不变
+        today = today_str()
+        rows = await hot_fetch(Q_TODAY, today)
+        if today == today_str():
+            for r in rows:
+                self.add(r["chat_id"], r["user_id"])
+        return len(rows)
+
+    async def on_added(self, payload):
+        # payload 为 "chat_id:日期:user_id,..."，或 "chat_id:日期"（需要读库），空表示需要全量同步
+        try:
+            if not payload:
+                await self.sync()
+                return
+            chat_id, day, *users = payload.split(":", 2)
+            chat_id = int(chat_id)
+            if day != today_str():
+                return
+            if users:
+                user_ids = [int(u) for u in users[0].split(",")]
+            else:
+                user_ids = [r["user_id"] for r in await hot_fetch(Q_CHAT_DAY, chat_id, day)]
+            if day == today_str():
+                chat = self._get(chat_id)
+                for user_id in user_ids:
+                    chat.add(user_id)
+        except Exception as e:
+            print(f"合并其他实例的打卡失败：{e}")
+
+roster = CheckinRoster()
+listen("checkins_added", roster.on_added)
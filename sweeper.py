@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+import os
+import time
+from collections import defaultdict
+from telegram.error import TelegramError
+from dispatcher import ScheduleDispatcher
+from leader import leader
+from outbound import BROADCAST
+from utils import get_db, hot_fetch, hot_query
+
+# 每天定时扫描会员到期情况：提前提醒快到期的会员，删除已过期的会员
+SWEEP_TIME = datetime.time.fromisoformat(os.environ.get("MEMBER_SWEEP_TIME", "09:00"))
+REMIND_DAYS = [int(d) for d in os.environ.get("MEMBER_REMIND_DAYS", "7,3,1").split(",") if d.strip()]
+SWEEP_CONCURRENCY = int(os.environ.get("MEMBER_SWEEP_CONCURRENCY", "8"))
+MESSAGE_LIMIT = 4000  # 单条消息字数上限（Telegram 为 4096）
+STATE_KEY = "member_sweep_day"  # config 表里记录最近一次扫描的日期
+
+# 一条语句扫 members_expire 索引上 expire_date < 今天 + 最大提醒天数 的一段范围，与会员总数无关：
+# 删除已过期的会员；剩余天数已到某个提醒点、但过了这个提醒点之后还没提醒过的会员记下提醒日期。
+# 按"跨过提醒点"而不是"正好剩 N 天"判断，停机错过的提醒下一次扫描补发，重复扫描也不会重复提醒
+Q_SWEEP = hot_query(
+    "member_sweep",
+    "WITH purged AS ("
+    " DELETE FROM members WHERE expire_date < $1"
+    " RETURNING chat_id, user_id, name, expire_date, FALSE AS remind"
+    "), reminded AS ("
+    " UPDATE members SET last_reminded = $1"
+    " WHERE expire_date BETWEEN $1 AND $1 + $3::int"
+    " AND (last_reminded IS NULL OR last_reminded < expire_date -"
+    " (SELECT min(d) FROM unnest($2::int[]) AS d WHERE d >= expire_date - $1))"
+    " RETURNING chat_id, user_id, name, expire_date, TRUE AS remind"
+    ") SELECT * FROM purged UNION ALL SELECT * FROM reminded ORDER BY expire_date"
+)
+
+def _last_slot(now):
+    # 最近一次已过去的扫描时刻
+    slot = datetime.datetime.combine(now.date(), SWEEP_TIME)
+    return slot if slot <= now else slot - datetime.timedelta(days=1)
+
+def _chunks(header, lines):
+    # 按消息长度上限拆成多条
+    text = header
+    for line in lines:
+        if len(text) + len(line) + 1 > MESSAGE_LIMIT:
+            yield text
+            text = header
+        text += "\n" + line
+    yield text
+
+class MemberSweeper:
+    def __init__(self, concurrency=SWEEP_CONCURRENCY):
+        self.dispatcher = ScheduleDispatcher(self._fire, concurrency=1)
+        self.concurrency = concurrency
+        self._bot = None
+        self._lock = asyncio.Lock()  # 定时扫描和接管后的补扫不同时进行
+        self._catch_up_task = None
+        self.last_run = None  # 最近一次的统计
+
+    def start(self, bot):
+        self._bot = bot
+        # 锚点取最近一次已过去的扫描时刻，下一次触发就是今天或明天的 SWEEP_TIME；
+        # 停机错过的那次由接管 0 号分片时的补扫处理
+        self.dispatcher.add("sweep", 24 * 60, anchor=_last_slot(datetime.datetime.now()))
+        self.dispatcher.start()
+        leader.on_change(self._on_leadership)
+
+    async def stop(self):
+        await self.dispatcher.stop()
+        self.dispatcher.clear()
+        if self._catch_up_task is not None:
+            self._catch_up_task.cancel()
+            await asyncio.gather(self._catch_up_task, return_exceptions=True)
+
+    async def _fire(self, key, planned):
+        # 多实例部署时只由 0 号分片的持有者执行
+        if leader.is_leader(0):
+            await self.sweep()
+
+    async def _on_leadership(self, gained, lost):
+        # 启动或接管时检查最近一次扫描时刻是否已扫过；不在回调里等待，以免挡住分片变更
+        if 0 in gained and (self._catch_up_task is None or self._catch_up_task.done()):
+            self._catch_up_task = asyncio.create_task(self._catch_up())
+
+    async def _catch_up(self):
+        try:
+            db = await get_db()
+            last = await db.fetchval("SELECT value FROM config WHERE key = $1", STATE_KEY)
+            if last is None or datetime.date.fromisoformat(last) < _last_slot(datetime.datetime.now()).date():
+                print(f"会员到期扫描：上次扫描 {last}，补扫一次")
+                await self.sweep()
+        except Exception as e:
+            print(f"会员到期补扫失败：{e}")
+
+    async def sweep(self, today=None):
+        async with self._lock:
+            return await self._sweep(today or datetime.date.today())
+
+    async def _sweep(self, today):
+        started = time.perf_counter()
+        rows = await hot_fetch(Q_SWEEP, today, REMIND_DAYS, max(REMIND_DAYS, default=-1))
+        db = await get_db()
+        await db.execute(
+            "INSERT INTO config(key, value) VALUES($1, $2) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+            STATE_KEY, today.isoformat()
+        )
+        expiring = [r for r in rows if r["remind"]]
+        purged = [r for r in rows if not r["remind"]]
+        db_time = time.perf_counter() - started
+
+        # 按群汇总，每个群发一条（超长时拆成几条）
+        messages = []
+        by_chat = defaultdict(list)
+        for r in expiring:
+            left = (r["expire_date"] - today).days
+            by_chat[r["chat_id"]].append(f"• {r['name']} (ID:{r['user_id']}) {r['expire_date']} 到期，还剩 {left} 天")
+        for chat_id, lines in by_chat.items():
+            messages += [(chat_id, t) for t in _chunks("⏰ 以下会员即将到期，请及时续费：", lines)]
+        by_chat = defaultdict(list)
+        for r in purged:
+            by_chat[r["chat_id"]].append(f"• {r['name']} (ID:{r['user_id']}) {r['expire_date']} 到期")
+        for chat_id, lines in by_chat.items():
+            messages += [(chat_id, t) for t in _chunks("🗑 以下会员已到期，已从会员列表移除：", lines)]
+
+        sent = failed = 0
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def send(chat_id, text):
+            nonlocal sent, failed
+            async with sem:
+                try:
+                    await self._bot.send_message(chat_id, text, rate_limit_args=BROADCAST)
+                    sent += 1
+                except TelegramError as e:
+                    failed += 1
+                    print(f"会员到期通知发送失败 chat={chat_id}：{e}")
+
+        if self._bot is not None:
+            await asyncio.gather(*(send(c, t) for c, t in messages))
+        elapsed = time.perf_counter() - started
+        self.last_run = {
+            "day": today, "reminded": len(expiring), "purged": len(purged),
+            "messages": sent, "failed": failed, "db_time": db_time, "elapsed": elapsed,
+        }
+        print(f"会员到期扫描完成：提醒 {len(expiring)} 人，删除 {len(purged)} 人，"
+              f"通知 {sent} 条（失败 {failed}），数据库 {db_time:.3f}s，总用时 {elapsed:.2f}s")
+        return self.last_run
+
+member_sweeper = MemberSweeper()
@@ -0,0 +1,63 @@
+# 打卡批量写入失败的处理：坏数据不能卡住整个队列。连接类错误的测试不需要数据库；
+# 坏数据拆批的测试需要 DATABASE_URL，没有设置时跳过。
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DSN = os.environ.get("DATABASE_URL")
+
+import checkin_writer
+from checkin_writer import CheckinWriter
+
+CHAT = -9_000_000_001  # 测试用的群，不会和真实数据冲突
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_transient_errors_retry_then_dead_letter(tmp_path, monkeypatch):
+    path = tmp_path / "dead.jsonl"
+    monkeypatch.setattr(checkin_writer, "CHECKIN_DEAD_LETTER", str(path))
+    w = CheckinWriter(10, 10, 0.001)
+    calls = []
+
+    async def flush(batch):
+        calls.append(len(batch))
+        return OSError("connection refused")
+
+    w._flush = flush
+    asyncio.run(w._write([(1, CHAT, "2030-01-01"), (2, CHAT, "2030-01-01")], retries=3))
+    # 连接类错误只整批重试，不拆批
+    assert calls == [2, 2, 2, 2]
+    assert w.dead_letters == 2
+    assert [r["user_id"] for r in _read(path)] == [1, 2]
+
+@pytest.mark.skipif(not DSN, reason="需要 DATABASE_URL 指向可连接的 PostgreSQL")
+def test_bad_row_isolated(tmp_path, monkeypatch):
+    import utils
+    path = tmp_path / "dead.jsonl"
+    monkeypatch.setattr(checkin_writer, "CHECKIN_DEAD_LETTER", str(path))
+
+    async def main():
+        db = await utils.get_db()
+        try:
+            w = CheckinWriter(10, 100, 0.001)
+            batch = [(uid, CHAT, "2030-01-01") for uid in range(1, 20)]
+            batch.insert(7, (99, CHAT, "not-a-day"))
+            await w._write(batch)
+            written = await db.fetchval("SELECT count(*) FROM checkins WHERE chat_id = $1", CHAT)
+            return w, written
+        finally:
+            for table in ("checkins", "checkin_stats", "checkin_months"):
+                await db.execute(f"DELETE FROM {table} WHERE chat_id = $1", CHAT)
+            await utils.close_db()
+
+    w, written = asyncio.run(main())
+    assert written == 19
+    assert w.dead_letters == 1
+    assert [(r["user_id"], r["day"]) for r in _read(path)] == [(99, "not-a-day")]
@@ -0,0 +1,62 @@
+# 定时消息下一次触发时间（dispatcher.next_fire_time）：锚点对齐、时段、月末/闰日的有效期边界、夏令时。
+# 时间都是不带时区的本地时间，按墙上时间计算：夏令时切换当天每日定时仍在同一个钟点。
+import os
+import sys
+from datetime import date, datetime, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dispatcher import next_fire_time
+
+def test_anchor_alignment():
+    anchor = datetime(2024, 5, 1, 10, 7)
+    # 锚点之前：第一次就是锚点
+    assert next_fire_time(anchor, 15, datetime(2024, 5, 1, 9, 0)) == anchor
+    # 之后对齐到 anchor + k * interval，严格晚于 after
+    assert next_fire_time(anchor, 15, datetime(2024, 5, 1, 10, 50)) == datetime(2024, 5, 1, 10, 52)
+    assert next_fire_time(anchor, 15, datetime(2024, 5, 1, 10, 52)) == datetime(2024, 5, 1, 11, 7)
+    # 间隔不整除一天时，第二天的触发点仍按锚点推算，不从零点重新开始
+    assert next_fire_time(anchor, 25, datetime(2024, 5, 2, 0, 0)) == datetime(2024, 5, 2, 0, 17)
+
+def test_windows_skip_to_aligned_point():
+    anchor = datetime(2024, 5, 1, 10, 7)
+    windows = ((time(12), time(13)),)
+    # 时段外直接跳到时段开始后的第一个对齐点，不在时段外触发
+    assert next_fire_time(anchor, 15, datetime(2024, 5, 1, 10, 50), windows) == datetime(2024, 5, 1, 12, 7)
+    # 当天时段已过：第二天第一个时段
+    assert next_fire_time(anchor, 15, datetime(2024, 5, 1, 12, 59), windows) == datetime(2024, 5, 2, 12, 7)
+    two = ((time(8), time(9)), (time(20), time(21)))
+    assert next_fire_time(anchor, 60, datetime(2024, 5, 1, 9, 30), two) == datetime(2024, 5, 1, 20, 7)
+
+def test_month_end_and_leap_day():
+    anchor = datetime(2024, 1, 1, 9, 0)
+    # 每日定时跨月末、闰日
+    assert next_fire_time(anchor, 1440, datetime(2024, 1, 31, 9, 0)) == datetime(2024, 2, 1, 9, 0)
+    assert next_fire_time(anchor, 1440, datetime(2024, 2, 28, 9, 0)) == datetime(2024, 2, 29, 9, 0)
+    assert next_fire_time(anchor, 1440, datetime(2024, 2, 29, 9, 0)) == datetime(2024, 3, 1, 9, 0)
+    # 终止日期为月末：当天最后一次之后不再触发
+    assert next_fire_time(anchor, 60, datetime(2024, 1, 31, 22, 30), end_date=date(2024, 1, 31)) \
+        == datetime(2024, 1, 31, 23, 0)
+    assert next_fire_time(anchor, 60, datetime(2024, 1, 31, 23, 0), end_date=date(2024, 1, 31)) is None
+    # 开始日期为下月 1 日：从当天零点后的第一个对齐点开始
+    assert next_fire_time(anchor, 60, datetime(2024, 1, 15), start_date=date(2024, 2, 1)) == datetime(2024, 2, 1, 0, 0)
+    assert next_fire_time(datetime(2024, 1, 1, 9, 20), 45, datetime(2024, 1, 15), start_date=date(2024, 2, 1)) \
+        == datetime(2024, 2, 1, 0, 20)
+    # 开始日期 + 时段：3 月 1 日的时段
+    assert next_fire_time(anchor, 30, datetime(2024, 2, 29, 23, 0), ((time(8), time(9)),),
+                          start_date=date(2024, 3, 1)) == datetime(2024, 3, 1, 8, 0)
+
+def test_dst_keeps_wall_clock():
+    # 美东 2024-03-10 02:00 跳到 03:00、2024-11-03 02:00 回到 01:00；本地时间不带时区，
+    # 每日 09:00 的定时在切换前后都是 09:00，时段按钟点判断
+    anchor = datetime(2024, 3, 1, 9, 0)
+    assert next_fire_time(anchor, 1440, datetime(2024, 3, 9, 9, 0)) == datetime(2024, 3, 10, 9, 0)
+    assert next_fire_time(anchor, 1440, datetime(2024, 3, 10, 9, 0)) == datetime(2024, 3, 11, 9, 0)
+    assert next_fire_time(anchor, 1440, datetime(2024, 11, 2, 9, 0)) == datetime(2024, 11, 3, 9, 0)
+    hourly = next_fire_time(anchor, 60, datetime(2024, 3, 10, 1, 30), ((time(8), time(9)),))
+    assert hourly == datetime(2024, 3, 10, 8, 0)
+
+def test_no_fire_inside_empty_range():
+    anchor = datetime(2024, 1, 1, 9, 0)
+    # 开始日期晚于终止日期：永不触发
+    assert next_fire_time(anchor, 60, anchor, start_date=date(2024, 3, 1), end_date=date(2024, 2, 1)) is None
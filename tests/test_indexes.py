@@ -0,0 +1,26 @@
+# 热点查询的索引检查：每条登记的热点查询都要在 migrate.INDEXED_QUERIES（并用 EXPLAIN 确认走了索引）
+# 或 migrate.UNINDEXED_QUERIES（写明原因）里。EXPLAIN 部分需要 DATABASE_URL，会先执行迁移。
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import migrate
+
+DSN = os.environ.get("DATABASE_URL")
+
+def test_every_hot_query_listed():
+    missing, stale = migrate.unlisted_queries()
+    assert missing == [], f"新的热点查询需要登记到 INDEXED_QUERIES 或 UNINDEXED_QUERIES：{missing}"
+    assert stale == [], f"已不存在的热点查询：{stale}"
+    assert not set(migrate.INDEXED_QUERIES) & set(migrate.UNINDEXED_QUERIES)
+
+@pytest.mark.skipif(not DSN, reason="需要 DATABASE_URL 指向可连接的 PostgreSQL")
+def test_hot_queries_use_indexes():
+    async def main():
+        await migrate.migrate(DSN)
+        return await migrate.check_indexes(DSN)
+    assert asyncio.run(main()) == []
@@ -0,0 +1,163 @@
+# 多实例选主（leader.LeaderElector）对着真实 PostgreSQL 的测试：一个进程里跑 2-3 个选举器，
+# 各自一条锁连接，模拟多个实例。没有设置 DATABASE_URL 时跳过。
+# 选举器用的是固定的 advisory lock 编号，不要对着正在运行机器人的库跑。
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DSN = os.environ.get("DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DSN, reason="需要 DATABASE_URL 指向可连接的 PostgreSQL")
+
+import asyncpg
+from leader import LEADER_CHANNEL, LeaderElector
+
+RETRY = 0.5
+SHARDS = 4
+
+class Cluster:
+    def __init__(self, shards=SHARDS, retry=RETRY):
+        self.shards = shards
+        self.retry = retry
+        self.electors = []
+        self.overlaps = []  # 同一分片同时被多个实例持有时的记录
+        self.listener = None
+        self._watch = None
+
+    async def start(self, n):
+        # 各实例共用一条监听连接收 NOTIFY（实际部署中每个实例各有 utils.db_listener）
+        self.listener = await asyncpg.connect(DSN)
+        await self.listener.add_listener(LEADER_CHANNEL, lambda *a: [e.wake() for e in self.electors])
+        for i in range(n):
+            self.spawn(f"test{i}")
+        self._watch = asyncio.create_task(self._check_exclusive())
+
+    def spawn(self, name):
+        e = LeaderElector(shards=self.shards, retry=self.retry, dsn=DSN)
+        e.instance = name
+        e.start()
+        self.electors.append(e)
+        return e
+
+    async def _check_exclusive(self):
+        # 每毫秒检查一次各实例认为自己持有的分片有没有重叠
+        while True:
+            seen = {}
+            for e in self.electors:
+                for s in e.owned:
+                    if s in seen:
+                        self.overlaps.append((s, seen[s], e.instance))
+                    seen[s] = e.instance
+            await asyncio.sleep(0.001)
+
+    async def settled(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            held = [s for e in self.electors for s in e.owned]
+            if sorted(held) == list(range(self.shards)):
+                return time.monotonic()
+            await asyncio.sleep(0.005)
+        raise AssertionError(f"{timeout}s 内分片没有分完：{[sorted(e.owned) for e in self.electors]}")
+
+    async def crash(self, e):
+        # 不解锁、不通知：取消任务后直接断开连接，相当于进程被杀
+        self.electors.remove(e)
+        e._task.cancel()
+        e._notifier.cancel()
+        e._conn.remove_termination_listener(e._on_conn_lost)
+        e._conn.terminate()
+
+    async def server_holders(self):
+        # 从 pg_locks 看每个分片锁被几个会话持有
+        conn = await asyncpg.connect(DSN)
+        try:
+            rows = await conn.fetch(
+                "SELECT objid AS shard, count(*) AS n FROM pg_locks "
+                "WHERE locktype='advisory' AND classid=$1 AND objsubid=2 AND granted GROUP BY objid",
+                7230002
+            )
+        finally:
+            await conn.close()
+        return {r["shard"]: r["n"] for r in rows}
+
+    async def stop(self):
+        if self._watch is not None:
+            self._watch.cancel()
+        for e in list(self.electors):
+            await e.stop()
+        self.electors = []
+        if self.listener is not None:
+            await self.listener.close()
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 60))
+
+def test_shards_never_held_twice():
+    async def main():
+        cluster = Cluster()
+        await cluster.start(1)
+        try:
+            await cluster.settled()
+            assert len(cluster.electors[0].owned) == SHARDS
+            # 新实例加入：持有超过配额（分片数 / 实例数，向上取整）的实例先停再交出多余分片
+            for name in ("test1", "test2"):
+                cluster.spawn(name)
+                await asyncio.sleep(cluster.retry * 3)
+                await cluster.settled()
+                quota = -(-SHARDS // len(cluster.electors))
+                assert all(len(e.owned) <= quota for e in cluster.electors)
+            assert len(cluster.electors[1].owned) == 2
+            holders = await cluster.server_holders()
+            assert sorted(holders) == list(range(SHARDS))
+            assert all(n == 1 for n in holders.values())
+            # 正常退出交接
+            await cluster.electors.pop(0).stop()
+            await cluster.settled()
+            assert all(n == 1 for n in (await cluster.server_holders()).values())
+        finally:
+            await cluster.stop()
+        assert cluster.overlaps == []
+    run(main())
+
+def test_takeover_after_crash_within_retry():
+    async def main():
+        cluster = Cluster(shards=2)
+        await cluster.start(2)
+        try:
+            await cluster.settled()
+            victim = next(e for e in cluster.electors if e.owned)
+            lost = set(victim.owned)
+            crashed_at = time.monotonic()
+            await cluster.crash(victim)
+            survivor = cluster.electors[0]
+            while not lost <= survivor.owned:
+                assert time.monotonic() - crashed_at < RETRY + 0.5, "崩溃实例的分片没有在 LEADER_RETRY 内被接管"
+                await asyncio.sleep(0.005)
+        finally:
+            await cluster.stop()
+        assert cluster.overlaps == []
+    run(main())
+
+def test_slow_callback_keeps_shards():
+    # 分片变更回调（加载定时消息等）比 retry 慢得多时，锁不会因心跳超时被放掉
+    async def main():
+        e = LeaderElector(shards=2, retry=RETRY, dsn=DSN)
+
+        async def slow(gained, lost):
+            await asyncio.sleep(RETRY * 4)
+        e.on_change(slow)
+        e.start()
+        try:
+            deadline = time.monotonic() + 5
+            while e.owned != {0, 1}:
+                assert time.monotonic() < deadline
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(RETRY * 6)
+            assert e.owned == {0, 1} and e.lost == 0
+        finally:
+            await e.stop()
+    run(main())
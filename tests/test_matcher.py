@@ -0,0 +1,48 @@
+# 关键词自动机增量更新：构建之后随机增删关键词，每一步的匹配结果都要和重新整体构建的一致
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from matcher import KeywordMatcher
+
+def _rebuilt(m):
+    fresh = KeywordMatcher()
+    for k in m._values:
+        fresh.add(k, m.get(k))
+    return fresh
+
+def test_incremental_matches_rebuild():
+    rng = random.Random(1)
+    # 小字母表让关键词之间大量互为前缀/后缀，失败指针改动多
+    word = lambda lo, hi: "".join(rng.choice("abcd") for _ in range(rng.randint(lo, hi)))
+    m = KeywordMatcher()
+    for _ in range(30):
+        m.add(word(3, 6), "r")
+    m.search("")  # 整体构建，之后的增删走增量更新
+    for step in range(600):
+        if rng.random() < 0.65 or not len(m):
+            k = word(3, 7)
+            m.add(k, k.upper())
+        else:
+            m.remove(rng.choice(list(m._values)))
+        fresh = _rebuilt(m)
+        for _ in range(5):
+            text = word(0, 30)
+            assert m.search(text) == fresh.search(text), (step, text)
+
+def test_rules_sharing_normalized_keyword():
+    # "Hi" 和 "hi" 规范化后相同，删掉一条另一条仍然生效
+    from handlers import autoreply
+    autoreply.matcher.clear()
+    autoreply._rules.clear()
+    autoreply._add_rule("Hi", "A")
+    autoreply._add_rule("hi", "B")
+    assert autoreply.matcher.search("oh hi there") == ("hi", "A")
+    autoreply._remove_rule("Hi")
+    assert autoreply.matcher.search("oh hi there") == ("hi", "B")
+    autoreply._remove_rule("Hi")  # 重复删除（本实例删除后又收到 NOTIFY）无影响
+    assert autoreply.matcher.search("oh hi there") == ("hi", "B")
+    autoreply._remove_rule("hi")
+    assert autoreply.matcher.search("oh hi there") is None
@@ -0,0 +1,38 @@
+# 按会话排序的更新处理器：同一会话按顺序、并发名额只给正在执行的更新（排队的不占名额）
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from updates import ChatOrderedUpdateProcessor
+
+def _update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+def test_order_and_slots():
+    async def main():
+        p = ChatOrderedUpdateProcessor(2)
+        running = peak = 0
+        done = []
+
+        async def handle(chat_id, i):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 if chat_id == 1 else 0)
+            done.append((chat_id, i))
+            running -= 1
+
+        # 1 号群刷屏 20 条，2、3 号群各 1 条：2、3 号群不用等 1 号群排完
+        tasks = [asyncio.create_task(p.process_update(_update(1), handle(1, i))) for i in range(20)]
+        tasks += [asyncio.create_task(p.process_update(_update(c), handle(c, 0))) for c in (2, 3)]
+        await asyncio.gather(*tasks)
+        return p, peak, done
+
+    p, peak, done = asyncio.run(main())
+    assert peak <= p.max_concurrent_updates
+    assert [i for c, i in done if c == 1] == list(range(20))
+    assert done.index((2, 0)) < 5 and done.index((3, 0)) < 5
+    assert p.processed == 22 and not p._shards
@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import time
+from collections import deque
+
+# 排查"机器人慢"用的跟踪模式，默认关闭；环境变量 TRACE=1 启动即打开，运行中用 /trace 开关。
+# 打开后：
+#   - 每条更新记录各处理器耗时（span），以及其中的数据库时间、Bot API 时间、限速排队时间；
+#     超过 TRACE_SLOW_UPDATE_MS 的更新打印一行耗时拆分；
+#   - 连接池的连接挂上 asyncpg 查询日志，超过 TRACE_SLOW_QUERY_MS 的 SQL 连同参数的形状
+#     （类型和长度，不含内容）打印出来；
+#   - /trace profile N 用 cProfile 采样 N 秒，结果写到 TRACE_DIR。
+# 关闭时各埋点只多一次 enabled 判断；查询日志每条约 10 µs，只在打开期间挂在连接上。
+enabled = os.environ.get("TRACE", "").lower() in ("1", "true", "on", "yes")
+SLOW_UPDATE = float(os.environ.get("TRACE_SLOW_UPDATE_MS", "500")) / 1000
+SLOW_QUERY = float(os.environ.get("TRACE_SLOW_QUERY_MS", "100")) / 1000
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+PROFILE_MAX = 300  # 秒：cProfile 会让整个进程变慢一倍左右，限制最长采样时间
+
+# 连接归还连接池时 asyncpg 执行的重置语句，不算业务查询
+POOL_RESET = "SELECT pg_advisory_unlock_all()"
+
+_current = contextvars.ContextVar("update_trace", default=None)
+recent = deque(maxlen=20)  # 最近的慢更新（拆分后的文本）
+slow_queries = 0
+profiling = None           # 正在进行的采样的结束时刻
+
+class UpdateTrace:
+    __slots__ = ("update_id", "chat_id", "started", "spans", "db", "db_count", "api", "api_count", "wait", "queries")
+
+    def __init__(self, update_id, chat_id):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.started = time.perf_counter()
+        self.spans = []    # (处理器, 耗时)
+        self.db = 0.0
+        self.db_count = 0
+        self.api = 0.0
+        self.api_count = 0
+        self.wait = 0.0    # outbound 限速排队
+        self.queries = []  # 本条更新里的慢查询
+
+    def breakdown(self, total):
+        # 同一更新里并发的查询/请求会重叠，Python 时间按总时间减去各项估算，最少为 0
+        python = max(0.0, total - self.db - self.api - self.wait)
+        spans = "，".join(f"{name} {elapsed * 1000:.0f}ms" for name, elapsed in self.spans)
+        text = (
+            f"慢更新 update={self.update_id} chat={self.chat_id} 用时 {total * 1000:.0f}ms："
+            f"数据库 {self.db * 1000:.0f}ms（{self.db_count} 条）、API {self.api * 1000:.0f}ms（{self.api_count} 次）、"
+            f"限速排队 {self.wait * 1000:.0f}ms、Python {python * 1000:.0f}ms"
+        )
+        if spans:
+            text += f"；处理器：{spans}"
+        for q in self.queries:
+            text += f"\n  慢查询 {q}"
+        return text
+
+def enable(slow_update=None, slow_query=None):
+    global enabled, SLOW_UPDATE, SLOW_QUERY
+    if slow_update is not None:
+        SLOW_UPDATE = slow_update
+    if slow_query is not None:
+        SLOW_QUERY = slow_query
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+async def trace_update(update, coroutine, chat_id=None):
+    # 由 updates.ChatOrderedUpdateProcessor 在跟踪打开时调用；同一任务里的埋点通过 contextvar 找到这条更新
+    trace = UpdateTrace(getattr(update, "update_id", None), chat_id)
+    token = _current.set(trace)
+    try:
+        await coroutine
+    finally:
+        _current.reset(token)
+        total = time.perf_counter() - trace.started
+        if total >= SLOW_UPDATE:
+            text = trace.breakdown(total)
+            recent.append(text)
+            print(text)
+
+def add_span(name, elapsed):
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((name, elapsed))
+
+def add_api(elapsed):
+    trace = _current.get()
+    if trace is not None:
+        trace.api += elapsed
+        trace.api_count += 1
+
+def add_wait(elapsed):
+    trace = _current.get()
+    if trace is not None:
+        trace.wait += elapsed
+
+def shape(value):
+    # 参数的形状：类型 + 长度（数组再带元素类型），不记录内容
+    if value is None:
+        return "None"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (list, tuple)):
+        inner = type(value[0]).__name__ if value else ""
+        return f"{type(value).__name__}[{len(value)}]<{inner}>"
+    return type(value).__name__
+
+def log_query(record):
+    # asyncpg 查询日志回调（utils._init_connection 在跟踪打开时挂上）；
+    # asyncpg 用 call_soon 调用，上下文是执行查询的任务，能找到所属的更新
+    global slow_queries
+    if not enabled or record.query.startswith(POOL_RESET):
+        return
+    trace = _current.get()
+    if trace is not None:
+        trace.db += record.elapsed
+        trace.db_count += 1
+    if record.elapsed >= SLOW_QUERY:
+        slow_queries += 1
+        sql = " ".join(record.query.split())
+        text = (f"{record.elapsed * 1000:.0f}ms {sql[:200]} "
+                f"参数({', '.join(shape(a) for a in record.args or ())})")
+        if record.exception is not None:
+            text += f" 出错 {type(record.exception).__name__}"
+        if trace is not None:
+            trace.queries.append(text)
+        else:
+            print(f"慢查询 {text}")
+
+async def profile(seconds):
+    # 用 cProfile 采样 seconds 秒，写出 .prof（可用 snakeviz 等查看）和按累计耗时排序的 .txt；返回 (txt 路径, 摘要)
+    global profiling
+    if profiling is not None:
+        raise RuntimeError(f"已有采样进行中，约 {max(0, profiling - time.monotonic()):.0f} 秒后结束")
+    seconds = max(1, min(seconds, PROFILE_MAX))
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    base = os.path.join(TRACE_DIR, time.strftime("profile-%Y%m%d-%H%M%S"))
+    profiler = cProfile.Profile()
+    profiling = time.monotonic() + seconds
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        profiling = None
+    profiler.dump_stats(base + ".prof")
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    report = out.getvalue()
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(report)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("tottime").print_stats(12)
+    return base + ".txt", out.getvalue()
+
+def status():
+    return {
+        "enabled": enabled, "slow_update_ms": SLOW_UPDATE * 1000, "slow_query_ms": SLOW_QUERY * 1000,
+        "slow_updates": len(recent), "slow_queries": slow_queries, "profiling": profiling is not None,
+    }
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+from telegram.ext import BaseUpdateProcessor
+import tracing
+
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", "64"))
+
+def update_key(update):
+    # 同一个群/私聊的更新按顺序处理；没有会话信息的更新互不影响
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    return None
+
+class _Shard:
+    __slots__ = ("lock", "depth", "hol_max")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0      # 排队 + 正在处理的更新数
+        self.hol_max = 0.0  # 本分片内被前一条更新挡住的最长时间
+
+# 按 chat_id 分片：同一会话内严格按到达顺序执行，不同会话并发处理。
+# 先拿会话锁再占并发名额，排队中的更新不会占住其他会话的名额。
+# 分片在没有待处理更新时即释放，内存只和活跃会话数有关。
+#
+# 注意这里覆盖了 PTB 标为 @final 的 process_update（只是类型标注，运行时不检查）：
+# 基类的实现先占并发名额（self._semaphore）再调 do_process_update，会话锁只能在名额里面拿，
+# 一个刷屏的群排队的更新就能占满全部名额，其他群全被挡住。覆盖后仍用基类同一个 _semaphore
+# 作并发名额、名额数就是 max_concurrent_updates，只是把它挪到会话锁之后获取；
+# Application 只调用 process_update，对它来说语义不变。升级 PTB 时要核对基类实现是否变了。
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._shards = {}
+        self.processed = 0
+        self.hol_total = 0.0   # 会话内排队（队头阻塞）总时间
+        self.hol_max = 0.0
+        self.slot_total = 0.0  # 等待全局并发名额总时间
+        self.slot_max = 0.0
+        self._slot_waiting = 0
+
+    async def process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = self._shards[key] = _Shard()
+        shard.depth += 1
+        queued = time.monotonic()
+        try:
+            async with shard.lock:
+                hol = time.monotonic() - queued
+                self.hol_total += hol
+                if hol > shard.hol_max:
+                    shard.hol_max = hol
+                    if hol > self.hol_max:
+                        self.hol_max = hol
+                await self._run(update, coroutine)
+        finally:
+            shard.depth -= 1
+            if not shard.depth:
+                del self._shards[key]
+
+    async def _run(self, update, coroutine):
+        queued = time.monotonic()
+        self._slot_waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._slot_waiting -= 1
+        try:
+            waited = time.monotonic() - queued
+            self.slot_total += waited
+            self.slot_max = max(self.slot_max, waited)
+            await self.do_process_update(update, coroutine)
+        finally:
+            self._semaphore.release()
+        self.processed += 1
+
+    async def do_process_update(self, update, coroutine):
+        if tracing.enabled:
+            await tracing.trace_update(update, coroutine, update_key(update))
+        else:
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self, top=10):
+        deepest = sorted(self._shards.items(), key=lambda kv: kv[1].depth, reverse=True)[:top]
+        return {
+            "processed": self.processed,
+            "active_shards": len(self._shards),
+            "queued": sum(s.depth for s in self._shards.values()),
+            "waiting_for_slot": self._slot_waiting,
+            "hol_wait_total": self.hol_total,
+            "hol_wait_max": self.hol_max,
+            "slot_wait_total": self.slot_total,
+            "slot_wait_max": self.slot_max,
+            "deepest": [(k, s.depth, s.hol_max) for k, s in deepest],
+        }
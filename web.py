@@ -0,0 +1,121 @@
+import hmac
+import json
+import tornado.web
+from telegram import Update
+import metrics
+from broadcast import broadcaster
+from checkin_writer import checkin_writer
+from handlers import schedule, text
+from leader import leader
+from outbound import outbound
+from utils import db_stats
+
+# 同一个端口（render.yaml 分配的 PORT）上提供：
+#   POST /<WEBHOOK_PATH>  Telegram webhook（webhook 模式）
+#   GET  /metrics         Prometheus 指标
+#   GET  /healthz         健康检查
+# polling 模式也启动，只是没有 webhook 路由。
+
+class WebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, bot_app, secret):
+        self.bot_app = bot_app
+        self.secret = secret
+
+    async def post(self):
+        if self.secret and not hmac.compare_digest(
+                self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret):
+            raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except Exception as e:
+            print(f"webhook 收到无法解析的更新：{e!r}")
+            raise tornado.web.HTTPError(400)
+        if update:
+            await self.bot_app.update_queue.put(update)
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", metrics.CONTENT_TYPE)
+        self.write(metrics.render())
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("ok")
+
+def start_web(application, port, webhook_path=None, secret=None):
+    routes = [(r"/metrics", MetricsHandler), (r"/healthz", HealthHandler), (r"/", HealthHandler)]
+    if webhook_path:
+        routes.append((rf"/{webhook_path}/?", WebhookHandler, {"bot_app": application, "secret": secret}))
+    register_collectors(application)
+    return tornado.web.Application(routes).listen(port, address="0.0.0.0", xheaders=True)
+
+def _items(d, label):
+    return [({label: k}, v) for k, v in d.items()]
+
+def register_collectors(application):
+    # 各模块原有的 stats()，抓取 /metrics 时才读取
+    @metrics.collector
+    def text_stage():
+        return [("bot_text_messages_total", "counter", "文本消息分类结果", _items(text.text_stats, "outcome"))]
+
+    @metrics.collector
+    def updates():
+        s = application.update_processor.stats()
+        return [
+            ("bot_updates_processed_total", "counter", "已处理的更新数", [({}, s["processed"])]),
+            ("bot_updates_queued", "gauge", "排队 + 正在处理的更新数", [({}, s["queued"])]),
+            ("bot_updates_waiting_for_slot", "gauge", "等待全局并发名额的更新数", [({}, s["waiting_for_slot"])]),
+            ("bot_updates_hol_wait_seconds_total", "counter", "会话内排队总时间", [({}, s["hol_wait_total"])]),
+            ("bot_updates_slot_wait_seconds_total", "counter", "等待并发名额总时间", [({}, s["slot_wait_total"])]),
+        ]
+
+    @metrics.collector
+    def database():
+        s = db_stats.snapshot()
+        return [
+            ("bot_db_pool_size", "gauge", "连接池连接数", [({}, s["pool_size"])]),
+            ("bot_db_pool_in_use", "gauge", "正在使用的连接数", [({}, s["pool_in_use"])]),
+        ]
+
+    @metrics.collector
+    def telegram():
+        s = outbound.stats()
+        lanes = s["lanes"]
+        return [
+            ("bot_telegram_throttled_total", "counter", "收到 RetryAfter 的次数", [({}, s["throttled"])]),
+            ("bot_telegram_retry_after_seconds_total", "counter", "RetryAfter 要求等待的总秒数",
+             [({}, s["retry_after_seconds"])]),
+            ("bot_telegram_lane_depth", "gauge", "各通道排队中的请求数", [({"lane": k}, v["depth"]) for k, v in lanes.items()]),
+            ("bot_telegram_lane_sent_total", "counter", "各通道发出的请求数", [({"lane": k}, v["sent"]) for k, v in lanes.items()]),
+        ]
+
+    @metrics.collector
+    def persistence():
+        if application.persistence is None:
+            return []
+        return [("bot_persistence_events_total", "counter", "持久化读写次数", _items(application.persistence.stats(), "event"))]
+
+    @metrics.collector
+    def scheduler():
+        s = leader.stats()
+        d = schedule.dispatcher
+        return [
+            ("bot_leader_instances", "gauge", "在线实例数", [({}, s["instances"])]),
+            ("bot_leader_owned_shards", "gauge", "本实例持有的定时任务分片数", [({}, len(s["owned"]))]),
+            ("bot_leader_connected", "gauge", "选主锁连接是否正常", [({}, s["connected"])]),
+            ("bot_leader_changes_total", "counter", "分片获得/失去次数",
+             [({"change": "acquired"}, s["acquired"]), ({"change": "lost"}, s["lost"])]),
+            ("bot_schedules_loaded", "gauge", "本实例正在调度的定时消息数", [({}, len(schedule._scheduled))]),
+            ("bot_schedule_fired_total", "counter", "定时消息触发次数", [({}, d.fired)]),
+            ("bot_checkin_queue", "gauge", "待写入的打卡数", [({}, checkin_writer.queue.qsize())]),
+            ("bot_checkin_dead_letters_total", "counter", "写不进数据库、已转存的打卡数", [({}, checkin_writer.dead_letters)]),
+        ]
+
+    @metrics.collector
+    def broadcasts():
+        runs = broadcaster.stats()
+        return [
+            ("bot_broadcast_sent", "gauge", "进行中的群发已成功的群数", [({"id": k}, v["sent"]) for k, v in runs.items()]),
+            ("bot_broadcast_failed", "gauge", "进行中的群发已失败的群数", [({"id": k}, v["failed"]) for k, v in runs.items()]),
+            ("bot_broadcast_total", "gauge", "进行中的群发目标群数", [({"id": k}, v["total"]) for k, v in runs.items()]),
+        ]